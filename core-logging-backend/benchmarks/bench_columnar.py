@@ -0,0 +1,45 @@
+"""Benchmark for the columnar (Parquet / Arrow) exports.
+
+Times each columnar export against the CSV export of the same intervals and
+compares the response sizes.
+
+    python benchmarks/bench_columnar.py --holes 2000 --runs 30 --intervals-per-run 4
+"""
+import argparse
+import os
+import tempfile
+
+from common import Timer, create_app, seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=30, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=4)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run)
+    client = app.test_client()
+    print(f"{counts['holes']} holes, {counts['intervals']} intervals")
+
+    for url in ('/api/export/csv?type=intervals',
+                '/api/export/columnar?type=intervals&format=parquet',
+                '/api/export/columnar?type=intervals&format=arrow',
+                '/api/export/columnar?type=runs&format=parquet'):
+        with Timer() as timer:
+            response = client.get(url)
+            body = response.get_data()
+            assert response.status_code == 200, response.get_data(as_text=True)
+        print(f"{url:<55} {timer.elapsed * 1000:9.1f} ms  {len(body) / 1e6:8.2f} MB")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
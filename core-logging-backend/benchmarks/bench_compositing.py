@@ -0,0 +1,50 @@
+"""Benchmark for length-weighted compositing.
+
+Times the composite CSV export for every hole (cold, then served from the
+per-hole cache) for each compositing method, and one hole through the API.
+
+    python benchmarks/bench_compositing.py --holes 3000 --runs 30 --intervals-per-run 4
+"""
+import argparse
+import os
+import tempfile
+
+from common import Timer, create_app, seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=3000)
+    parser.add_argument('--runs', type=int, default=30, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=4)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run)
+    client = app.test_client()
+    print(f"{counts['holes']} holes, {counts['intervals']} intervals")
+
+    for query in ('method=length&length=1', 'method=length&length=2', 'method=run', 'method=lithology'):
+        for label in ('cold', 'cached'):
+            with Timer() as timer:
+                response = client.get(f'/api/export/composites?{query}')
+                body = response.get_data()
+                assert response.status_code == 200
+            rows = body.count(b'\n') - 1
+            print(f"{'export ' + query + ' (' + label + ')':<45} {timer.elapsed * 1000:9.1f} ms  {rows} composites")
+
+    for label in ('cold', 'cached'):
+        with Timer() as timer:
+            response = client.get('/api/drill-holes/1/composites?method=length&length=0.5')
+            assert response.status_code == 200, response.get_data(as_text=True)
+        print(f"{'hole 1, 0.5 m (' + label + ')':<45} {timer.elapsed * 1000:9.1f} ms")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
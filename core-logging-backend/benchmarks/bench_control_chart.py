@@ -0,0 +1,66 @@
+"""Benchmark for the QA/QC control-chart engine.
+
+Seeds one CRM standard with ``--records`` insertions, then times the first
+(cold) chart computation, a warm call with nothing new, and a call after
+appending ``--append`` records, which only charts the new rows.
+
+    python benchmarks/bench_control_chart.py --records 200000 --append 100
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from common import Timer, create_app, seed
+from src.models.user import db, QAQCRecord
+
+
+def insert_standards(count, start_id):
+    rows = [{
+        'id': start_id + i,
+        'drill_hole_id': 1,
+        'record_type': 'standard',
+        'sample_id': 'CRM-BENCH',
+        'expected_value': 1.5,
+        'actual_value': random.gauss(1.5, 0.05),
+        'status': 'pass',
+    } for i in range(count)]
+    db.session.execute(QAQCRecord.__table__.insert(), rows)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--append', type=int, default=100)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    seed(app, 1, 1, 1)
+    client = app.test_client()
+    url = '/api/qaqc-records/control-chart?sample_id=CRM-BENCH&last=1000'
+
+    with app.app_context():
+        insert_standards(args.records, 1)
+
+        for label in ('cold', 'warm (no new records)'):
+            with Timer() as timer:
+                response = client.get(url)
+                assert response.status_code == 200, response.get_data(as_text=True)
+            print(f"{label:<28} {timer.elapsed * 1000:8.1f} ms")
+
+        insert_standards(args.append, args.records + 1)
+        with Timer() as timer:
+            response = client.get(url)
+        print(f"{f'+{args.append} appended':<28} {timer.elapsed * 1000:8.1f} ms")
+        print(f"charted {response.get_json()['summary']['count']} records")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark for the desurvey engine.
+
+Seeds holes with survey stations every ``--station-spacing`` metres, then
+times the interval CSV export with and without desurveyed midpoints, and
+cold versus cached calls of the per-hole desurvey API.
+
+    python benchmarks/bench_desurvey.py --holes 3000 --runs 10 --intervals-per-run 3
+"""
+import argparse
+import os
+import tempfile
+
+from common import Timer, create_app, seed
+from src.models.user import db, DownholeSurvey
+
+
+def insert_surveys(holes, total_depth, spacing):
+    rows = []
+    for hole_id in range(1, holes + 1):
+        depth = 0.0
+        while depth <= total_depth:
+            rows.append({
+                'drill_hole_id': hole_id,
+                'depth': depth,
+                'azimuth': (hole_id * 37 + depth * 0.2) % 360,
+                'dip': -60.0 + depth * 0.05,
+            })
+            depth += spacing
+    db.session.execute(DownholeSurvey.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=3000)
+    parser.add_argument('--runs', type=int, default=10, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=3)
+    parser.add_argument('--station-spacing', type=float, default=10.0)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run)
+    client = app.test_client()
+
+    with app.app_context():
+        stations = insert_surveys(args.holes, args.runs * 3.0, args.station_spacing)
+    print(f"{counts['holes']} holes, {counts['intervals']} intervals, {stations} survey stations")
+
+    for label, url in (('export', '/api/export/csv'),
+                       ('export + coordinates (cold)', '/api/export/csv?coordinates=true'),
+                       ('export + coordinates (warm)', '/api/export/csv?coordinates=true')):
+        with Timer() as timer:
+            response = client.get(url)
+            body = response.get_data()
+            assert response.status_code == 200
+        print(f"{label:<30} {timer.elapsed * 1000:9.1f} ms  {len(body) / 1e6:.1f} MB")
+
+    for label in ('desurvey hole 1 (cold)', 'desurvey hole 1 (cached)'):
+        with Timer() as timer:
+            response = client.get('/api/drill-holes/1/desurvey')
+            assert response.status_code == 200, response.get_data(as_text=True)
+        print(f"{label:<30} {timer.elapsed * 1000:9.1f} ms")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
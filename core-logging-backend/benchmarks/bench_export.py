@@ -0,0 +1,57 @@
+"""Benchmark the streaming CSV export endpoints.
+
+Reports rows/sec and peak RSS while consuming each export chunk by chunk, the
+way a browser download would. Peak RSS should stay roughly flat as
+``--intervals-per-run`` or ``--holes`` grows.
+
+    python benchmarks/bench_export.py --holes 200 --runs 100 --intervals-per-run 10
+"""
+import argparse
+import os
+import tempfile
+
+from common import Timer, create_app, peak_rss_mb, seed
+
+ENDPOINTS = [
+    ('csv', '/api/export/csv?type=intervals'),
+    ('leapfrog', '/api/export/leapfrog'),
+    ('analytics-csv', '/api/analytics/export-csv?type=intervals&format=csv'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=100, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=10)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run)
+    print(f"seeded {counts['holes']} holes, {counts['runs']} runs, {counts['intervals']} intervals")
+    print(f'baseline peak RSS: {peak_rss_mb():.1f} MiB')
+
+    client = app.test_client()
+    for name, url in ENDPOINTS:
+        with Timer() as timer:
+            response = client.get(url)
+            rows = -1  # header line
+            size = 0
+            for chunk in response.response:
+                chunk = chunk if isinstance(chunk, bytes) else chunk.encode()
+                rows += chunk.count(b'\n')
+                size += len(chunk)
+            response.close()
+        rate = rows / timer.elapsed if timer.elapsed else 0
+        print(f'{name:14s} {rows:>10d} rows  {size / 1e6:8.1f} MB  '
+              f'{timer.elapsed:7.2f} s  {rate:>10.0f} rows/s  peak RSS {peak_rss_mb():.1f} MiB')
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark for the export file cache.
+
+Times a full-project Leapfrog export built from the database (miss), served
+from the cached file (hit) and resumed with a Range request, then the cache
+counters.
+
+    python benchmarks/bench_export_cache.py --holes 3000 --runs 30 --intervals-per-run 4
+"""
+import argparse
+import os
+import tempfile
+
+from common import Timer, create_app, seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=3000)
+    parser.add_argument('--runs', type=int, default=30, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=4)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    app.config['EXPORT_CACHE_DISABLED'] = False
+    app.extensions['export_cache'].directory = os.path.join(tmpdir.name, 'exports')
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run)
+    client = app.test_client()
+    print(f"{counts['holes']} holes, {counts['intervals']} intervals")
+
+    size = 0
+    for label in ('miss', 'hit', 'hit'):
+        with Timer() as timer:
+            response = client.get('/api/export/leapfrog')
+            body = response.get_data()
+            assert response.status_code == 200, response.get_data(as_text=True)
+        size = len(body)
+        print(f"{'leapfrog (' + label + ')':<30} {timer.elapsed * 1000:9.1f} ms  {size / 1e6:.2f} MB  "
+              f"{response.headers.get('X-Export-Cache')}")
+
+    with Timer() as timer:
+        response = client.get('/api/export/leapfrog', headers={'Range': f'bytes={size // 2}-'})
+        body = response.get_data()
+        assert response.status_code == 206
+    print(f"{'leapfrog second half (range)':<30} {timer.elapsed * 1000:9.1f} ms  {len(body) / 1e6:.2f} MB")
+
+    print(client.get('/api/export-cache/stats').get_json())
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark for background export jobs.
+
+Submits a full interval export as a job, polls its progress until it
+finishes, then times the re-download and an identical resubmission (served
+from the finished file).
+
+    python benchmarks/bench_export_jobs.py --holes 3000 --runs 30 --intervals-per-run 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import Timer, create_app, seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=3000)
+    parser.add_argument('--runs', type=int, default=30, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=4)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    app.extensions['export_cache'].directory = os.path.join(tmpdir.name, 'exports')
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run)
+    client = app.test_client()
+    print(f"{counts['holes']} holes, {counts['intervals']} intervals")
+
+    with Timer() as timer:
+        response = client.post('/api/export/jobs', json={'type': 'intervals'})
+        assert response.status_code == 202, response.get_data(as_text=True)
+        job_id = response.get_json()['id']
+        while True:
+            job = client.get(f'/api/export/jobs/{job_id}').get_json()
+            if job['status'] not in ('queued', 'running'):
+                break
+            print(f"  {job['status']:<10} {job['rows_processed']:>9} / {job['total_rows'] or '?':<9} "
+                  f"progress {job['progress']}%  eta {job['eta_seconds']} s")
+            time.sleep(0.5)
+    assert job['status'] == 'completed', job
+    print(f"{'submit and build':<30} {timer.elapsed * 1000:9.1f} ms  {job['file_size'] / 1e6:.2f} MB")
+
+    with Timer() as timer:
+        body = client.get(f'/api/export/jobs/{job_id}/download').get_data()
+    print(f"{'download':<30} {timer.elapsed * 1000:9.1f} ms  {len(body) / 1e6:.2f} MB")
+
+    with Timer() as timer:
+        response = client.post('/api/export/jobs', json={'type': 'intervals'})
+        assert response.get_json()['id'] == job_id
+    print(f"{'identical resubmit':<30} {timer.elapsed * 1000:9.1f} ms  reused={response.get_json()['reused']}")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark for the interval consistency validator.
+
+Seeds a project, damages a fraction of its intervals (shifted into their
+neighbours or past the end of their run), then times loading the columns,
+the sort-and-sweep itself and a full project validation job, plus an inline
+bulk insert validated against the existing intervals of its holes.
+
+    python benchmarks/bench_interval_validator.py --holes 20000 --runs 20 --intervals-per-run 5
+"""
+import argparse
+import os
+import tempfile
+
+from common import Timer, create_app, seed
+from src.models.user import db, CoreInterval
+from src.services.interval_validator import IntervalSweep, create_validation_job, load_intervals, run_validation
+
+
+def damage(every):
+    """Shift every ``every``-th interval down by half its length"""
+    db.session.query(CoreInterval).filter(CoreInterval.id % every == 0).update(
+        {CoreInterval.from_depth: CoreInterval.from_depth + CoreInterval.interval_length / 2,
+         CoreInterval.to_depth: CoreInterval.to_depth + CoreInterval.interval_length / 2},
+        synchronize_session=False
+    )
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=20, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=5)
+    parser.add_argument('--damage-every', type=int, default=997, help='damage one interval in N')
+    parser.add_argument('--bulk-rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run, projects=1)
+    client = app.test_client()
+    print(f"{counts['holes']} holes, {counts['intervals']} intervals")
+
+    with app.app_context():
+        damage(args.damage_every)
+
+        with Timer() as timer:
+            columns = load_intervals()
+        print(f"{'load columns':<30} {timer.elapsed * 1000:9.1f} ms")
+
+        with Timer() as timer:
+            sweep = IntervalSweep(columns)
+            issues = sweep.issues()
+        print(f"{'sort + sweep':<30} {timer.elapsed * 1000:9.1f} ms  {sweep.counts()}")
+
+        with Timer() as timer:
+            job = run_validation(create_validation_job())
+        print(f"{'validation job':<30} {timer.elapsed * 1000:9.1f} ms  {len(issues)} issues stored")
+        assert job.status == 'completed'
+
+    # Append a run's worth of intervals below the last run of the first holes
+    length = 3.0 / args.intervals_per_run
+    rows = [{
+        'core_run_id': (hole + 1) * args.runs,
+        'from_depth': args.runs * 3.0 - length + (i % 2) * length / 2,
+        'to_depth': args.runs * 3.0 + (i % 2) * length / 2,
+    } for i, hole in enumerate(range(args.bulk_rows))]
+    for mode in ('off', 'warn'):
+        with Timer() as timer:
+            response = client.post('/api/core-intervals/bulk', json={'intervals': rows, 'validation': mode})
+            assert response.status_code == 201, response.get_data(as_text=True)
+        print(f"{'bulk insert, validation=' + mode:<30} {timer.elapsed * 1000:9.1f} ms  "
+              f"{response.get_json()['warning_count']} warnings")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
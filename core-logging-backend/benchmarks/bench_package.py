@@ -0,0 +1,50 @@
+"""Benchmark for the multi-table geology package export.
+
+Times the full package ZIP with one and with four table workers, and reports
+the size of each table. SQLite always builds the tables one at a time, so
+pass a MySQL ``--database-uri`` to see the parallel build.
+
+    python benchmarks/bench_package.py --holes 3000 --runs 30 --intervals-per-run 4
+"""
+import argparse
+import io
+import os
+import tempfile
+import zipfile
+
+from common import Timer, create_app, seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=3000)
+    parser.add_argument('--runs', type=int, default=30, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=4)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run)
+    client = app.test_client()
+    print(f"{counts['holes']} holes, {counts['intervals']} intervals")
+
+    body = b''
+    for workers in (1, 4):
+        app.config['PACKAGE_EXPORT_WORKERS'] = workers
+        with Timer() as timer:
+            response = client.get('/api/export/package')
+            body = response.get_data()
+            assert response.status_code == 200, response.get_data(as_text=True)
+        print(f"{'package, ' + str(workers) + ' worker(s)':<30} {timer.elapsed * 1000:9.1f} ms  {len(body) / 1e6:.2f} MB")
+
+    for info in zipfile.ZipFile(io.BytesIO(body)).infolist():
+        print(f"  {info.filename:<20} {info.file_size / 1e6:8.2f} MB  ({info.compress_size / 1e6:.2f} MB zipped)")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Regression benchmark for /analytics/project-summary.
+
+Seeds 1k holes and 1M intervals by default and times repeated calls. The
+endpoint is computed from grouped aggregates, so latency should track the
+number of projects and stay flat in memory as intervals grow.
+
+    python benchmarks/bench_project_summary.py --holes 1000 --runs 100 --intervals-per-run 10
+"""
+import argparse
+import os
+import statistics
+import tempfile
+
+from common import Timer, create_app, peak_rss_mb, seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=100, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=10)
+    parser.add_argument('--projects', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    with Timer() as seeding:
+        counts = seed(app, args.holes, args.runs, args.intervals_per_run, projects=args.projects)
+    print(f"seeded {counts['holes']} holes, {counts['runs']} runs, "
+          f"{counts['intervals']} intervals in {seeding.elapsed:.1f} s")
+    rss_before = peak_rss_mb()
+
+    client = app.test_client()
+    timings = []
+    for _ in range(args.repeat):
+        with Timer() as timer:
+            response = client.get('/api/analytics/project-summary')
+            assert response.status_code == 200, response.get_data(as_text=True)
+        timings.append(timer.elapsed)
+
+    body = response.get_json()
+    assert body['total_intervals'] == counts['intervals'], body['total_intervals']
+    print(f"project-summary: {len(body['projects'])} projects  "
+          f"median {statistics.median(timings) * 1000:.1f} ms  "
+          f"min {min(timings) * 1000:.1f} ms  "
+          f"peak RSS {peak_rss_mb():.1f} MiB (+{peak_rss_mb() - rss_before:.1f})")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
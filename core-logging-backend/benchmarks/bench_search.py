@@ -0,0 +1,72 @@
+"""Benchmark for full-text interval search.
+
+Seeds intervals with generated comments and ore mineral lists, builds the
+full-text index with ``migrate()``, then compares the ``LIKE '%x%'`` list
+filter with ranked and hole-filtered searches.
+
+    python benchmarks/bench_search.py --holes 5000 --runs 40 --intervals-per-run 5
+"""
+import argparse
+import os
+import tempfile
+
+from common import Timer, create_app, seed
+from src.models.user import db, CoreInterval
+from src.services.schema import migrate
+
+MINERALS = ['chalcopyrite', 'pyrite', 'bornite', 'molybdenite', 'sphalerite', 'galena', 'magnetite']
+TEXTURES = ['porphyritic', 'equigranular', 'brecciated', 'foliated', 'vesicular']
+
+
+def describe():
+    """Give every interval a comment, texture and ore minerals"""
+    for position, mineral in enumerate(MINERALS):
+        db.session.query(CoreInterval).filter(CoreInterval.id % len(MINERALS) == position).update({
+            CoreInterval.ore_minerals: mineral,
+            CoreInterval.texture: TEXTURES[position % len(TEXTURES)],
+            CoreInterval.comments: 'quartz vein ' + db.func.cast(CoreInterval.id % 1000, db.String) + ' ' + mineral,
+        }, synchronize_session=False)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=40, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run)
+    client = app.test_client()
+    print(f"{counts['holes']} holes, {counts['intervals']} intervals")
+
+    with app.app_context():
+        describe()
+        with Timer() as timer:
+            created = migrate()
+        print(f"{'build full-text index':<40} {timer.elapsed * 1000:9.1f} ms  {created['indexes']}")
+
+    for label, url in (
+        ('LIKE list filter', '/api/core-intervals?lithology=schist&limit=100'),
+        ('search common term', '/api/core-intervals/search?q=schist&limit=100'),
+        ('search two terms', '/api/core-intervals/search?q=bornite+vein&limit=100'),
+        ('search rare term', '/api/core-intervals/search?q=vein+417+galena&limit=100'),
+        ('search prefix', '/api/core-intervals/search?q=molyb*&limit=100'),
+        ('search in one hole', '/api/core-intervals/search?q=pyrite&drill_hole_id=42&limit=100'),
+        ('search by depth', '/api/core-intervals/search?q=porphyritic&sort=depth&limit=100'),
+    ):
+        with Timer() as timer:
+            response = client.get(url)
+            assert response.status_code == 200, response.get_data(as_text=True)
+        print(f"{label:<40} {timer.elapsed * 1000:9.1f} ms  {len(response.get_json())} rows")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Microbenchmark for list-response serialization.
+
+Compares the old path (hydrate ORM objects, ``to_dict()`` each, ``jsonify``)
+with the precompiled row serializer (column-only query, generated tuple ->
+dict function, orjson when installed) on the same 100k intervals, reporting
+rows/sec for each stage.
+
+    python benchmarks/bench_serializers.py --holes 100 --runs 100 --intervals-per-run 10
+"""
+import argparse
+import os
+import statistics
+import tempfile
+
+from flask import jsonify
+
+from common import Timer, create_app, seed
+from src.models.user import db, CoreInterval
+from src.services import serializers
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            result = fn()
+        timings.append(timer.elapsed)
+    return min(timings), statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=100, help='core runs per hole')
+    parser.add_argument('--intervals-per-run', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    counts = seed(app, args.holes, args.runs, args.intervals_per_run)
+    rows = counts['intervals']
+    print(f"{rows} intervals, JSON backend: {'orjson' if serializers.orjson else 'json'}")
+
+    columns, serialize = serializers.model_serializer(CoreInterval)
+
+    def orm_to_dict():
+        db.session.expunge_all()
+        return [obj.to_dict() for obj in CoreInterval.query.order_by(CoreInterval.id).all()]
+
+    def row_serializer():
+        query = db.session.query(*columns).order_by(CoreInterval.id)
+        return [serialize(row) for row in query.all()]
+
+    with app.test_request_context():
+        results = {}
+        for name, fn in [('ORM + to_dict()', orm_to_dict), ('Row + compiled serializer', row_serializer)]:
+            best, median, items = best_of(args.repeat, fn)
+            results[name] = items
+            print(f"fetch+dict  {name:<28} {rows / best:>12,.0f} rows/s  (median {median * 1000:.0f} ms)")
+
+        items = results['Row + compiled serializer']
+        assert items == results['ORM + to_dict()'], 'serializer output differs from to_dict()'
+
+        for name, fn in [('jsonify', lambda: jsonify(items).get_data()),
+                         ('serializers.json_response', lambda: serializers.json_response(items).get_data())]:
+            best, median, _ = best_of(args.repeat, fn)
+            print(f"encode      {name:<28} {rows / best:>12,.0f} rows/s  (median {median * 1000:.0f} ms)")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark for the collar spatial index.
+
+Seeds ``--holes`` collars on a regular grid and times the index build and
+bbox, radius and k-nearest queries through the API, plus a query right
+after a hole is created (applied to the index in place).
+
+    python benchmarks/bench_spatial.py --holes 50000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+
+from common import Timer, create_app, seed
+
+QUERIES = [
+    ('bbox 700 x 1000 m', '/api/drill-holes/spatial/bbox?min_x=500500&min_y=7001000&max_x=501200&max_y=7002000'),
+    ('radius 120 m', '/api/drill-holes/spatial/radius?x=501000&y=7005000&radius=120'),
+    ('nearest k=10', '/api/drill-holes/spatial/nearest?x=500110&y=7000210&k=10'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--holes', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    app = create_app(database_uri)
+    seed(app, args.holes, 0, 0)
+    client = app.test_client()
+
+    with Timer() as timer:
+        assert client.get(QUERIES[0][1]).status_code == 200
+    print(f"{'index build + first query':<28} {timer.elapsed * 1000:8.1f} ms")
+
+    for label, url in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            with Timer() as timer:
+                response = client.get(url)
+            timings.append(timer.elapsed)
+        print(f"{label:<28} {statistics.median(timings) * 1000:8.2f} ms  ({len(response.get_json())} holes)")
+
+    client.post('/api/drill-holes', json={
+        'hole_id': 'BENCH-NEW', 'project_name': 'Bench', 'location_x': 500110.0, 'location_y': 7000210.0
+    })
+    with Timer() as timer:
+        response = client.get(QUERIES[2][1])
+    assert response.get_json()[0]['hole_id'] == 'BENCH-NEW'
+    print(f"{'nearest after create':<28} {timer.elapsed * 1000:8.2f} ms")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Worker startup benchmark: import, app construction and first request.
+
+Each sample runs in a fresh interpreter, like a newly forked worker, and
+reports the time to import ``src.main``, build the app with ``create_app()``,
+and serve the first liveness probe and the first database-backed request.
+The schema is migrated once up front; workers themselves never touch it.
+
+    python benchmarks/bench_startup.py --samples 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = '''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, %r)
+import src.main
+imported = time.perf_counter()
+app = src.main.create_app()
+created = time.perf_counter()
+client = app.test_client()
+assert client.get('/api/health/live').status_code == 200
+live = time.perf_counter()
+assert client.get('/api/drill-holes?limit=1').status_code == 200
+first = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_live': live - created,
+    'first_db_request': first - live,
+    'total': first - start,
+}))
+''' % ROOT
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='defaults to a temporary SQLite file')
+    parser.add_argument('--samples', type=int, default=10)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    create_app(database_uri)  # schema in place before any worker starts
+
+    env = dict(os.environ, DATABASE_URL=database_uri)
+    samples = []
+    for _ in range(args.samples):
+        output = subprocess.run([sys.executable, '-c', WORKER], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{args.samples} cold starts against {database_uri.split('://')[0]}")
+    for stage in ('import', 'create_app', 'first_live', 'first_db_request', 'total'):
+        values = [sample[stage] * 1000 for sample in samples]
+        print(f"{stage:<18} median {statistics.median(values):8.1f} ms  max {max(values):8.1f} ms")
+
+    tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Fail when an endpoint's SQL statement count grows with result size.
+
+Seeds a small and a large dataset, calls each endpoint against both while
+counting statements, and exits non-zero if any count differs. Run it in CI:
+
+    python benchmarks/check_query_counts.py
+"""
+import os
+import sys
+import tempfile
+
+from common import create_app, seed
+from src.models.user import db
+from src.services.query_counter import QueryCounter, QueryCountError, assert_constant_queries
+
+ENDPOINTS = [
+    ('GET', '/api/drill-holes'),
+    ('GET', '/api/drill-holes/1/summary'),
+    ('GET', '/api/core-runs?drill_hole_id=1'),
+    ('GET', '/api/core-intervals'),
+    ('GET', '/api/core-intervals?core_run_id=1'),
+    ('GET', '/api/core-trays'),
+    ('GET', '/api/qaqc-records'),
+    ('GET', '/api/qaqc-records/statistics'),
+    ('GET', '/api/analytics/summary'),
+    ('GET', '/api/analytics/recovery-trends'),
+    ('GET', '/api/analytics/recovery-by-depth'),
+    ('GET', '/api/analytics/lithology-distribution'),
+    ('GET', '/api/analytics/project-summary'),
+    ('GET', '/api/analytics/export-csv'),
+    ('GET', '/api/export/csv'),
+    ('GET', '/api/export/csv?type=drill_holes'),
+    ('GET', '/api/export/leapfrog'),
+    ('GET', '/api/export/qaqc'),
+    ('DELETE', '/api/drill-holes/1'),
+]
+
+SIZES = {
+    'small': dict(holes=2, runs_per_hole=2, intervals_per_run=2),
+    'large': dict(holes=20, runs_per_hole=20, intervals_per_run=10),
+}
+
+
+def count_statements(size, tmpdir):
+    app = create_app(f"sqlite:///{os.path.join(tmpdir, size + '.db')}")
+    seed(app, **SIZES[size])
+    client = app.test_client()
+
+    counters = {}
+    for method, url in ENDPOINTS:
+        with app.app_context():
+            engine = db.engine
+        with QueryCounter(engine) as counter:
+            response = client.open(url, method=method)
+            response.get_data()  # drain streamed bodies inside the counter
+        if response.status_code >= 400:
+            raise SystemExit(f'{method} {url} returned {response.status_code}: {response.get_data(as_text=True)}')
+        counters[(method, url)] = counter
+    return counters
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        small = count_statements('small', tmpdir)
+        large = count_statements('large', tmpdir)
+
+    failures = 0
+    for method, url in ENDPOINTS:
+        key = (method, url)
+        try:
+            assert_constant_queries(f'{method} {url}', small[key], large[key])
+            print(f'ok    {small[key].count:>3d} statements  {method} {url}')
+        except QueryCountError as e:
+            failures += 1
+            print(f'FAIL  {e}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
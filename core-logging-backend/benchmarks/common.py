@@ -0,0 +1,123 @@
+"""Shared fixtures for the benchmark scripts.
+
+Benchmarks build a throwaway database (SQLite by default, or any URI passed
+with ``--database-uri``), seed it with synthetic drill holes, runs and
+intervals using set-based inserts, and drive the blueprints through Flask's
+test client.
+"""
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import create_app as create_main_app
+from src.models.user import db, DrillHole, CoreRun, CoreInterval
+from src.services.rollups import rebuild_statistics
+
+LITHOLOGIES = [('Granite', 'GR'), ('Basalt', 'BA'), ('Andesite', 'AN'), ('Diorite', 'DI'), ('Schist', 'SC')]
+ALTERATIONS = [None, 'Sericite', 'Chlorite', 'Potassic', 'Silica']
+
+
+def create_app(database_uri):
+    """Build the application against the given database, starting empty"""
+    app = create_main_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        # Measure the queries themselves, not the response or export caches
+        'RESPONSE_CACHE_DISABLED': True,
+        'EXPORT_CACHE_DISABLED': True,
+    })
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def seed(app, holes, runs_per_hole, intervals_per_run, projects=5, batch_size=10000):
+    """Insert synthetic data with executemany batches, returning row counts"""
+    with app.app_context():
+        hole_rows = [{
+            'id': h + 1,
+            'hole_id': f'DH{h + 1:05d}',
+            'project_name': f'Project {h % projects}',
+            'location_x': 500000.0 + (h % 100) * 25.0,
+            'location_y': 7000000.0 + (h // 100) * 25.0,
+            'elevation': 1200.0,
+            'azimuth': (h * 37) % 360,
+            'dip': -60.0,
+            'total_depth': runs_per_hole * 3.0,
+        } for h in range(holes)]
+        db.session.execute(DrillHole.__table__.insert(), hole_rows)
+
+        run_rows = []
+        run_id = 0
+        for h in range(holes):
+            for r in range(runs_per_hole):
+                run_id += 1
+                recovered = 2.4 + (run_id % 7) * 0.08
+                rqd = 1.2 + (run_id % 5) * 0.3
+                run_rows.append({
+                    'id': run_id,
+                    'drill_hole_id': h + 1,
+                    'run_number': r + 1,
+                    'from_depth': r * 3.0,
+                    'to_depth': r * 3.0 + 3.0,
+                    'run_length': 3.0,
+                    'core_recovered_length': recovered,
+                    'total_core_recovery': round(recovered / 3.0 * 100, 2),
+                    'rqd_length': rqd,
+                    'rqd_percentage': round(rqd / 3.0 * 100, 2),
+                })
+        for start in range(0, len(run_rows), batch_size):
+            db.session.execute(CoreRun.__table__.insert(), run_rows[start:start + batch_size])
+
+        interval_length = 3.0 / max(intervals_per_run, 1)
+        interval_count = 0
+        batch = []
+        for run in run_rows:
+            for i in range(intervals_per_run):
+                interval_count += 1
+                lithology, code = LITHOLOGIES[(run['id'] + i) % len(LITHOLOGIES)]
+                from_depth = run['from_depth'] + i * interval_length
+                batch.append({
+                    'core_run_id': run['id'],
+                    'from_depth': from_depth,
+                    'to_depth': from_depth + interval_length,
+                    'interval_length': interval_length,
+                    'lithology': lithology,
+                    'lithology_code': code,
+                    'alteration_type': ALTERATIONS[interval_count % len(ALTERATIONS)],
+                    'fracture_frequency': interval_count % 9,
+                    'recovery_percentage': 80.0 + interval_count % 20,
+                    'rqd_contribution': interval_length * 0.5,
+                    'comments': 'synthetic',
+                })
+                if len(batch) >= batch_size:
+                    db.session.execute(CoreInterval.__table__.insert(), batch)
+                    batch = []
+        if batch:
+            db.session.execute(CoreInterval.__table__.insert(), batch)
+
+        db.session.commit()
+        rebuild_statistics()
+    return {'holes': holes, 'runs': len(run_rows), 'intervals': interval_count}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and KiB on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Timer:
+    """Context manager recording wall-clock seconds in ``elapsed``"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
@@ -0,0 +1,32 @@
+"""Gunicorn settings for ``gunicorn -c gunicorn.conf.py src.wsgi:app``.
+
+Each worker process owns its own SQLAlchemy pool, so the database sees up to
+``workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)`` connections. With
+``threads > 1`` keep ``DB_POOL_SIZE`` at least equal to ``threads``.
+"""
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5001')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))  # long CSV exports stream
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+preload_app = os.environ.get('GUNICORN_PRELOAD', '').lower() in ('1', 'true', 'yes', 'on')
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Drop pooled connections inherited from the master when preloading"""
+    wsgi = sys.modules.get('src.wsgi')
+    if wsgi is not None:
+        from src.models.user import db
+        with wsgi.app.app_context():
+            db.engine.dispose(close=False)
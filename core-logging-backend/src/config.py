@@ -0,0 +1,99 @@
+"""Environment-driven application settings.
+
+Every setting can be overridden with an environment variable of the same
+name (``DATABASE_URL`` for the database URI). ``DATABASE_URL`` and
+``SECRET_KEY`` are required in production; without them a local SQLite
+database and a development-only key are used. Connection pool settings feed
+``SQLALCHEMY_ENGINE_OPTIONS``; size them so that
+``workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)`` stays below MySQL's
+``max_connections``, and keep ``DB_POOL_RECYCLE`` under ``wait_timeout`` and
+any proxy idle timeout so that stale connections are never handed out.
+"""
+import os
+
+# Local development fallbacks, used when DATABASE_URL / SECRET_KEY are not
+# set. The production entry point (src.wsgi) refuses to start without them.
+DEFAULT_DATABASE_URI = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'app.db')
+DEFAULT_SECRET_KEY = 'dev-only-insecure-secret-key'
+PRODUCTION_SETTINGS = ('DATABASE_URL', 'SECRET_KEY')
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+def engine_options(database_uri, pool_size, max_overflow, pool_recycle, pool_timeout, pool_pre_ping):
+    """SQLAlchemy engine options for the given database"""
+    options = {'pool_pre_ping': pool_pre_ping}
+    if database_uri.startswith('sqlite'):
+        # Sizing targets the MySQL server; SQLite keeps SQLAlchemy's default pool
+        return options
+    options.update(
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,
+        pool_timeout=pool_timeout
+    )
+    return options
+
+
+def missing_production_settings():
+    """Names of the PRODUCTION_SETTINGS environment variables that are unset"""
+    return [name for name in PRODUCTION_SETTINGS if not os.environ.get(name)]
+
+
+def load_config():
+    """Settings for create_app(), read from the environment"""
+    database_uri = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URI)
+    config = {
+        'SECRET_KEY': os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY),
+        'DEBUG': env_bool('FLASK_DEBUG'),
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_ECHO': env_bool('SQLALCHEMY_ECHO'),
+        'DB_POOL_SIZE': env_int('DB_POOL_SIZE', 10),
+        'DB_MAX_OVERFLOW': env_int('DB_MAX_OVERFLOW', 20),
+        'DB_POOL_RECYCLE': env_int('DB_POOL_RECYCLE', 1800),  # seconds
+        'DB_POOL_TIMEOUT': env_int('DB_POOL_TIMEOUT', 30),  # seconds
+        'DB_POOL_PRE_PING': env_bool('DB_POOL_PRE_PING', True),
+        # Readiness fails once this fraction of pool capacity is checked out
+        'READINESS_MAX_POOL_SATURATION': env_float('READINESS_MAX_POOL_SATURATION', 1.0),
+        'RESPONSE_CACHE_DISABLED': env_bool('RESPONSE_CACHE_DISABLED'),
+        'RESPONSE_CACHE_TTL': env_int('RESPONSE_CACHE_TTL', 300),
+        'RESPONSE_CACHE_MAX_ENTRIES': env_int('RESPONSE_CACHE_MAX_ENTRIES', 512),
+        # Export file cache, <instance folder>/exports when unset; every worker
+        # of a host must see the same directory
+        'EXPORT_DIR': os.environ.get('EXPORT_DIR'),
+        'EXPORT_CACHE_MAX_BYTES': env_int('EXPORT_CACHE_MAX_BYTES', 2 * 1024 ** 3),
+        'EXPORT_CACHE_DISABLED': env_bool('EXPORT_CACHE_DISABLED'),
+        'EXPORT_WORKERS': env_int('EXPORT_WORKERS', 2),  # background export threads per process
+        'EXPORT_JOB_STALE_SECONDS': env_int('EXPORT_JOB_STALE_SECONDS', 1800),
+        'PACKAGE_EXPORT_WORKERS': env_int('PACKAGE_EXPORT_WORKERS', 4),  # tables built in parallel per package
+    }
+    return config
+
+
+def apply_engine_options(config):
+    """Fill SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings"""
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(
+        config['SQLALCHEMY_DATABASE_URI'],
+        pool_size=config['DB_POOL_SIZE'],
+        max_overflow=config['DB_MAX_OVERFLOW'],
+        pool_recycle=config['DB_POOL_RECYCLE'],
+        pool_timeout=config['DB_POOL_TIMEOUT'],
+        pool_pre_ping=config['DB_POOL_PRE_PING']
+    ))
+    return config
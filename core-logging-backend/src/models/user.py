@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import json
 
 db = SQLAlchemy()
 
@@ -63,6 +64,10 @@ class DrillHole(db.Model):
         }
 
 class CoreRun(db.Model):
+    __table_args__ = (
+        db.Index('ix_core_run_hole_from_depth', 'drill_hole_id', 'from_depth'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     drill_hole_id = db.Column(db.Integer, db.ForeignKey('drill_hole.id'), nullable=False)
     run_number = db.Column(db.Integer, nullable=False)
@@ -104,13 +109,17 @@ class CoreRun(db.Model):
         }
 
 class CoreTray(db.Model):
+    __table_args__ = (
+        db.Index('ix_core_tray_hole_from_depth', 'drill_hole_id', 'from_depth'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     tray_id = db.Column(db.String(50), unique=True, nullable=False)
     drill_hole_id = db.Column(db.Integer, db.ForeignKey('drill_hole.id'), nullable=False)
     from_depth = db.Column(db.Float, nullable=False)
     to_depth = db.Column(db.Float, nullable=False)
-    barcode = db.Column(db.String(100))
-    rfid_tag = db.Column(db.String(100))
+    barcode = db.Column(db.String(100), index=True)
+    rfid_tag = db.Column(db.String(100), index=True)
     photo_path = db.Column(db.String(255))
     location = db.Column(db.String(100))  
     status = db.Column(db.String(50), default='active')  
@@ -136,7 +145,39 @@ class CoreTray(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class DownholeSurvey(db.Model):
+    """Downhole survey station: hole orientation measured at a depth"""
+    __tablename__ = 'downhole_survey'
+    __table_args__ = (
+        db.UniqueConstraint('drill_hole_id', 'depth', name='uq_downhole_survey_hole_depth'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    drill_hole_id = db.Column(db.Integer, db.ForeignKey('drill_hole.id', ondelete='CASCADE'), nullable=False)
+    depth = db.Column(db.Float, nullable=False)
+    azimuth = db.Column(db.Float)
+    dip = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DownholeSurvey {self.drill_hole_id}@{self.depth}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'drill_hole_id': self.drill_hole_id,
+            'depth': self.depth,
+            'azimuth': self.azimuth,
+            'dip': self.dip,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 class CoreInterval(db.Model):
+    __table_args__ = (
+        db.Index('ix_core_interval_run_from_depth', 'core_run_id', 'from_depth'),
+        db.Index('ix_core_interval_from_depth_id', 'from_depth', 'id'),  # Unfiltered keyset pages
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     core_run_id = db.Column(db.Integer, db.ForeignKey('core_run.id'), nullable=False)
     from_depth = db.Column(db.Float, nullable=False)
@@ -222,6 +263,12 @@ class CoreInterval(db.Model):
         }
 
 class QAQCRecord(db.Model):
+    __table_args__ = (
+        db.Index('ix_qaqc_record_hole_status_type', 'drill_hole_id', 'status', 'record_type'),
+        db.Index('ix_qaqc_record_created_at_id', 'created_at', 'id'),  # Newest-first keyset pages
+        db.Index('ix_qaqc_record_standard', 'record_type', 'sample_id', 'id'),  # Control chart series
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     drill_hole_id = db.Column(db.Integer, db.ForeignKey('drill_hole.id'), nullable=False)
     record_type = db.Column(db.String(50), nullable=False)  
@@ -309,3 +356,221 @@ class QAQCItem(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+
+
+class DrillHoleStats(db.Model):
+    """Running per-hole totals maintained by src.services.rollups"""
+    __tablename__ = 'drill_hole_stats'
+
+    drill_hole_id = db.Column(db.Integer, db.ForeignKey('drill_hole.id', ondelete='CASCADE'), primary_key=True)
+    run_count = db.Column(db.Integer, nullable=False, default=0)
+    interval_count = db.Column(db.Integer, nullable=False, default=0)
+    run_length_sum = db.Column(db.Float, nullable=False, default=0.0)
+    core_length_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of core_recovered_length
+    recovery_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of total_core_recovery
+    rqd_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of rqd_percentage
+    min_recovery = db.Column(db.Float)
+    max_recovery = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DrillHoleStats {self.drill_hole_id}>'
+
+    def to_dict(self):
+        return {
+            'drill_hole_id': self.drill_hole_id,
+            'run_count': self.run_count,
+            'interval_count': self.interval_count,
+            'run_length_sum': self.run_length_sum,
+            'core_length_sum': self.core_length_sum,
+            'avg_recovery': self.recovery_sum / self.run_count if self.run_count else 0,
+            'avg_rqd': self.rqd_sum / self.run_count if self.run_count else 0,
+            'min_recovery': self.min_recovery,
+            'max_recovery': self.max_recovery,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ProjectStats(db.Model):
+    """Running per-project totals maintained by src.services.rollups"""
+    __tablename__ = 'project_stats'
+
+    project_name = db.Column(db.String(100), primary_key=True)
+    hole_count = db.Column(db.Integer, nullable=False, default=0)
+    total_depth_sum = db.Column(db.Float, nullable=False, default=0.0)
+    run_count = db.Column(db.Integer, nullable=False, default=0)
+    interval_count = db.Column(db.Integer, nullable=False, default=0)
+    run_length_sum = db.Column(db.Float, nullable=False, default=0.0)
+    core_length_sum = db.Column(db.Float, nullable=False, default=0.0)
+    recovery_sum = db.Column(db.Float, nullable=False, default=0.0)
+    rqd_sum = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ProjectStats {self.project_name}>'
+
+    def to_dict(self):
+        return {
+            'project_name': self.project_name,
+            'hole_count': self.hole_count,
+            'total_depth_sum': self.total_depth_sum,
+            'run_count': self.run_count,
+            'interval_count': self.interval_count,
+            'run_length_sum': self.run_length_sum,
+            'core_length_sum': self.core_length_sum,
+            'avg_recovery': self.recovery_sum / self.run_count if self.run_count else 0,
+            'avg_rqd': self.rqd_sum / self.run_count if self.run_count else 0,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ImportJob(db.Model):
+    """Checkpoint for a batched CSV import so a failed upload can resume"""
+    __tablename__ = 'import_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    import_type = db.Column(db.String(50), nullable=False)  # intervals, drill_holes
+    filename = db.Column(db.String(255))
+    status = db.Column(db.String(30), default='running')  # running, completed, failed
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)  # Data rows committed so far
+    imported_count = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text)  # JSON list, capped
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.import_type}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'import_type': self.import_type,
+            'filename': self.filename,
+            'status': self.status,
+            'rows_processed': self.rows_processed,
+            'imported_count': self.imported_count,
+            'error_count': self.error_count,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ExportJob(db.Model):
+    """Export built in the background into a file that can be downloaded again"""
+    __tablename__ = 'export_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    export_type = db.Column(db.String(50), nullable=False)  # intervals, drill_holes, leapfrog, qaqc
+    params = db.Column(db.Text)  # JSON filters
+    request_key = db.Column(db.String(64), nullable=False, index=True)  # Hash of type and params
+    # request_key while queued or running, NULL once finished: at most one active job per request
+    active_key = db.Column(db.String(64), index=True, unique=True)
+    data_versions = db.Column(db.String(255))  # Versions of the source tables the file was built from
+    status = db.Column(db.String(30), default='queued')  # queued, running, completed, failed
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    total_rows = db.Column(db.Integer)
+    filename = db.Column(db.String(255))
+    file_path = db.Column(db.String(512))
+    file_size = db.Column(db.BigInteger)
+    last_error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.export_type}>'
+
+    def eta_seconds(self, rows_processed=None):
+        """Seconds left at the rate seen so far, or None before any progress"""
+        rows_processed = rows_processed or self.rows_processed
+        if self.status != 'running' or not self.started_at or not self.total_rows or not rows_processed:
+            return None
+        elapsed = (datetime.utcnow() - self.started_at).total_seconds()
+        remaining = max(self.total_rows - rows_processed, 0)
+        return round(elapsed * remaining / rows_processed, 1)
+
+    def to_dict(self, rows_processed=None):
+        """``rows_processed`` overrides the stored count with a fresher one"""
+        rows_processed = max(rows_processed or 0, self.rows_processed or 0)
+        progress = None
+        if self.status == 'completed':
+            progress = 100.0
+        elif self.total_rows:
+            progress = round(min(rows_processed / self.total_rows, 1.0) * 100, 1)
+        return {
+            'id': self.id,
+            'export_type': self.export_type,
+            'params': json.loads(self.params) if self.params else {},
+            'status': self.status,
+            'rows_processed': rows_processed,
+            'total_rows': self.total_rows,
+            'progress': progress,
+            'eta_seconds': self.eta_seconds(rows_processed),
+            'filename': self.filename,
+            'file_size': self.file_size,
+            'last_error': self.last_error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ValidationJob(db.Model):
+    """Report of a project-wide interval consistency check"""
+    __tablename__ = 'validation_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_name = db.Column(db.String(100))  # None checks every project
+    status = db.Column(db.String(30), default='running')  # running, completed, failed
+    interval_count = db.Column(db.Integer, nullable=False, default=0)
+    hole_count = db.Column(db.Integer, nullable=False, default=0)
+    overlap_count = db.Column(db.Integer, nullable=False, default=0)
+    gap_count = db.Column(db.Integer, nullable=False, default=0)
+    out_of_run_count = db.Column(db.Integer, nullable=False, default=0)
+    invalid_depth_count = db.Column(db.Integer, nullable=False, default=0)
+    issues = db.Column(db.Text)  # JSON list, capped
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ValidationJob {self.id} {self.project_name}>'
+
+    def to_dict(self, include_issues=True):
+        result = {
+            'id': self.id,
+            'project_name': self.project_name,
+            'status': self.status,
+            'interval_count': self.interval_count,
+            'hole_count': self.hole_count,
+            'overlap_count': self.overlap_count,
+            'gap_count': self.gap_count,
+            'out_of_run_count': self.out_of_run_count,
+            'invalid_depth_count': self.invalid_depth_count,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_issues:
+            result['issues'] = json.loads(self.issues) if self.issues else []
+        return result
+
+class DataVersion(db.Model):
+    """Per-table version counter, bumped in every transaction that writes the table"""
+    __tablename__ = 'data_version'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DataVersion {self.table_name}={self.version}>'
+
+    def to_dict(self):
+        return {
+            'table_name': self.table_name,
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
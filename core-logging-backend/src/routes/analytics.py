@@ -1,105 +1,187 @@
 from flask import Blueprint, jsonify, request
-from src.models.user import DrillHole, CoreRun, CoreInterval, db
-from sqlalchemy import func
-import csv
-import io
+from src.models.user import DrillHole, CoreRun, CoreInterval, DrillHoleStats, ProjectStats, db
+from src.services.cache import response_cache
+from src.services.data_versions import conditional_get
+from src.services.streaming import (
+    csv_response, export_filename, interval_export_query, iter_csv, iter_query
+)
+from sqlalchemy import func, cast, or_, Integer
 
 analytics_bp = Blueprint('analytics', __name__)
 
 @analytics_bp.route('/analytics/recovery-trends', methods=['GET'])
+@conditional_get(tables=['drill_hole', 'core_run', 'drill_hole_stats'])
+@response_cache.cached(tables=['drill_hole', 'core_run', 'drill_hole_stats'])
 def get_recovery_trends():
     """Get core recovery trends"""
     drill_hole_id = request.args.get('drill_hole_id', type=int)
     project_name = request.args.get('project_name')
     
+    # Per-hole figures are read from the maintained rollup rows
     query = db.session.query(
-        CoreRun.drill_hole_id,
+        DrillHoleStats.drill_hole_id,
         DrillHole.hole_id,
         DrillHole.project_name,
-        func.avg(CoreRun.total_core_recovery).label('avg_recovery'),
-        func.avg(CoreRun.rqd_percentage).label('avg_rqd'),
-        func.min(CoreRun.total_core_recovery).label('min_recovery'),
-        func.max(CoreRun.total_core_recovery).label('max_recovery'),
-        func.count(CoreRun.id).label('total_runs')
-    ).join(DrillHole, CoreRun.drill_hole_id == DrillHole.id)
+        DrillHoleStats.recovery_sum,
+        DrillHoleStats.rqd_sum,
+        DrillHoleStats.min_recovery,
+        DrillHoleStats.max_recovery,
+        DrillHoleStats.run_count
+    ).join(DrillHole, DrillHoleStats.drill_hole_id == DrillHole.id).filter(DrillHoleStats.run_count > 0)
     
     if drill_hole_id:
-        query = query.filter(CoreRun.drill_hole_id == drill_hole_id)
+        query = query.filter(DrillHoleStats.drill_hole_id == drill_hole_id)
     if project_name:
         query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
     
-    results = query.group_by(CoreRun.drill_hole_id, DrillHole.hole_id, DrillHole.project_name).all()
+    results = query.order_by(DrillHoleStats.drill_hole_id).all()
     
     trends = []
     for result in results:
+        avg_recovery = result.recovery_sum / result.run_count
+        avg_rqd = result.rqd_sum / result.run_count
         trends.append({
             'drill_hole_id': result.drill_hole_id,
             'hole_id': result.hole_id,
             'project_name': result.project_name,
-            'avg_recovery': round(result.avg_recovery, 2) if result.avg_recovery else 0,
-            'avg_rqd': round(result.avg_rqd, 2) if result.avg_rqd else 0,
+            'avg_recovery': round(avg_recovery, 2) if avg_recovery else 0,
+            'avg_rqd': round(avg_rqd, 2) if avg_rqd else 0,
             'min_recovery': round(result.min_recovery, 2) if result.min_recovery else 0,
             'max_recovery': round(result.max_recovery, 2) if result.max_recovery else 0,
-            'total_runs': result.total_runs
+            'total_runs': result.run_count
         })
     
     return jsonify(trends)
 
+def _floor(expression):
+    """SQL floor() of a non-negative expression"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # SQLite has no floor() without the math extension; the values are
+        # non-negative so truncating the cast is equivalent
+        return cast(expression, Integer)
+    return func.floor(expression)
+
+def _depth_bin(column, interval_size):
+    """SQL expression for the zero-based depth bucket of a column"""
+    return _floor(column / interval_size)
+
+def _bucket_percentiles(depth_bin, fractions, drill_hole_id=None):
+    """{bucket: {fraction: value}} of run recovery, ranked in the database.
+
+    Each run is numbered within its bucket by recovery (``ROW_NUMBER``) next
+    to the bucket size (``COUNT``), and only the one or two ranks each
+    percentile interpolates between are returned, so memory is bounded by
+    buckets x percentiles rather than by the number of runs.
+    """
+    ranked = db.session.query(
+        depth_bin,
+        CoreRun.total_core_recovery.label('recovery'),
+        func.row_number().over(partition_by=depth_bin, order_by=CoreRun.total_core_recovery).label('rank'),
+        func.count().over(partition_by=depth_bin).label('size')
+    )
+    if drill_hole_id:
+        ranked = ranked.filter(CoreRun.drill_hole_id == drill_hole_id)
+    ranked = ranked.subquery()
+
+    wanted = []
+    for fraction in fractions:
+        lower = _floor((ranked.c.size - 1) * fraction) + 1  # 1-based rank
+        wanted += [ranked.c.rank == lower, ranked.c.rank == lower + 1]
+    rows = db.session.query(ranked.c.depth_bin, ranked.c.rank, ranked.c.size, ranked.c.recovery).filter(
+        or_(*wanted)
+    )
+
+    ranks = {}
+    for bucket, rank, size, recovery in rows:
+        ranks.setdefault(int(bucket), (size, {}))[1][rank] = recovery
+
+    percentiles = {}
+    for bucket, (size, values) in ranks.items():
+        percentiles[bucket] = {}
+        for fraction in fractions:
+            position = (size - 1) * fraction
+            lower = int(position)
+            upper = min(lower + 1, size - 1)
+            low_value, high_value = values[lower + 1], values[upper + 1]
+            percentiles[bucket][fraction] = low_value + (high_value - low_value) * (position - lower)
+    return percentiles
+
 @analytics_bp.route('/analytics/recovery-by-depth', methods=['GET'])
+@conditional_get(tables=['core_run'])
+@response_cache.cached(tables=['core_run'])
 def get_recovery_by_depth():
     """Get recovery trends by depth intervals"""
     drill_hole_id = request.args.get('drill_hole_id', type=int)
     interval_size = request.args.get('interval_size', default=50, type=int)  # Default 50m intervals
+    weighted = request.args.get('weighted', 'false').lower() == 'true'  # Weight by run_length
+    percentiles = request.args.get('percentiles')  # e.g. "10,50,90"
+    
+    if interval_size <= 0:
+        return jsonify({'error': 'interval_size must be positive'}), 400
     
-    query = CoreRun.query.join(DrillHole)
+    try:
+        percentile_list = [float(p) for p in percentiles.split(',')] if percentiles else []
+    except ValueError:
+        return jsonify({'error': 'percentiles must be a comma-separated list of numbers'}), 400
+    if any(p < 0 or p > 100 for p in percentile_list):
+        return jsonify({'error': 'percentiles must be between 0 and 100'}), 400
+    
+    depth_bin = _depth_bin(CoreRun.from_depth, interval_size).label('depth_bin')
+    
+    if weighted:
+        avg_recovery = (func.sum(CoreRun.total_core_recovery * CoreRun.run_length) /
+                        func.nullif(func.sum(CoreRun.run_length), 0))
+        avg_rqd = (func.sum(CoreRun.rqd_percentage * CoreRun.run_length) /
+                   func.nullif(func.sum(CoreRun.run_length), 0))
+    else:
+        avg_recovery = func.avg(CoreRun.total_core_recovery)
+        avg_rqd = func.avg(CoreRun.rqd_percentage)
+    
+    query = db.session.query(
+        depth_bin,
+        avg_recovery.label('avg_recovery'),
+        avg_rqd.label('avg_rqd'),
+        func.count(CoreRun.id).label('total_runs'),
+        func.sum(CoreRun.run_length).label('total_length')
+    )
     if drill_hole_id:
         query = query.filter(CoreRun.drill_hole_id == drill_hole_id)
     
-    core_runs = query.all()
+    results = query.group_by(depth_bin).order_by(depth_bin).all()
     
-    # Group by depth intervals
-    depth_intervals = {}
-    for run in core_runs:
-        # Calculate which interval this run belongs to
-        interval_start = (int(run.from_depth) // interval_size) * interval_size
+    bucket_percentiles = {}
+    if percentile_list:
+        bucket_percentiles = _bucket_percentiles(depth_bin, [p / 100 for p in percentile_list], drill_hole_id)
+    
+    sorted_intervals = []
+    for result in results:
+        interval_start = int(result.depth_bin) * interval_size
         interval_end = interval_start + interval_size
-        interval_key = f"{interval_start}-{interval_end}m"
-        
-        if interval_key not in depth_intervals:
-            depth_intervals[interval_key] = {
-                'interval': interval_key,
-                'from_depth': interval_start,
-                'to_depth': interval_end,
-                'runs': [],
-                'avg_recovery': 0,
-                'avg_rqd': 0,
-                'total_runs': 0
-            }
         
-        depth_intervals[interval_key]['runs'].append(run)
-    
-    # Calculate averages for each interval
-    for interval_key in depth_intervals:
-        runs = depth_intervals[interval_key]['runs']
-        total_runs = len(runs)
+        interval = {
+            'interval': f"{interval_start}-{interval_end}m",
+            'from_depth': interval_start,
+            'to_depth': interval_end,
+            'avg_recovery': round(result.avg_recovery, 2) if result.avg_recovery else 0,
+            'avg_rqd': round(result.avg_rqd, 2) if result.avg_rqd else 0,
+            'total_runs': result.total_runs,
+            'total_length': round(result.total_length or 0, 2)
+        }
         
-        if total_runs > 0:
-            avg_recovery = sum(run.total_core_recovery for run in runs) / total_runs
-            avg_rqd = sum(run.rqd_percentage for run in runs) / total_runs
-            
-            depth_intervals[interval_key]['avg_recovery'] = round(avg_recovery, 2)
-            depth_intervals[interval_key]['avg_rqd'] = round(avg_rqd, 2)
-            depth_intervals[interval_key]['total_runs'] = total_runs
+        if percentile_list:
+            values = bucket_percentiles.get(int(result.depth_bin), {})
+            interval['recovery_percentiles'] = {
+                f'p{p:g}': round(values[p / 100], 2) if values else None
+                for p in percentile_list
+            }
         
-        # Remove the runs list from the response
-        del depth_intervals[interval_key]['runs']
-    
-    # Sort by depth
-    sorted_intervals = sorted(depth_intervals.values(), key=lambda x: x['from_depth'])
+        sorted_intervals.append(interval)
     
     return jsonify(sorted_intervals)
 
 @analytics_bp.route('/analytics/lithology-distribution', methods=['GET'])
+@conditional_get(tables=['drill_hole', 'core_run', 'core_interval'])
+@response_cache.cached(tables=['drill_hole', 'core_run', 'core_interval'])
 def get_lithology_distribution():
     """Get lithology distribution statistics"""
     drill_hole_id = request.args.get('drill_hole_id', type=int)
@@ -140,19 +222,25 @@ def get_lithology_distribution():
     return jsonify(distribution)
 
 @analytics_bp.route('/analytics/project-summary', methods=['GET'])
+@conditional_get(tables=['drill_hole', 'core_run', 'core_interval'])
+@response_cache.cached(tables=['drill_hole', 'core_run', 'core_interval'])
 def get_project_summary():
     """Get overall project summary statistics"""
     project_name = request.args.get('project_name')
     
-    # Base queries
-    drill_holes_query = DrillHole.query
-    if project_name:
-        drill_holes_query = drill_holes_query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
+    def filter_project(query):
+        if project_name:
+            query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
+        return query
     
-    drill_holes = drill_holes_query.all()
-    drill_hole_ids = [dh.id for dh in drill_holes]
+    # One grouped aggregate per table, each returning a row per project
+    hole_stats = filter_project(db.session.query(
+        DrillHole.project_name,
+        func.count(DrillHole.id).label('drill_holes'),
+        func.sum(DrillHole.total_depth).label('total_depth')
+    )).group_by(DrillHole.project_name).all()
     
-    if not drill_hole_ids:
+    if not hole_stats:
         return jsonify({
             'total_drill_holes': 0,
             'total_core_runs': 0,
@@ -163,45 +251,53 @@ def get_project_summary():
             'projects': []
         })
     
-    # Core runs statistics
-    core_runs = CoreRun.query.filter(CoreRun.drill_hole_id.in_(drill_hole_ids)).all()
-    core_intervals = CoreInterval.query.join(CoreRun).filter(CoreRun.drill_hole_id.in_(drill_hole_ids)).all()
-    
-    total_core_length = sum(run.core_recovered_length for run in core_runs)
-    avg_recovery = sum(run.total_core_recovery for run in core_runs) / len(core_runs) if core_runs else 0
-    avg_rqd = sum(run.rqd_percentage for run in core_runs) / len(core_runs) if core_runs else 0
-    
-    # Project breakdown
-    projects = {}
-    for dh in drill_holes:
-        if dh.project_name not in projects:
-            projects[dh.project_name] = {
-                'project_name': dh.project_name,
-                'drill_holes': 0,
-                'total_depth': 0,
-                'avg_recovery': 0,
-                'avg_rqd': 0
-            }
-        
-        projects[dh.project_name]['drill_holes'] += 1
-        projects[dh.project_name]['total_depth'] += dh.total_depth or 0
-        
-        # Calculate project-specific recovery
-        project_runs = [run for run in core_runs if run.drill_hole_id == dh.id]
-        if project_runs:
-            project_recovery = sum(run.total_core_recovery for run in project_runs) / len(project_runs)
-            project_rqd = sum(run.rqd_percentage for run in project_runs) / len(project_runs)
-            projects[dh.project_name]['avg_recovery'] = round(project_recovery, 2)
-            projects[dh.project_name]['avg_rqd'] = round(project_rqd, 2)
+    run_stats = filter_project(db.session.query(
+        DrillHole.project_name,
+        func.count(CoreRun.id).label('total_runs'),
+        func.sum(CoreRun.core_recovered_length).label('core_length'),
+        func.sum(CoreRun.total_core_recovery).label('recovery_sum'),
+        func.sum(CoreRun.rqd_percentage).label('rqd_sum')
+    ).join(DrillHole, CoreRun.drill_hole_id == DrillHole.id)).group_by(DrillHole.project_name).all()
+    
+    interval_stats = filter_project(db.session.query(
+        DrillHole.project_name,
+        func.count(CoreInterval.id).label('total_intervals')
+    ).select_from(CoreInterval).join(
+        CoreRun, CoreInterval.core_run_id == CoreRun.id
+    ).join(
+        DrillHole, CoreRun.drill_hole_id == DrillHole.id
+    )).group_by(DrillHole.project_name).all()
+    
+    runs_by_project = {row.project_name: row for row in run_stats}
+    intervals_by_project = {row.project_name: row.total_intervals for row in interval_stats}
+    
+    projects = []
+    for row in hole_stats:
+        runs = runs_by_project.get(row.project_name)
+        total_runs = runs.total_runs if runs else 0
+        projects.append({
+            'project_name': row.project_name,
+            'drill_holes': row.drill_holes,
+            'total_depth': row.total_depth or 0,
+            'total_runs': total_runs,
+            'total_intervals': intervals_by_project.get(row.project_name, 0),
+            'avg_recovery': round(runs.recovery_sum / total_runs, 2) if total_runs else 0,
+            'avg_rqd': round(runs.rqd_sum / total_runs, 2) if total_runs else 0
+        })
+    
+    total_core_runs = sum(row.total_runs for row in run_stats)
+    total_core_length = sum(row.core_length or 0 for row in run_stats)
+    recovery_sum = sum(row.recovery_sum or 0 for row in run_stats)
+    rqd_sum = sum(row.rqd_sum or 0 for row in run_stats)
     
     summary = {
-        'total_drill_holes': len(drill_holes),
-        'total_core_runs': len(core_runs),
-        'total_intervals': len(core_intervals),
+        'total_drill_holes': sum(row.drill_holes for row in hole_stats),
+        'total_core_runs': total_core_runs,
+        'total_intervals': sum(intervals_by_project.values()),
         'total_core_length': round(total_core_length, 2),
-        'avg_recovery': round(avg_recovery, 2),
-        'avg_rqd': round(avg_rqd, 2),
-        'projects': list(projects.values())
+        'avg_recovery': round(recovery_sum / total_core_runs, 2) if total_core_runs else 0,
+        'avg_rqd': round(rqd_sum / total_core_runs, 2) if total_core_runs else 0,
+        'projects': projects
     }
     
     return jsonify(summary)
@@ -212,12 +308,11 @@ def export_csv():
     drill_hole_id = request.args.get('drill_hole_id', type=int)
     project_name = request.args.get('project_name')
     export_type = request.args.get('type', 'intervals')  # intervals, runs, holes
-    
-    output = io.StringIO()
+    output_format = request.args.get('format', 'json')  # json, csv
     
     if export_type == 'intervals':
         # Export core intervals
-        query = db.session.query(
+        columns = [
             DrillHole.hole_id,
             DrillHole.project_name,
             CoreRun.run_number,
@@ -237,52 +332,12 @@ def export_csv():
             CoreInterval.recovery_percentage,
             CoreInterval.rqd_contribution,
             CoreInterval.comments
-        ).join(CoreRun).join(DrillHole)
-        
-        if drill_hole_id:
-            query = query.filter(DrillHole.id == drill_hole_id)
-        if project_name:
-            query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
-        
-        results = query.order_by(DrillHole.hole_id, CoreInterval.from_depth).all()
-        
-        fieldnames = [
-            'hole_id', 'project_name', 'run_number', 'from_depth', 'to_depth',
-            'interval_length', 'lithology', 'lithology_code', 'rock_type', 'color',
-            'alteration_type', 'alteration_intensity', 'mineralization_type',
-            'mineral_abundance', 'fracture_frequency', 'rock_strength',
-            'recovery_percentage', 'rqd_contribution', 'comments'
         ]
-        
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for result in results:
-            writer.writerow({
-                'hole_id': result.hole_id,
-                'project_name': result.project_name,
-                'run_number': result.run_number,
-                'from_depth': result.from_depth,
-                'to_depth': result.to_depth,
-                'interval_length': result.interval_length,
-                'lithology': result.lithology,
-                'lithology_code': result.lithology_code,
-                'rock_type': result.rock_type,
-                'color': result.color,
-                'alteration_type': result.alteration_type,
-                'alteration_intensity': result.alteration_intensity,
-                'mineralization_type': result.mineralization_type,
-                'mineral_abundance': result.mineral_abundance,
-                'fracture_frequency': result.fracture_frequency,
-                'rock_strength': result.rock_strength,
-                'recovery_percentage': result.recovery_percentage,
-                'rqd_contribution': result.rqd_contribution,
-                'comments': result.comments
-            })
+        query = interval_export_query(columns, drill_hole_id=drill_hole_id, project_name=project_name)
     
     elif export_type == 'runs':
         # Export core runs
-        query = db.session.query(
+        columns = [
             DrillHole.hole_id,
             DrillHole.project_name,
             CoreRun.run_number,
@@ -294,65 +349,58 @@ def export_csv():
             CoreRun.rqd_length,
             CoreRun.rqd_percentage,
             CoreRun.drilling_date
-        ).join(DrillHole)
+        ]
+        query = db.session.query(*columns).join(DrillHole)
         
         if drill_hole_id:
             query = query.filter(DrillHole.id == drill_hole_id)
         if project_name:
             query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
         
-        results = query.order_by(DrillHole.hole_id, CoreRun.from_depth).all()
-        
-        fieldnames = [
-            'hole_id', 'project_name', 'run_number', 'from_depth', 'to_depth',
-            'run_length', 'core_recovered_length', 'total_core_recovery',
-            'rqd_length', 'rqd_percentage', 'drilling_date'
-        ]
-        
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for result in results:
-            writer.writerow({
-                'hole_id': result.hole_id,
-                'project_name': result.project_name,
-                'run_number': result.run_number,
-                'from_depth': result.from_depth,
-                'to_depth': result.to_depth,
-                'run_length': result.run_length,
-                'core_recovered_length': result.core_recovered_length,
-                'total_core_recovery': result.total_core_recovery,
-                'rqd_length': result.rqd_length,
-                'rqd_percentage': result.rqd_percentage,
-                'drilling_date': result.drilling_date.isoformat() if result.drilling_date else ''
-            })
-    
-    csv_content = output.getvalue()
-    output.close()
+        query = query.order_by(CoreRun.drill_hole_id, CoreRun.from_depth)
+    
+    else:
+        return jsonify({'error': 'Invalid export type'}), 400
+    
+    fieldnames = [column.key for column in columns]
+    
+    if output_format == 'csv':
+        return csv_response(fieldnames, query, f'core_logging_{export_type}')
+    
+    csv_content = ''.join(iter_csv(fieldnames, iter_query(query)))
     
     return jsonify({
         'csv_data': csv_content,
-        'filename': f'core_logging_{export_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        'filename': export_filename(f'core_logging_{export_type}')
     })
 
 @analytics_bp.route('/analytics/summary', methods=['GET'])
+@conditional_get(tables=['drill_hole', 'core_run', 'project_stats'])
+@response_cache.cached(tables=['drill_hole', 'core_run', 'project_stats'])
 def get_analytics_summary():
     """Get overall analytics summary for dashboard"""
-    total_drill_holes = DrillHole.query.count()
-    total_core_runs = CoreRun.query.count()
-    total_meters_logged = db.session.query(func.sum(CoreRun.core_recovered_length)).scalar() or 0
-    average_recovery = db.session.query(func.avg(CoreRun.total_core_recovery)).scalar() or 0
-    average_rqd = db.session.query(func.avg(CoreRun.rqd_percentage)).scalar() or 0
-    active_projects = db.session.query(DrillHole.project_name).distinct().count()
+    # One pass over the per-project rollup rows instead of the raw tables
+    totals = db.session.query(
+        func.sum(ProjectStats.hole_count).label('holes'),
+        func.sum(ProjectStats.run_count).label('runs'),
+        func.sum(ProjectStats.core_length_sum).label('core_length'),
+        func.sum(ProjectStats.recovery_sum).label('recovery_sum'),
+        func.sum(ProjectStats.rqd_sum).label('rqd_sum'),
+        func.count(ProjectStats.project_name).label('projects')
+    ).filter(ProjectStats.hole_count > 0).one()
+    
+    total_core_runs = totals.runs or 0
+    total_meters_logged = totals.core_length or 0
+    average_recovery = totals.recovery_sum / total_core_runs if total_core_runs else 0
+    average_rqd = totals.rqd_sum / total_core_runs if total_core_runs else 0
 
     return jsonify({
         'summary': {
-            'totalDrillHoles': total_drill_holes,
+            'totalDrillHoles': totals.holes or 0,
             'totalCoreRuns': total_core_runs,
             'totalMetersLogged': round(total_meters_logged, 2),
             'averageRecovery': round(average_recovery, 2),
             'averageRQD': round(average_rqd, 2),
-            'activeProjects': active_projects
+            'activeProjects': totals.projects
         }
     })
-
@@ -1,11 +1,76 @@
-from flask import Blueprint, jsonify, request
-from src.models.user import CoreInterval, CoreRun, db
+from flask import Blueprint, jsonify, request, current_app
+from src.models.user import CoreInterval, CoreRun, ValidationJob, db
+from src.services import rollups
+from src.services.interval_validator import (
+    MAX_REPORTED_ISSUES, check_new_intervals, describe_issue, start_validation
+)
+from src.services.data_versions import conditional_get
+from src.services.pagination import PaginationError, paginated_response, parse_fields, parse_limit
+from src.services.search import SearchError, search_query
+from src.services.serializers import json_response, model_serializer
 from datetime import datetime
+from sqlalchemy import text
 import json
 
 core_interval_bp = Blueprint('core_interval', __name__)
 
+DEFAULT_BULK_BATCH_SIZE = 1000
+MAX_BULK_BATCH_SIZE = 10000
+VALIDATION_MODES = ('warn', 'reject', 'off')
+
+def interval_values(data):
+    """Build CoreInterval column values from a request payload"""
+    # Calculate interval length
+    interval_length = data['to_depth'] - data['from_depth']
+    
+    # Parse logged date if provided
+    logged_date = None
+    if data.get('logged_date'):
+        logged_date = datetime.strptime(data['logged_date'], '%Y-%m-%d').date()
+    
+    # Handle JSON fields
+    ore_minerals = data.get('ore_minerals')
+    if isinstance(ore_minerals, (list, dict)):
+        ore_minerals = json.dumps(ore_minerals)
+    
+    structural_features = data.get('structural_features')
+    if isinstance(structural_features, (list, dict)):
+        structural_features = json.dumps(structural_features)
+    
+    return {
+        'core_run_id': data['core_run_id'],
+        'from_depth': data['from_depth'],
+        'to_depth': data['to_depth'],
+        'interval_length': interval_length,
+        'lithology': data.get('lithology'),
+        'lithology_code': data.get('lithology_code'),
+        'rock_type': data.get('rock_type'),
+        'color': data.get('color'),
+        'grain_size': data.get('grain_size'),
+        'texture': data.get('texture'),
+        'alteration_type': data.get('alteration_type'),
+        'alteration_intensity': data.get('alteration_intensity'),
+        'alteration_style': data.get('alteration_style'),
+        'mineralization_type': data.get('mineralization_type'),
+        'mineralization_style': data.get('mineralization_style'),
+        'mineral_abundance': data.get('mineral_abundance'),
+        'ore_minerals': ore_minerals,
+        'fracture_frequency': data.get('fracture_frequency'),
+        'fracture_orientation': data.get('fracture_orientation'),
+        'bedding_orientation': data.get('bedding_orientation'),
+        'foliation_orientation': data.get('foliation_orientation'),
+        'structural_features': structural_features,
+        'rock_strength': data.get('rock_strength'),
+        'weathering_grade': data.get('weathering_grade'),
+        'recovery_percentage': data.get('recovery_percentage'),
+        'rqd_contribution': data.get('rqd_contribution', 0),
+        'comments': data.get('comments'),
+        'logged_by': data.get('logged_by'),
+        'logged_date': logged_date
+    }
+
 @core_interval_bp.route('/core-intervals', methods=['GET'])
+@conditional_get(tables=['core_interval'])
 def get_core_intervals():
     """Get all core intervals with optional filtering"""
     core_run_id = request.args.get('core_run_id', type=int)
@@ -17,8 +82,44 @@ def get_core_intervals():
     if lithology:
         query = query.filter(CoreInterval.lithology.ilike(f'%{lithology}%'))
     
-    core_intervals = query.order_by(CoreInterval.from_depth).all()
-    return jsonify([interval.to_dict() for interval in core_intervals])
+    return paginated_response(query, CoreInterval, [(CoreInterval.from_depth, False), (CoreInterval.id, False)])
+
+@core_interval_bp.route('/core-intervals/search', methods=['GET'])
+@conditional_get(tables=['core_interval', 'core_run'])
+def search_core_intervals():
+    """Full-text search over interval descriptions and comments, best matches first"""
+    try:
+        limit = parse_limit()
+        fields = parse_fields(CoreInterval)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    sort = request.args.get('sort', 'rank')
+    if sort not in ('rank', 'depth'):
+        return jsonify({'error': 'sort must be rank or depth'}), 400
+    
+    columns, serialize = model_serializer(CoreInterval, fields)
+    try:
+        query, score, ranked = search_query(
+            request.args.get('q'), columns,
+            drill_hole_id=request.args.get('drill_hole_id', type=int),
+            core_run_id=request.args.get('core_run_id', type=int)
+        )
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if sort == 'depth':
+        # Every match in depth order, keyset paginated like the list endpoint
+        return paginated_response(query, CoreInterval, [(CoreInterval.from_depth, False), (CoreInterval.id, False)])
+    
+    # The best ``limit`` matches; relevance has no stable cursor to page by
+    order = [score.desc(), CoreInterval.id] if ranked else [CoreInterval.id]
+    items = []
+    for row in query.order_by(*order).limit(limit):
+        item = serialize(row)
+        item['score'] = round(row.score, 4) if row.score is not None else None
+        items.append(item)
+    return json_response(items)
 
 @core_interval_bp.route('/core-intervals', methods=['POST'])
 def create_core_interval():
@@ -31,56 +132,10 @@ def create_core_interval():
         if not core_run:
             return jsonify({'error': 'Core run not found'}), 404
         
-        # Calculate interval length
-        interval_length = data['to_depth'] - data['from_depth']
-        
-        # Parse logged date if provided
-        logged_date = None
-        if data.get('logged_date'):
-            logged_date = datetime.strptime(data['logged_date'], '%Y-%m-%d').date()
-        
-        # Handle JSON fields
-        ore_minerals = data.get('ore_minerals')
-        if isinstance(ore_minerals, (list, dict)):
-            ore_minerals = json.dumps(ore_minerals)
-        
-        structural_features = data.get('structural_features')
-        if isinstance(structural_features, (list, dict)):
-            structural_features = json.dumps(structural_features)
-        
-        core_interval = CoreInterval(
-            core_run_id=data['core_run_id'],
-            from_depth=data['from_depth'],
-            to_depth=data['to_depth'],
-            interval_length=interval_length,
-            lithology=data.get('lithology'),
-            lithology_code=data.get('lithology_code'),
-            rock_type=data.get('rock_type'),
-            color=data.get('color'),
-            grain_size=data.get('grain_size'),
-            texture=data.get('texture'),
-            alteration_type=data.get('alteration_type'),
-            alteration_intensity=data.get('alteration_intensity'),
-            alteration_style=data.get('alteration_style'),
-            mineralization_type=data.get('mineralization_type'),
-            mineralization_style=data.get('mineralization_style'),
-            mineral_abundance=data.get('mineral_abundance'),
-            ore_minerals=ore_minerals,
-            fracture_frequency=data.get('fracture_frequency'),
-            fracture_orientation=data.get('fracture_orientation'),
-            bedding_orientation=data.get('bedding_orientation'),
-            foliation_orientation=data.get('foliation_orientation'),
-            structural_features=structural_features,
-            rock_strength=data.get('rock_strength'),
-            weathering_grade=data.get('weathering_grade'),
-            recovery_percentage=data.get('recovery_percentage'),
-            rqd_contribution=data.get('rqd_contribution', 0),
-            comments=data.get('comments'),
-            logged_by=data.get('logged_by'),
-            logged_date=logged_date
-        )
+        core_interval = CoreInterval(**interval_values(data))
         
         db.session.add(core_interval)
+        rollups.record_intervals(core_run.drill_hole_id, 1)
         db.session.commit()
         return jsonify(core_interval.to_dict()), 201
         
@@ -179,7 +234,9 @@ def delete_core_interval(interval_id):
     """Delete a core interval"""
     try:
         core_interval = CoreInterval.query.get_or_404(interval_id)
+        drill_hole_id = core_interval.core_run.drill_hole_id
         db.session.delete(core_interval)
+        rollups.record_intervals(drill_hole_id, -1)
         db.session.commit()
         return '', 204
         
@@ -187,83 +244,132 @@ def delete_core_interval(interval_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+def _auto_increment_step():
+    """Spacing between consecutive MySQL auto-increment ids"""
+    return db.session.execute(text('SELECT @@auto_increment_increment')).scalar() or 1
+
+def insert_interval_batch(batch):
+    """Insert one batch of interval rows, returning their ids in row order"""
+    table = CoreInterval.__table__
+    if db.session.get_bind().dialect.insert_executemany_returning:
+        result = db.session.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True), batch)
+        return result.scalars().all()
+    
+    # MySQL cannot return ids from an insert. A single multi-row INSERT is a
+    # "simple insert", for which InnoDB allocates consecutive ids in every
+    # innodb_autoinc_lock_mode, and LAST_INSERT_ID() (the cursor's
+    # lastrowid) is the first of them
+    result = db.session.execute(table.insert().values(batch))
+    step = _auto_increment_step()
+    return [result.lastrowid + offset * step for offset in range(len(batch))]
+
 @core_interval_bp.route('/core-intervals/bulk', methods=['POST'])
 def create_bulk_intervals():
-    """Create multiple core intervals in bulk"""
+    """Create multiple core intervals in bulk with set-based inserts.
+
+    ``ids`` lists the generated id of every created interval, in request
+    order (rejected rows are skipped).
+    """
     try:
         data = request.json
         intervals_data = data.get('intervals', [])
+        batch_size = data.get('batch_size', current_app.config.get('BULK_INSERT_BATCH_SIZE', DEFAULT_BULK_BATCH_SIZE))
         
         if not intervals_data:
             return jsonify({'error': 'No intervals provided'}), 400
+        if not isinstance(batch_size, int) or batch_size < 1:
+            return jsonify({'error': 'batch_size must be a positive integer'}), 400
+        batch_size = min(batch_size, MAX_BULK_BATCH_SIZE)
+        validation = data.get('validation', 'warn')
+        if validation not in VALIDATION_MODES:
+            return jsonify({'error': f'validation must be one of {", ".join(VALIDATION_MODES)}'}), 400
         
-        created_intervals = []
-        
-        for interval_data in intervals_data:
-            # Validate core run exists
-            core_run = CoreRun.query.get(interval_data['core_run_id'])
-            if not core_run:
-                return jsonify({'error': f'Core run {interval_data["core_run_id"]} not found'}), 404
-            
-            # Calculate interval length
-            interval_length = interval_data['to_depth'] - interval_data['from_depth']
-            
-            # Parse logged date if provided
-            logged_date = None
-            if interval_data.get('logged_date'):
-                logged_date = datetime.strptime(interval_data['logged_date'], '%Y-%m-%d').date()
-            
-            # Handle JSON fields
-            ore_minerals = interval_data.get('ore_minerals')
-            if isinstance(ore_minerals, (list, dict)):
-                ore_minerals = json.dumps(ore_minerals)
-            
-            structural_features = interval_data.get('structural_features')
-            if isinstance(structural_features, (list, dict)):
-                structural_features = json.dumps(structural_features)
-            
-            core_interval = CoreInterval(
-                core_run_id=interval_data['core_run_id'],
-                from_depth=interval_data['from_depth'],
-                to_depth=interval_data['to_depth'],
-                interval_length=interval_length,
-                lithology=interval_data.get('lithology'),
-                lithology_code=interval_data.get('lithology_code'),
-                rock_type=interval_data.get('rock_type'),
-                color=interval_data.get('color'),
-                grain_size=interval_data.get('grain_size'),
-                texture=interval_data.get('texture'),
-                alteration_type=interval_data.get('alteration_type'),
-                alteration_intensity=interval_data.get('alteration_intensity'),
-                alteration_style=interval_data.get('alteration_style'),
-                mineralization_type=interval_data.get('mineralization_type'),
-                mineralization_style=interval_data.get('mineralization_style'),
-                mineral_abundance=interval_data.get('mineral_abundance'),
-                ore_minerals=ore_minerals,
-                fracture_frequency=interval_data.get('fracture_frequency'),
-                fracture_orientation=interval_data.get('fracture_orientation'),
-                bedding_orientation=interval_data.get('bedding_orientation'),
-                foliation_orientation=interval_data.get('foliation_orientation'),
-                structural_features=structural_features,
-                rock_strength=interval_data.get('rock_strength'),
-                weathering_grade=interval_data.get('weathering_grade'),
-                recovery_percentage=interval_data.get('recovery_percentage'),
-                rqd_contribution=interval_data.get('rqd_contribution', 0),
-                comments=interval_data.get('comments'),
-                logged_by=interval_data.get('logged_by'),
-                logged_date=logged_date
+        # Validate every referenced core run with a single IN query
+        run_ids = {row.get('core_run_id') for row in intervals_data if isinstance(row, dict)}
+        runs = {
+            run_id: (drill_hole_id, from_depth, to_depth) for run_id, drill_hole_id, from_depth, to_depth in
+            db.session.query(CoreRun.id, CoreRun.drill_hole_id, CoreRun.from_depth, CoreRun.to_depth).filter(
+                CoreRun.id.in_(run_ids)
             )
-            
-            db.session.add(core_interval)
-            created_intervals.append(core_interval)
+        } if run_ids else {}
+        
+        rows = []
+        indexes = []
+        errors = []
+        
+        for index, interval_data in enumerate(intervals_data):
+            try:
+                if interval_data['core_run_id'] not in runs:
+                    errors.append({'index': index, 'error': f'Core run {interval_data["core_run_id"]} not found'})
+                    continue
+                rows.append(interval_values(interval_data))
+                indexes.append(index)
+            except KeyError as e:
+                errors.append({'index': index, 'error': f'Missing field {e.args[0]}'})
+                continue
+            except (TypeError, ValueError) as e:
+                errors.append({'index': index, 'error': str(e)})
+                continue
+        
+        # Sweep the new rows together with their holes' existing intervals
+        issues = []
+        if rows and validation != 'off':
+            _, issues, rejected = check_new_intervals(rows, indexes, runs)
+            if validation == 'reject' and rejected:
+                for issue in issues:
+                    if issue['type'] == 'gap':
+                        continue
+                    for side in (issue, issue.get('other', {})):
+                        if side.get('index') in rejected:
+                            errors.append({'index': side['index'], 'error': describe_issue(issue)})
+                kept = [(index, row) for index, row in zip(indexes, rows) if index not in rejected]
+                indexes = [index for index, _ in kept]
+                rows = [row for _, row in kept]
+                errors.sort(key=lambda error: error['index'])
+        
+        if not rows:
+            return jsonify({'error': 'No valid intervals provided', 'errors': errors}), 400
+        
+        intervals_per_hole = {}
+        for row in rows:
+            drill_hole_id = runs[row['core_run_id']][0]
+            intervals_per_hole[drill_hole_id] = intervals_per_hole.get(drill_hole_id, 0) + 1
+        
+        ids = []
+        for start in range(0, len(rows), batch_size):
+            ids.extend(insert_interval_batch(rows[start:start + batch_size]))
+        
+        for drill_hole_id, count in intervals_per_hole.items():
+            rollups.record_intervals(drill_hole_id, count)
         
         db.session.commit()
         return jsonify({
-            'message': f'Successfully created {len(created_intervals)} intervals',
-            'intervals': [interval.to_dict() for interval in created_intervals]
+            'message': f'Successfully created {len(rows)} intervals',
+            'created_count': len(rows),
+            'ids': ids,
+            'errors': errors,
+            'warnings': issues[:MAX_REPORTED_ISSUES] if validation == 'warn' else [],
+            'warning_count': len(issues) if validation == 'warn' else 0
         }), 201
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+@core_interval_bp.route('/core-intervals/validation-jobs', methods=['POST'])
+def start_interval_validation():
+    """Check a project's intervals for overlaps, gaps and depths outside their run"""
+    try:
+        data = request.get_json(silent=True) or {}
+        job = start_validation(project_name=data.get('project_name'))
+        return jsonify(job.to_dict()), 202
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@core_interval_bp.route('/core-intervals/validation-jobs/<int:job_id>', methods=['GET'])
+def get_interval_validation(job_id):
+    """Get the status and report of an interval validation job"""
+    job = ValidationJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
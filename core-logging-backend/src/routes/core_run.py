@@ -1,10 +1,14 @@
 from flask import Blueprint, jsonify, request
-from src.models.user import CoreRun, DrillHole, db
+from src.models.user import CoreRun, CoreInterval, DrillHole, db
+from src.services import rollups
+from src.services.data_versions import conditional_get
+from src.services.pagination import paginated_response
 from datetime import datetime
 
 core_run_bp = Blueprint('core_run', __name__)
 
 @core_run_bp.route('/core-runs', methods=['GET'])
+@conditional_get(tables=['core_run'])
 def get_core_runs():
     """Get all core runs with optional filtering"""
     drill_hole_id = request.args.get('drill_hole_id', type=int)
@@ -13,8 +17,7 @@ def get_core_runs():
     if drill_hole_id:
         query = query.filter(CoreRun.drill_hole_id == drill_hole_id)
     
-    core_runs = query.order_by(CoreRun.from_depth).all()
-    return jsonify([core_run.to_dict() for core_run in core_runs])
+    return paginated_response(query, CoreRun, [(CoreRun.from_depth, False), (CoreRun.id, False)])
 
 @core_run_bp.route('/core-runs', methods=['POST'])
 def create_core_run():
@@ -56,6 +59,7 @@ def create_core_run():
         )
         
         db.session.add(core_run)
+        rollups.record_run_added(core_run)
         db.session.commit()
         return jsonify(core_run.to_dict()), 201
         
@@ -75,6 +79,7 @@ def update_core_run(core_run_id):
     try:
         core_run = CoreRun.query.get_or_404(core_run_id)
         data = request.json
+        previous_totals = rollups.run_totals(core_run)
         
         # Update fields if provided
         if 'run_number' in data:
@@ -98,6 +103,7 @@ def update_core_run(core_run_id):
         core_run.rqd_percentage = (core_run.rqd_length / core_run.run_length) * 100 if core_run.run_length > 0 else 0
         core_run.updated_at = datetime.utcnow()
         
+        rollups.record_run_updated(core_run, previous_totals)
         db.session.commit()
         return jsonify(core_run.to_dict())
         
@@ -110,7 +116,9 @@ def delete_core_run(core_run_id):
     """Delete a core run"""
     try:
         core_run = CoreRun.query.get_or_404(core_run_id)
+        interval_count = CoreInterval.query.filter(CoreInterval.core_run_id == core_run.id).count()
         db.session.delete(core_run)
+        rollups.record_run_removed(core_run, interval_count)
         db.session.commit()
         return '', 204
         
@@ -124,6 +132,7 @@ def calculate_recovery(core_run_id):
     try:
         core_run = CoreRun.query.get_or_404(core_run_id)
         data = request.json
+        previous_totals = rollups.run_totals(core_run)
         
         # Update core lengths if provided
         if 'core_recovered_length' in data:
@@ -140,6 +149,7 @@ def calculate_recovery(core_run_id):
             core_run.rqd_percentage = 0
         
         core_run.updated_at = datetime.utcnow()
+        rollups.record_run_updated(core_run, previous_totals)
         db.session.commit()
         
         return jsonify({
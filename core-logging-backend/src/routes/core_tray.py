@@ -1,10 +1,13 @@
 from flask import Blueprint, jsonify, request
 from src.models.user import CoreTray, DrillHole, db
+from src.services.data_versions import conditional_get
+from src.services.pagination import paginated_response
 from datetime import datetime
 
 core_tray_bp = Blueprint('core_tray', __name__)
 
 @core_tray_bp.route('/core-trays', methods=['GET'])
+@conditional_get(tables=['core_tray'])
 def get_core_trays():
     """Get all core trays with optional filtering"""
     drill_hole_id = request.args.get('drill_hole_id', type=int)
@@ -19,8 +22,7 @@ def get_core_trays():
     if location:
         query = query.filter(CoreTray.location.ilike(f'%{location}%'))
     
-    core_trays = query.order_by(CoreTray.from_depth).all()
-    return jsonify([core_tray.to_dict() for core_tray in core_trays])
+    return paginated_response(query, CoreTray, [(CoreTray.from_depth, False), (CoreTray.id, False)])
 
 @core_tray_bp.route('/core-trays', methods=['POST'])
 def create_core_tray():
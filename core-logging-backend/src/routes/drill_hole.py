@@ -1,10 +1,18 @@
 from flask import Blueprint, jsonify, request
-from src.models.user import DrillHole, db
+from src.models.user import DrillHole, DrillHoleStats, DownholeSurvey, CoreRun, CoreInterval, CoreTray, db
+from src.services import rollups, spatial
+from src.services.compositing import hole_composites, parse_spec
+from src.services.desurvey import METHODS, desurvey_hole
+from src.services.export_cache import cached_export_response
+from src.services.data_versions import conditional_get
+from src.services.pagination import paginated_response
 from datetime import datetime
+import math
 
 drill_hole_bp = Blueprint('drill_hole', __name__)
 
 @drill_hole_bp.route('/drill-holes', methods=['GET'])
+@conditional_get(tables=['drill_hole'])
 def get_drill_holes():
     """Get all drill holes with optional filtering"""
     project_name = request.args.get('project_name')
@@ -13,8 +21,7 @@ def get_drill_holes():
     if project_name:
         query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
     
-    drill_holes = query.all()
-    return jsonify([drill_hole.to_dict() for drill_hole in drill_holes])
+    return paginated_response(query, DrillHole, [(DrillHole.id, False)])
 
 @drill_hole_bp.route('/drill-holes', methods=['POST'])
 def create_drill_hole():
@@ -45,13 +52,57 @@ def create_drill_hole():
         )
         
         db.session.add(drill_hole)
+        rollups.record_hole_added(drill_hole)
         db.session.commit()
+        spatial.note_changed([drill_hole.id])
         return jsonify(drill_hole.to_dict()), 201
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+def _finite_arg(name):
+    """A float query argument, or None when missing, malformed, infinite or NaN"""
+    value = request.args.get(name, type=float)
+    return value if value is not None and math.isfinite(value) else None
+
+@drill_hole_bp.route('/drill-holes/spatial/bbox', methods=['GET'])
+def get_drill_holes_in_bbox():
+    """Get drill hole collars inside a bounding box"""
+    bounds = [_finite_arg(name) for name in ('min_x', 'min_y', 'max_x', 'max_y')]
+    if any(value is None for value in bounds):
+        return jsonify({'error': 'finite min_x, min_y, max_x and max_y are required'}), 400
+    min_x, min_y, max_x, max_y = bounds
+    if min_x > max_x or min_y > max_y:
+        return jsonify({'error': 'min_x/min_y must not exceed max_x/max_y'}), 400
+    
+    index = spatial.collar_index()
+    return jsonify(index.bbox(min_x, min_y, max_x, max_y, project_name=request.args.get('project_name')))
+
+@drill_hole_bp.route('/drill-holes/spatial/radius', methods=['GET'])
+def get_drill_holes_in_radius():
+    """Get drill hole collars within a radius of a point, nearest first"""
+    x = _finite_arg('x')
+    y = _finite_arg('y')
+    radius = _finite_arg('radius')
+    if x is None or y is None or radius is None or radius < 0:
+        return jsonify({'error': 'finite x, y and a finite non-negative radius are required'}), 400
+    
+    index = spatial.collar_index()
+    return jsonify(index.radius(x, y, radius, project_name=request.args.get('project_name')))
+
+@drill_hole_bp.route('/drill-holes/spatial/nearest', methods=['GET'])
+def get_nearest_drill_holes():
+    """Get the k drill hole collars nearest to a point"""
+    x = _finite_arg('x')
+    y = _finite_arg('y')
+    k = request.args.get('k', default=10, type=int)
+    if x is None or y is None or k is None or not 1 <= k <= spatial.MAX_NEAREST:
+        return jsonify({'error': f'finite x, y and k between 1 and {spatial.MAX_NEAREST} are required'}), 400
+    
+    index = spatial.collar_index()
+    return jsonify(index.nearest(x, y, k, project_name=request.args.get('project_name')))
+
 @drill_hole_bp.route('/drill-holes/<int:drill_hole_id>', methods=['GET'])
 def get_drill_hole(drill_hole_id):
     """Get a specific drill hole"""
@@ -64,6 +115,8 @@ def update_drill_hole(drill_hole_id):
     try:
         drill_hole = DrillHole.query.get_or_404(drill_hole_id)
         data = request.json
+        previous_project_name = drill_hole.project_name
+        previous_total_depth = drill_hole.total_depth
         
         # Update fields if provided
         if 'hole_id' in data:
@@ -89,7 +142,9 @@ def update_drill_hole(drill_hole_id):
         if 'drilling_company' in data:
             drill_hole.drilling_company = data['drilling_company']
         
+        rollups.record_hole_updated(drill_hole, previous_project_name, previous_total_depth)
         db.session.commit()
+        spatial.note_changed([drill_hole_id])
         return jsonify(drill_hole.to_dict())
         
     except Exception as e:
@@ -101,8 +156,19 @@ def delete_drill_hole(drill_hole_id):
     """Delete a drill hole"""
     try:
         drill_hole = DrillHole.query.get_or_404(drill_hole_id)
+        rollups.record_hole_removed(drill_hole)
+        
+        # Delete children set-based rather than letting the ORM cascade load
+        # every run and then every run's intervals one query at a time
+        run_ids = db.session.query(CoreRun.id).filter(CoreRun.drill_hole_id == drill_hole_id).scalar_subquery()
+        CoreInterval.query.filter(CoreInterval.core_run_id.in_(run_ids)).delete(synchronize_session=False)
+        CoreRun.query.filter(CoreRun.drill_hole_id == drill_hole_id).delete(synchronize_session=False)
+        CoreTray.query.filter(CoreTray.drill_hole_id == drill_hole_id).delete(synchronize_session=False)
+        DownholeSurvey.query.filter(DownholeSurvey.drill_hole_id == drill_hole_id).delete(synchronize_session=False)
+        
         db.session.delete(drill_hole)
         db.session.commit()
+        spatial.note_changed([drill_hole_id])
         return '', 204
         
     except Exception as e:
@@ -110,18 +176,20 @@ def delete_drill_hole(drill_hole_id):
         return jsonify({'error': str(e)}), 400
 
 @drill_hole_bp.route('/drill-holes/<int:drill_hole_id>/summary', methods=['GET'])
+@conditional_get(tables=['drill_hole', 'core_tray', 'drill_hole_stats'])
 def get_drill_hole_summary(drill_hole_id):
     """Get summary statistics for a drill hole"""
     drill_hole = DrillHole.query.get_or_404(drill_hole_id)
     
-    # Calculate summary statistics
-    total_runs = len(drill_hole.core_runs)
-    total_trays = len(drill_hole.core_trays)
+    # Run statistics come from the maintained rollup row
+    stats = db.session.get(DrillHoleStats, drill_hole_id)
+    total_runs = stats.run_count if stats else 0
+    total_trays = CoreTray.query.filter(CoreTray.drill_hole_id == drill_hole_id).count()
     
-    if drill_hole.core_runs:
-        avg_recovery = sum(run.total_core_recovery for run in drill_hole.core_runs) / total_runs
-        avg_rqd = sum(run.rqd_percentage for run in drill_hole.core_runs) / total_runs
-        total_core_length = sum(run.core_recovered_length for run in drill_hole.core_runs)
+    if total_runs:
+        avg_recovery = stats.recovery_sum / total_runs
+        avg_rqd = stats.rqd_sum / total_runs
+        total_core_length = stats.core_length_sum
     else:
         avg_recovery = 0
         avg_rqd = 0
@@ -139,51 +207,83 @@ def get_drill_hole_summary(drill_hole_id):
     return jsonify(summary)
 
 
+@drill_hole_bp.route('/drill-holes/<int:drill_hole_id>/surveys', methods=['GET'])
+@conditional_get(tables=['downhole_survey'])
+def get_drill_hole_surveys(drill_hole_id):
+    """Get the downhole survey stations of a drill hole"""
+    DrillHole.query.get_or_404(drill_hole_id)
+    surveys = DownholeSurvey.query.filter(
+        DownholeSurvey.drill_hole_id == drill_hole_id
+    ).order_by(DownholeSurvey.depth).all()
+    return jsonify([survey.to_dict() for survey in surveys])
+
+@drill_hole_bp.route('/drill-holes/<int:drill_hole_id>/surveys', methods=['PUT'])
+def replace_drill_hole_surveys(drill_hole_id):
+    """Replace the downhole survey stations of a drill hole"""
+    try:
+        DrillHole.query.get_or_404(drill_hole_id)
+        stations = request.json
+        if not isinstance(stations, list):
+            return jsonify({'error': 'Expected a list of survey stations'}), 400
+        
+        depths = [station['depth'] for station in stations]
+        if any(depth is None or depth < 0 for depth in depths) or len(set(depths)) != len(depths):
+            return jsonify({'error': 'Survey depths must be unique and non-negative'}), 400
+        
+        DownholeSurvey.query.filter(DownholeSurvey.drill_hole_id == drill_hole_id).delete(synchronize_session=False)
+        if stations:
+            db.session.execute(DownholeSurvey.__table__.insert(), [{
+                'drill_hole_id': drill_hole_id,
+                'depth': station['depth'],
+                'azimuth': station.get('azimuth'),
+                'dip': station.get('dip'),
+                'created_at': datetime.utcnow()
+            } for station in stations])
+        db.session.commit()
+        
+        surveys = DownholeSurvey.query.filter(
+            DownholeSurvey.drill_hole_id == drill_hole_id
+        ).order_by(DownholeSurvey.depth).all()
+        return jsonify([survey.to_dict() for survey in surveys])
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@drill_hole_bp.route('/drill-holes/<int:drill_hole_id>/desurvey', methods=['GET'])
+@conditional_get(tables=['drill_hole', 'downhole_survey', 'core_run', 'core_interval'])
+def get_drill_hole_desurvey(drill_hole_id):
+    """Get 3D coordinates of the from/to/mid points of every run and interval"""
+    method = request.args.get('method')
+    if method is not None and method not in METHODS:
+        return jsonify({'error': f'method must be one of {", ".join(METHODS)}'}), 400
+    
+    result = desurvey_hole(drill_hole_id, method)
+    if result is None:
+        return jsonify({'error': 'Drill hole not found'}), 404
+    return jsonify(result)
+
+@drill_hole_bp.route('/drill-holes/<int:drill_hole_id>/composites', methods=['GET'])
+@conditional_get(tables=['core_run', 'core_interval'])
+def get_drill_hole_composites(drill_hole_id):
+    """Get length-weighted composites of a drill hole's intervals"""
+    try:
+        spec = parse_spec(request.args.get('method'), request.args.get('length', type=float))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result = hole_composites(drill_hole_id, spec)
+    if result is None:
+        return jsonify({'error': 'Drill hole not found'}), 404
+    return jsonify(result)
+
 
 @drill_hole_bp.route('/api/drill-holes/export/csv', methods=['GET'])
 def export_drill_holes_csv():
     """Export drill holes to CSV format"""
     try:
-        import csv
-        import io
-        from datetime import datetime
-        from flask import current_app
-        
-        drill_holes = DrillHole.query.all()
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'Hole_ID', 'Project', 'Location', 'Collar_X', 'Collar_Y', 'Collar_Z',
-            'Total_Depth', 'Azimuth', 'Dip', 'Start_Date', 'End_Date', 'Status'
-        ])
-        
-        # Write data
-        for hole in drill_holes:
-            writer.writerow([
-                hole.hole_id,
-                hole.project,
-                hole.location,
-                hole.collar_x,
-                hole.collar_y,
-                hole.collar_z,
-                hole.total_depth,
-                hole.azimuth,
-                hole.dip,
-                hole.start_date,
-                hole.end_date,
-                hole.status
-            ])
-        
-        output.seek(0)
-        
-        return current_app.response_class(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename=drill_holes_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-        )
+        project_name = request.args.get('project_name')
+        return cached_export_response('drill_holes', project_name=project_name)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -192,50 +292,11 @@ def export_drill_holes_csv():
 def export_drill_holes_leapfrog():
     """Export drill holes in Leapfrog-compatible format"""
     try:
-        import csv
-        import io
-        from datetime import datetime
-        from flask import current_app
-        
-        # Get all intervals with drill hole information
-        intervals = db.session.query(CoreInterval, CoreRun, DrillHole).join(
-            CoreRun, CoreInterval.core_run_id == CoreRun.id
-        ).join(
-            DrillHole, CoreRun.drill_hole_id == DrillHole.id
-        ).all()
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Leapfrog format header
-        writer.writerow([
-            'BHID', 'FROM', 'TO', 'LITHOLOGY', 'ALTERATION', 'MINERALIZATION',
-            'RECOVERY', 'RQD', 'STRUCTURE', 'COMMENTS'
-        ])
-        
-        # Write data in Leapfrog format
-        for interval, core_run, drill_hole in intervals:
-            writer.writerow([
-                drill_hole.hole_id,
-                interval.from_depth,
-                interval.to_depth,
-                interval.lithology_code or interval.lithology,
-                interval.alteration_type,
-                interval.mineralization_type,
-                interval.recovery_percentage,
-                interval.rqd_contribution,
-                interval.structural_features,
-                interval.comments
-            ])
-        
-        output.seek(0)
-        
-        return current_app.response_class(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename=leapfrog_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-        )
+        drill_hole_id = request.args.get('drill_hole_id', type=int)
+        project_name = request.args.get('project_name')
+        coordinates = request.args.get('coordinates', 'false').lower() == 'true'
+        return cached_export_response('leapfrog', drill_hole_id=drill_hole_id, project_name=project_name,
+                                      coordinates=coordinates)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
@@ -1,9 +1,13 @@
-from flask import Blueprint, jsonify, request, send_file, current_app
-import csv
-import io
+from flask import Blueprint, jsonify, request
 import json
-from datetime import datetime
-from src.models.user import db, DrillHole, CoreRun, CoreTray, CoreInterval, QAQCItem
+from src.models.user import db, ImportJob, ExportJob
+from src.services import columnar
+from src.services.compositing import parse_spec
+from src.services.export_cache import EXPORT_TYPES, cached_export_response, export_params
+from src.services.export_jobs import download_response, job_to_dict, submit_export
+from src.services.geology_package import package_response
+from src.services.importer import CSVImporter, DEFAULT_IMPORT_BATCH_SIZE, open_upload
+from src.services.streaming import composite_csv_response
 
 export_bp = Blueprint('export', __name__)
 
@@ -13,99 +17,18 @@ def export_csv():
     try:
         
         export_type = request.args.get('type', 'intervals')
-        drill_hole_id = request.args.get('drill_hole_id')
+        drill_hole_id = request.args.get('drill_hole_id', type=int)
+        project_name = request.args.get('project_name')
+        coordinates = request.args.get('coordinates', 'false').lower() == 'true'
         
         if export_type == 'intervals':
-            # Export core intervals data
-            query = CoreInterval.query
-            if drill_hole_id:
-                query = query.join(CoreRun).filter(CoreRun.drill_hole_id == drill_hole_id)
-            
-            intervals = query.all()
-            
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            writer.writerow([
-                'Drill_Hole', 'Core_Run', 'From_Depth', 'To_Depth', 'Length',
-                'Lithology', 'Lithology_Code', 'Alteration', 'Alteration_Code',
-                'Mineralization', 'Mineralization_Code', 'Structure', 'Structure_Code',
-                'Recovery_Percentage', 'RQD', 'Comments', 'Logged_Date', 'Logged_By'
-            ])
-            
-            # Write data
-            for interval in intervals:
-                core_run = CoreRun.query.get(interval.core_run_id)
-                drill_hole = DrillHole.query.get(core_run.drill_hole_id)
-                
-                writer.writerow([
-                    drill_hole.hole_id,
-                    f"Run {core_run.run_number}",
-                    interval.from_depth,
-                    interval.to_depth,
-                    interval.to_depth - interval.from_depth,
-                    interval.lithology,
-                    interval.lithology_code,
-                    interval.alteration_type,
-                    interval.alteration_type,  # Using alteration_type as code
-                    interval.mineralization_type,
-                    interval.mineralization_type,  # Using mineralization_type as code
-                    interval.structural_features,
-                    interval.structural_features,  # Using structural_features as code
-                    interval.recovery_percentage,
-                    interval.rqd_contribution,
-                    interval.comments,
-                    interval.logged_date,
-                    interval.logged_by
-                ])
-            
-            output.seek(0)
-            
-            # Create response
-            return current_app.response_class(
-                output.getvalue(),
-                mimetype='text/csv',
-                headers={'Content-Disposition': f'attachment; filename=core_intervals_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-            )
+            # Stream core intervals from a single joined query, or the cached file
+            return cached_export_response('intervals', drill_hole_id=drill_hole_id, project_name=project_name,
+                                          coordinates=coordinates)
             
         elif export_type == 'drill_holes':
             # Export drill holes summary
-            drill_holes = DrillHole.query.all()
-            
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            writer.writerow([
-                'Hole_ID', 'Project', 'Location', 'Collar_X', 'Collar_Y', 'Collar_Z',
-                'Total_Depth', 'Azimuth', 'Dip', 'Start_Date', 'End_Date', 'Status'
-            ])
-            
-            # Write data
-            for hole in drill_holes:
-                writer.writerow([
-                    hole.hole_id,
-                    hole.project,
-                    hole.location,
-                    hole.collar_x,
-                    hole.collar_y,
-                    hole.collar_z,
-                    hole.total_depth,
-                    hole.azimuth,
-                    hole.dip,
-                    hole.start_date,
-                    hole.end_date,
-                    hole.status
-                ])
-            
-            output.seek(0)
-            
-            return current_app.response_class(
-                output.getvalue(),
-                mimetype='text/csv',
-                headers={'Content-Disposition': f'attachment; filename=drill_holes_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-            )
+            return cached_export_response('drill_holes', project_name=project_name)
             
         else:
             return jsonify({'error': 'Invalid export type'}), 400
@@ -117,52 +40,12 @@ def export_csv():
 def export_leapfrog():
     """Export data in Leapfrog-compatible format"""
     try:
-        drill_hole_id = request.args.get('drill_hole_id')
-        
-        # Query intervals with spatial data
-        query = CoreInterval.query
-        if drill_hole_id:
-            query = query.join(CoreRun).filter(CoreRun.drill_hole_id == drill_hole_id)
+        drill_hole_id = request.args.get('drill_hole_id', type=int)
+        project_name = request.args.get('project_name')
+        coordinates = request.args.get('coordinates', 'false').lower() == 'true'
         
-        intervals = query.all()
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Leapfrog format header
-        writer.writerow([
-            'BHID', 'FROM', 'TO', 'LITHOLOGY', 'ALTERATION', 'MINERALIZATION',
-            'RECOVERY', 'RQD', 'STRUCTURE', 'COMMENTS'
-        ])
-        
-        # Write data in Leapfrog format
-        for interval in intervals:
-            core_run = CoreRun.query.get(interval.core_run_id)
-            drill_hole = DrillHole.query.get(core_run.drill_hole_id)
-            
-            writer.writerow([
-                drill_hole.hole_id,
-                interval.from_depth,
-                interval.to_depth,
-                interval.lithology_code or interval.lithology,
-                interval.alteration_code or interval.alteration,
-                interval.mineralization_code or interval.mineralization,
-                interval.recovery_percentage,
-                interval.rqd,
-                interval.structure_code or interval.structure,
-                interval.comments
-            ])
-        
-        output.seek(0)
-        
-        response = send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'leapfrog_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
-        
-        return response
+        return cached_export_response('leapfrog', drill_hole_id=drill_hole_id, project_name=project_name,
+                                      coordinates=coordinates)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -171,59 +54,115 @@ def export_leapfrog():
 def export_qaqc():
     """Export QA/QC report"""
     try:
-        qaqc_items = QAQCItem.query.all()
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'ID', 'Title', 'Description', 'Type', 'Priority', 'Status',
-            'Assigned_To', 'Drill_Hole', 'Core_Run', 'Created_Date',
-            'Due_Date', 'Resolved_Date', 'Comments_Count'
-        ])
+        return cached_export_response('qaqc')
         
-        # Write data
-        for item in qaqc_items:
-            writer.writerow([
-                item.id,
-                item.title,
-                item.description,
-                item.type,
-                item.priority,
-                item.status,
-                item.assigned_to,
-                item.drill_hole,
-                item.core_run,
-                item.created_date,
-                item.due_date,
-                item.resolved_date,
-                item.comments_count or 0
-            ])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@export_bp.route('/api/export/composites', methods=['GET'])
+def export_composites():
+    """Export length-weighted interval composites to CSV format"""
+    try:
+        try:
+            spec = parse_spec(request.args.get('method'), request.args.get('length', type=float))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        output.seek(0)
+        drill_hole_id = request.args.get('drill_hole_id', type=int)
+        project_name = request.args.get('project_name')
+        return composite_csv_response(spec, drill_hole_id=drill_hole_id, project_name=project_name)
         
-        response = send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'qaqc_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@export_bp.route('/api/export/package', methods=['GET'])
+def export_package():
+    """Export collar, survey and interval tables as one ZIP for modelling packages"""
+    try:
+        drill_hole_id = request.args.get('drill_hole_id', type=int)
+        project_name = request.args.get('project_name')
+        return package_response(drill_hole_id=drill_hole_id, project_name=project_name)
         
-        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@export_bp.route('/api/export/columnar', methods=['GET'])
+def export_columnar():
+    """Export intervals, runs or QA/QC records as Parquet or an Arrow IPC stream"""
+    try:
+        export_type = request.args.get('type', 'intervals')
+        output_format = request.args.get('format', 'parquet')
+        if export_type not in columnar.EXPORTS:
+            return jsonify({'error': f'type must be one of {", ".join(columnar.EXPORTS)}'}), 400
+        if output_format not in columnar.FORMATS:
+            return jsonify({'error': f'format must be one of {", ".join(columnar.FORMATS)}'}), 400
+        if columnar.pa is None:
+            return jsonify({'error': 'Columnar export requires pyarrow'}), 501
+        
+        drill_hole_id = request.args.get('drill_hole_id', type=int)
+        project_name = request.args.get('project_name')
+        return columnar.columnar_response(export_type, output_format, drill_hole_id=drill_hole_id,
+                                          project_name=project_name)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@export_bp.route('/api/export/jobs', methods=['POST'])
+def create_export_job():
+    """Build an export in the background, reusing an identical running or finished one"""
+    try:
+        data = request.get_json(silent=True) or {}
+        export_type = data.get('type', 'intervals')
+        if export_type not in EXPORT_TYPES:
+            return jsonify({'error': f'type must be one of {", ".join(EXPORT_TYPES)}'}), 400
+        
+        drill_hole_id = data.get('drill_hole_id')
+        if drill_hole_id is not None:
+            drill_hole_id = int(drill_hole_id)
+        coordinates = str(data.get('coordinates', 'false')).lower() == 'true'
+        params = export_params(export_type, drill_hole_id=drill_hole_id, project_name=data.get('project_name'),
+                               coordinates=coordinates)
+        
+        job, reused = submit_export(export_type, params)
+        result = job_to_dict(job)
+        result['reused'] = reused
+        return jsonify(result), 200 if reused else 202
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@export_bp.route('/api/export/jobs/<int:job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """Get the progress of a background export"""
+    job = ExportJob.query.get_or_404(job_id)
+    return jsonify(job_to_dict(job))
+
+@export_bp.route('/api/export/jobs/<int:job_id>/download', methods=['GET'])
+def download_export_job(job_id):
+    """Download the file of a finished background export"""
+    job = ExportJob.query.get_or_404(job_id)
+    if job.status != 'completed':
+        return jsonify({'error': f'Export is {job.status}', 'status': job.status}), 409
+    
+    response = download_response(job)
+    if response is None:
+        return jsonify({'error': 'Export file is no longer available; submit the export again'}), 410
+    return response
+
 @export_bp.route('/api/import/csv', methods=['POST'])
 def import_csv():
-    """Import data from CSV file"""
+    """Import data from CSV file in checkpointed batches"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
         
         file = request.files['file']
         import_type = request.form.get('type', 'intervals')
+        import_id = request.form.get('import_id', type=int)  # Resume a failed import
+        batch_size = request.form.get('batch_size', default=DEFAULT_IMPORT_BATCH_SIZE, type=int)
         
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
@@ -231,101 +170,45 @@ def import_csv():
         if not file.filename.endswith('.csv'):
             return jsonify({'error': 'File must be CSV format'}), 400
         
-        # Read CSV content
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_input = csv.DictReader(stream)
-        
-        imported_count = 0
-        errors = []
-        
-        if import_type == 'drill_holes':
-            # Import drill holes
-            for row_num, row in enumerate(csv_input, start=2):
-                try:
-                    # Check if drill hole already exists
-                    existing_hole = DrillHole.query.filter_by(hole_id=row['Hole_ID']).first()
-                    if existing_hole:
-                        errors.append(f"Row {row_num}: Drill hole {row['Hole_ID']} already exists")
-                        continue
-                    
-                    drill_hole = DrillHole(
-                        hole_id=row['Hole_ID'],
-                        project=row.get('Project', ''),
-                        location=row.get('Location', ''),
-                        collar_x=float(row.get('Collar_X', 0)) if row.get('Collar_X') else None,
-                        collar_y=float(row.get('Collar_Y', 0)) if row.get('Collar_Y') else None,
-                        collar_z=float(row.get('Collar_Z', 0)) if row.get('Collar_Z') else None,
-                        total_depth=float(row.get('Total_Depth', 0)) if row.get('Total_Depth') else None,
-                        azimuth=float(row.get('Azimuth', 0)) if row.get('Azimuth') else None,
-                        dip=float(row.get('Dip', 0)) if row.get('Dip') else None,
-                        start_date=row.get('Start_Date'),
-                        end_date=row.get('End_Date'),
-                        status=row.get('Status', 'active')
-                    )
-                    
-                    db.session.add(drill_hole)
-                    imported_count += 1
-                    
-                except Exception as e:
-                    errors.append(f"Row {row_num}: {str(e)}")
-        
-        elif import_type == 'intervals':
-            # Import core intervals
-            for row_num, row in enumerate(csv_input, start=2):
-                try:
-                    # Find drill hole and core run
-                    drill_hole = DrillHole.query.filter_by(hole_id=row['Drill_Hole']).first()
-                    if not drill_hole:
-                        errors.append(f"Row {row_num}: Drill hole {row['Drill_Hole']} not found")
-                        continue
-                    
-                    # Extract run number from Core_Run field
-                    run_number = int(row['Core_Run'].replace('Run ', ''))
-                    core_run = CoreRun.query.filter_by(
-                        drill_hole_id=drill_hole.id,
-                        run_number=run_number
-                    ).first()
-                    
-                    if not core_run:
-                        errors.append(f"Row {row_num}: Core run {row['Core_Run']} not found for drill hole {row['Drill_Hole']}")
-                        continue
-                    
-                    interval = CoreInterval(
-                        core_run_id=core_run.id,
-                        from_depth=float(row['From_Depth']),
-                        to_depth=float(row['To_Depth']),
-                        lithology=row.get('Lithology', ''),
-                        lithology_code=row.get('Lithology_Code', ''),
-                        alteration=row.get('Alteration', ''),
-                        alteration_code=row.get('Alteration_Code', ''),
-                        mineralization=row.get('Mineralization', ''),
-                        mineralization_code=row.get('Mineralization_Code', ''),
-                        structure=row.get('Structure', ''),
-                        structure_code=row.get('Structure_Code', ''),
-                        recovery_percentage=float(row.get('Recovery_Percentage', 0)) if row.get('Recovery_Percentage') else None,
-                        rqd=float(row.get('RQD', 0)) if row.get('RQD') else None,
-                        comments=row.get('Comments', ''),
-                        logged_by=row.get('Logged_By', 'Import'),
-                        logged_date=datetime.now()
-                    )
-                    
-                    db.session.add(interval)
-                    imported_count += 1
-                    
-                except Exception as e:
-                    errors.append(f"Row {row_num}: {str(e)}")
-        
-        # Commit changes
-        if imported_count > 0:
-            db.session.commit()
+        if import_type not in ('intervals', 'drill_holes'):
+            return jsonify({'error': 'Invalid import type'}), 400
+        
+        if batch_size < 1:
+            return jsonify({'error': 'batch_size must be positive'}), 400
+        
+        try:
+            importer = CSVImporter.start(import_type, file.filename, import_id=import_id, batch_size=batch_size)
+        except LookupError as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        try:
+            job = importer.run(open_upload(file))
+        except Exception as e:
+            job = importer.job
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'import_id': job.id,
+                'rows_processed': job.rows_processed,
+                'imported_count': job.imported_count
+            }), 500
         
         return jsonify({
             'success': True,
-            'imported_count': imported_count,
-            'errors': errors
+            'import_id': job.id,
+            'rows_processed': job.rows_processed,
+            'imported_count': job.imported_count,
+            'errors': json.loads(job.errors) if job.errors else []
         })
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@export_bp.route('/api/import/<int:import_id>', methods=['GET'])
+def get_import_status(import_id):
+    """Get the checkpoint of a CSV import"""
+    job = ImportJob.query.get_or_404(import_id)
+    return jsonify(job.to_dict())
@@ -0,0 +1,67 @@
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+from src.models.user import db
+from src.services.cache import response_cache
+from src.services.export_cache import export_cache
+
+health_bp = Blueprint('health', __name__)
+
+def pool_status():
+    """Connection pool usage for the current app's engine"""
+    pool = db.engine.pool
+    status = {'pool_class': type(pool).__name__}
+    if not isinstance(pool, QueuePool):
+        return status
+
+    # QueuePool keeps max_overflow private; -1 means unbounded
+    max_overflow = getattr(pool, '_max_overflow', 0)
+    capacity = pool.size() + max_overflow if max_overflow >= 0 else 0
+    checked_out = pool.checkedout()
+    status.update(
+        pool_size=pool.size(),
+        max_overflow=max_overflow,
+        checked_out=checked_out,
+        checked_in=pool.checkedin(),
+        overflow=max(pool.overflow(), 0),
+        capacity=capacity,
+        saturation=round(checked_out / capacity, 3) if capacity else 0
+    )
+    return status
+
+@health_bp.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return {'status': 'healthy', 'message': 'Core Logging API is running'}
+
+@health_bp.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe: the worker is up and serving requests (no DB access)"""
+    return {'status': 'alive'}
+
+@health_bp.route('/health/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: the database answers and the pool has headroom"""
+    try:
+        db.session.execute(text('SELECT 1'))
+        db.session.rollback()  # hand the connection straight back to the pool
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status': 'unavailable', 'error': str(e), 'pool': pool_status()}), 503
+
+    pool = pool_status()
+    max_saturation = current_app.config.get('READINESS_MAX_POOL_SATURATION', 1.0)
+    if pool.get('saturation', 0) >= max_saturation:
+        return jsonify({'status': 'saturated', 'pool': pool}), 503
+
+    return jsonify({'status': 'ready', 'pool': pool})
+
+@health_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Response cache hit/miss counters"""
+    return response_cache.to_dict()
+
+@health_bp.route('/export-cache/stats', methods=['GET'])
+def export_cache_stats():
+    """Export file cache hit/miss/byte counters and size"""
+    return export_cache.to_dict()
@@ -1,10 +1,18 @@
 from flask import Blueprint, jsonify, request
+from sqlalchemy import case, func
 from src.models.user import QAQCRecord, DrillHole, db
+from src.services.cache import response_cache
+from src.services.control_charts import DEFAULT_BIAS_RUN, DEFAULT_WINDOW, control_chart
+from src.services.data_versions import conditional_get
+from src.services.pagination import paginated_response
 from datetime import datetime
 
 qaqc_bp = Blueprint('qaqc', __name__)
 
+STATUSES = ('pass', 'warning', 'fail')
+
 @qaqc_bp.route('/qaqc-records', methods=['GET'])
+@conditional_get(tables=['qaqc_record'])
 def get_qaqc_records():
     """Get all QA/QC records with optional filtering"""
     drill_hole_id = request.args.get('drill_hole_id', type=int)
@@ -19,8 +27,7 @@ def get_qaqc_records():
     if status:
         query = query.filter(QAQCRecord.status == status)
     
-    qaqc_records = query.order_by(QAQCRecord.created_at.desc()).all()
-    return jsonify([record.to_dict() for record in qaqc_records])
+    return paginated_response(query, QAQCRecord, [(QAQCRecord.created_at, True), (QAQCRecord.id, True)])
 
 @qaqc_bp.route('/qaqc-records', methods=['POST'])
 def create_qaqc_record():
@@ -134,58 +141,114 @@ def delete_qaqc_record(record_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+def _status_counts():
+    """Total plus pass/warning/fail counts as conditional aggregates"""
+    return [
+        func.count(QAQCRecord.id).label('total'),
+        *[func.sum(case((QAQCRecord.status == status, 1), else_=0)).label(status) for status in STATUSES]
+    ]
+
+def _counts(row):
+    """Counts and pass/warning/fail rates from a _status_counts() row"""
+    values = row._mapping
+    counts = {'total': values['total']}
+    for status in STATUSES:
+        counts[status] = values[status] or 0
+    for status in STATUSES:
+        counts[f'{status}_rate'] = round((counts[status] / counts['total']) * 100, 2) if counts['total'] else 0
+    return counts
+
+def _period_start(column, group_by):
+    """SQL expression for the first day of the week (Monday) or month of a timestamp"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        if group_by == 'week':
+            return func.date(column, 'weekday 0', '-6 days')
+        return func.strftime('%Y-%m-01', column)
+    if group_by == 'week':
+        return func.subdate(func.date(column), func.weekday(column))
+    return func.date_format(column, '%Y-%m-01')
+
 @qaqc_bp.route('/qaqc-records/statistics', methods=['GET'])
+@conditional_get(tables=['qaqc_record'])
+@response_cache.cached(tables=['qaqc_record'])
 def get_qaqc_statistics():
-    """Get QA/QC statistics"""
+    """Get QA/QC statistics, optionally with week/month pass-rate trends"""
     drill_hole_id = request.args.get('drill_hole_id', type=int)
+    record_type = request.args.get('record_type')
+    group_by = request.args.get('group_by')
+    if group_by not in (None, 'week', 'month'):
+        return jsonify({'error': 'group_by must be week or month'}), 400
     
-    query = QAQCRecord.query
+    filters = []
     if drill_hole_id:
-        query = query.filter(QAQCRecord.drill_hole_id == drill_hole_id)
+        filters.append(QAQCRecord.drill_hole_id == drill_hole_id)
+    if record_type:
+        filters.append(QAQCRecord.record_type == record_type)
+    
+    # One grouped pass counts every status of every record type
+    rows = db.session.query(QAQCRecord.record_type, *_status_counts()).filter(
+        *filters
+    ).group_by(QAQCRecord.record_type).all()
     
-    all_records = query.all()
+    by_type = {}
+    totals = {'total': 0, 'pass': 0, 'warning': 0, 'fail': 0}
+    for row in rows:
+        counts = by_type[row.record_type] = _counts(row)
+        for key in totals:
+            totals[key] += counts[key]
     
-    if not all_records:
-        return jsonify({
+    total_records = totals['total']
+    if not total_records:
+        statistics = {
             'total_records': 0,
             'pass_rate': 0,
             'warning_rate': 0,
             'fail_rate': 0,
             'by_type': {}
-        })
-    
-    total_records = len(all_records)
-    pass_count = len([r for r in all_records if r.status == 'pass'])
-    warning_count = len([r for r in all_records if r.status == 'warning'])
-    fail_count = len([r for r in all_records if r.status == 'fail'])
+        }
+    else:
+        statistics = {
+            'total_records': total_records,
+            'pass_count': totals['pass'],
+            'warning_count': totals['warning'],
+            'fail_count': totals['fail'],
+            'pass_rate': round((totals['pass'] / total_records) * 100, 2),
+            'warning_rate': round((totals['warning'] / total_records) * 100, 2),
+            'fail_rate': round((totals['fail'] / total_records) * 100, 2),
+            'by_type': by_type
+        }
     
-    # Statistics by record type
-    by_type = {}
-    for record in all_records:
-        if record.record_type not in by_type:
-            by_type[record.record_type] = {'total': 0, 'pass': 0, 'warning': 0, 'fail': 0}
+    if group_by:
+        period = _period_start(QAQCRecord.created_at, group_by).label('period')
+        trend_rows = db.session.query(period, *_status_counts()).filter(
+            QAQCRecord.created_at.isnot(None), *filters
+        ).group_by(period).order_by(period).all()
         
-        by_type[record.record_type]['total'] += 1
-        by_type[record.record_type][record.status] += 1
-    
-    # Calculate rates for each type
-    for record_type in by_type:
-        total = by_type[record_type]['total']
-        if total > 0:
-            by_type[record_type]['pass_rate'] = round((by_type[record_type]['pass'] / total) * 100, 2)
-            by_type[record_type]['warning_rate'] = round((by_type[record_type]['warning'] / total) * 100, 2)
-            by_type[record_type]['fail_rate'] = round((by_type[record_type]['fail'] / total) * 100, 2)
-    
-    statistics = {
-        'total_records': total_records,
-        'pass_count': pass_count,
-        'warning_count': warning_count,
-        'fail_count': fail_count,
-        'pass_rate': round((pass_count / total_records) * 100, 2),
-        'warning_rate': round((warning_count / total_records) * 100, 2),
-        'fail_rate': round((fail_count / total_records) * 100, 2),
-        'by_type': by_type
-    }
+        statistics['group_by'] = group_by
+        statistics['trends'] = [dict(period=str(row.period), **_counts(row)) for row in trend_rows]
     
     return jsonify(statistics)
 
+@qaqc_bp.route('/qaqc-records/control-chart', methods=['GET'])
+@conditional_get(tables=['qaqc_record'])
+def get_control_chart():
+    """Control chart with Westgard rule violations for one standard"""
+    record_type = request.args.get('record_type', 'standard')
+    sample_id = request.args.get('sample_id')
+    window = request.args.get('window', default=DEFAULT_WINDOW, type=int)
+    bias_run = request.args.get('bias_run', default=DEFAULT_BIAS_RUN, type=int)
+    last = request.args.get('last', default=1000, type=int)
+    violations_only = request.args.get('violations_only', 'false').lower() == 'true'
+    
+    if not sample_id:
+        return jsonify({'error': 'sample_id is required'}), 400
+    if window is None or window < 2 or bias_run is None or bias_run < 2:
+        return jsonify({'error': 'window and bias_run must be integers of at least 2'}), 400
+    
+    try:
+        chart = control_chart(record_type, sample_id, window, bias_run,
+                              last=last if last and last > 0 else None,
+                              violations_only=violations_only)
+        return jsonify(chart)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
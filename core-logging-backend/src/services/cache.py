@@ -0,0 +1,154 @@
+"""In-process response cache for the heavy read-only endpoints.
+
+Views opt in with ``@response_cache.cached(tables=[...])``. Entries are keyed
+by endpoint path and the normalised query string, and by the generation of
+every table the view reads. A commit that wrote to one of those tables bumps
+its generation, so affected entries are never served again and age out of
+the LRU. Committed writes are reported by ``src.services.data_versions``;
+rolled-back writes do not invalidate anything. A hit costs no query.
+
+Generations only see commits made by this process. Under
+``conditional_get`` the key also holds the shared ``data_version`` rows the
+decorator already read for the ETag, so a write in another worker changes
+the key too and a cached body always matches its ETag; views cached without
+it rely on ``RESPONSE_CACHE_TTL`` to bound staleness across workers.
+Backends are pluggable; anything implementing ``get``/``set``/``clear``/
+``__len__`` like ``MemoryBackend`` can be passed to ``init_app``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+from src.services import data_versions
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 300  # seconds
+
+
+class MemoryBackend:
+    """Thread-safe LRU dictionary with per-entry expiry"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tables):
+        """Bump the generation of each table so dependent entries go stale"""
+        with self._lock:
+            for table in tables:
+                self.generations[table] = self.generations.get(table, 0) + 1
+            self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache:
+    """Caches view responses and invalidates them on committed writes"""
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.generations = {}
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, backend=None):
+        """Configure from RESPONSE_CACHE_* settings"""
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+        if backend is not None:
+            self.backend = backend
+        elif 'RESPONSE_CACHE_MAX_ENTRIES' in app.config:
+            self.backend = MemoryBackend(app.config['RESPONSE_CACHE_MAX_ENTRIES'])
+        app.extensions['response_cache'] = self
+
+    def invalidate(self, tables):
+        """Bump the generation of each table so dependent entries go stale"""
+        with self._lock:
+            for table in tables:
+                self.generations[table] = self.generations.get(table, 0) + 1
+            self.stats['invalidations'] += 1
+
+    def clear(self):
+        self.backend.clear()
+
+    def _key(self, tables):
+        args = sorted((key, value) for key, values in request.args.lists() for value in set(values))
+        generations = tuple(self.generations.get(table, 0) for table in tables)
+        versions = data_versions.known_versions(tables)
+        if versions is not None:
+            versions = tuple(versions.get(table, (0,))[0] for table in tables)
+        return (request.path, tuple(args), generations, versions)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def cached(self, tables, ttl=None):
+        """Decorator caching successful responses of a read-only view"""
+        tables = tuple(tables)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if current_app.config.get('RESPONSE_CACHE_DISABLED'):
+                    return view(*args, **kwargs)
+
+                key = self._key(tables)
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self._count('hits')
+                    body, status, mimetype = entry
+                    response = current_app.response_class(body, status=status, mimetype=mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self._count('misses')
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    self.backend.set(key, (response.get_data(), response.status_code, response.mimetype),
+                                     ttl if ttl is not None else self.ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def to_dict(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return dict(
+            self.stats,
+            entries=len(self.backend),
+            hit_rate=round(self.stats['hits'] / total * 100, 2) if total else 0
+        )
+
+
+response_cache = ResponseCache()
+data_versions.subscribe(response_cache.invalidate)
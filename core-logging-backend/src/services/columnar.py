@@ -0,0 +1,221 @@
+"""Columnar (Parquet / Arrow IPC) exports of intervals, runs and QA/QC records.
+
+Rows are read with the same server-side batched cursors as the CSV exports
+and turned into Arrow record batches of ``DEFAULT_BATCH_ROWS`` rows, one
+column array at a time, so memory stays bounded by a single batch. Each
+batch is written straight into the response:
+
+* ``parquet`` - one zstd-compressed row group per batch;
+* ``arrow`` - a zstd-compressed Arrow IPC stream (``.arrows``), readable with
+  ``pyarrow.ipc.open_stream``.
+
+Repetitive text columns (hole ids, lithology, alteration, status, ...) are
+dictionary encoded against one dictionary per column that grows across the
+export, so the IPC stream only sends new values as dictionary deltas and
+pandas reads them back as categoricals. Other types follow the SQL column:
+floats, integers, dates and timestamps keep their native Arrow types.
+
+pyarrow is optional: without it the rest of the application works and these
+endpoints answer 501.
+"""
+from flask import Response, stream_with_context
+from sqlalchemy import Date, DateTime, Float, Integer
+
+from src.models.user import db, DrillHole, CoreRun, CoreInterval, QAQCRecord
+from src.services.streaming import ChunkSink, export_filename, interval_export_query
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; only the columnar exports need it
+    pa = pq = None
+
+FORMATS = ('parquet', 'arrow')
+DEFAULT_BATCH_ROWS = 65536
+PARQUET_COMPRESSION = 'zstd'
+IPC_COMPRESSION = 'zstd'
+MIMETYPES = {'parquet': 'application/vnd.apache.parquet', 'arrow': 'application/vnd.apache.arrow.stream'}
+EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrows'}
+
+# (output name, SQL column, dictionary encoded)
+INTERVAL_COLUMNS = [
+    ('hole_id', DrillHole.hole_id, True),
+    ('project_name', DrillHole.project_name, True),
+    ('run_number', CoreRun.run_number, False),
+    ('interval_id', CoreInterval.id, False),
+    ('from_depth', CoreInterval.from_depth, False),
+    ('to_depth', CoreInterval.to_depth, False),
+    ('interval_length', CoreInterval.interval_length, False),
+    ('lithology', CoreInterval.lithology, True),
+    ('lithology_code', CoreInterval.lithology_code, True),
+    ('rock_type', CoreInterval.rock_type, True),
+    ('color', CoreInterval.color, True),
+    ('grain_size', CoreInterval.grain_size, True),
+    ('texture', CoreInterval.texture, True),
+    ('alteration_type', CoreInterval.alteration_type, True),
+    ('alteration_intensity', CoreInterval.alteration_intensity, True),
+    ('alteration_style', CoreInterval.alteration_style, True),
+    ('mineralization_type', CoreInterval.mineralization_type, True),
+    ('mineralization_style', CoreInterval.mineralization_style, True),
+    ('mineral_abundance', CoreInterval.mineral_abundance, True),
+    ('ore_minerals', CoreInterval.ore_minerals, False),
+    ('fracture_frequency', CoreInterval.fracture_frequency, False),
+    ('structural_features', CoreInterval.structural_features, False),
+    ('rock_strength', CoreInterval.rock_strength, True),
+    ('weathering_grade', CoreInterval.weathering_grade, True),
+    ('recovery_percentage', CoreInterval.recovery_percentage, False),
+    ('rqd_contribution', CoreInterval.rqd_contribution, False),
+    ('comments', CoreInterval.comments, False),
+    ('logged_by', CoreInterval.logged_by, False),
+    ('logged_date', CoreInterval.logged_date, False),
+]
+
+RUN_COLUMNS = [
+    ('hole_id', DrillHole.hole_id, True),
+    ('project_name', DrillHole.project_name, True),
+    ('run_id', CoreRun.id, False),
+    ('run_number', CoreRun.run_number, False),
+    ('from_depth', CoreRun.from_depth, False),
+    ('to_depth', CoreRun.to_depth, False),
+    ('run_length', CoreRun.run_length, False),
+    ('core_recovered_length', CoreRun.core_recovered_length, False),
+    ('total_core_recovery', CoreRun.total_core_recovery, False),
+    ('rqd_length', CoreRun.rqd_length, False),
+    ('rqd_percentage', CoreRun.rqd_percentage, False),
+    ('drilling_date', CoreRun.drilling_date, False),
+    ('logged_by', CoreRun.logged_by, False),
+]
+
+QAQC_COLUMNS = [
+    ('hole_id', DrillHole.hole_id, True),
+    ('project_name', DrillHole.project_name, True),
+    ('record_id', QAQCRecord.id, False),
+    ('record_type', QAQCRecord.record_type, True),
+    ('sample_id', QAQCRecord.sample_id, True),
+    ('from_depth', QAQCRecord.from_depth, False),
+    ('to_depth', QAQCRecord.to_depth, False),
+    ('expected_value', QAQCRecord.expected_value, False),
+    ('actual_value', QAQCRecord.actual_value, False),
+    ('variance', QAQCRecord.variance, False),
+    ('status', QAQCRecord.status, True),
+    ('comments', QAQCRecord.comments, False),
+    ('created_at', QAQCRecord.created_at, False),
+]
+
+
+def _runs_query(columns, drill_hole_id=None, project_name=None):
+    query = db.session.query(*columns).select_from(CoreRun).join(DrillHole, CoreRun.drill_hole_id == DrillHole.id)
+    if drill_hole_id:
+        query = query.filter(CoreRun.drill_hole_id == drill_hole_id)
+    if project_name:
+        query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
+    return query.order_by(CoreRun.drill_hole_id, CoreRun.from_depth, CoreRun.id)
+
+
+def _qaqc_query(columns, drill_hole_id=None, project_name=None):
+    query = db.session.query(*columns).select_from(QAQCRecord).join(
+        DrillHole, QAQCRecord.drill_hole_id == DrillHole.id
+    )
+    if drill_hole_id:
+        query = query.filter(QAQCRecord.drill_hole_id == drill_hole_id)
+    if project_name:
+        query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
+    return query.order_by(QAQCRecord.id)
+
+
+EXPORTS = {
+    'intervals': (INTERVAL_COLUMNS, interval_export_query),
+    'runs': (RUN_COLUMNS, _runs_query),
+    'qaqc': (QAQC_COLUMNS, _qaqc_query),
+}
+
+
+def _arrow_type(column, dictionary):
+    if dictionary:
+        return pa.dictionary(pa.int32(), pa.string())
+    column_type = column.type
+    if isinstance(column_type, Float):
+        return pa.float64()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, DateTime):
+        return pa.timestamp('us')
+    if isinstance(column_type, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def arrow_schema(columns):
+    return pa.schema([pa.field(name, _arrow_type(column, dictionary)) for name, column, dictionary in columns])
+
+
+class DictionaryEncoder:
+    """value -> code map for one column, shared by every batch of an export"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, values):
+        codes = self.codes
+        for value in dict.fromkeys(values):  # distinct values, first-seen order
+            if value is not None and value not in codes:
+                codes[value] = len(self.values)
+                self.values.append(value)
+        indices = list(map(codes.get, values))  # None stays null
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(self.values, pa.string()))
+
+
+def iter_row_batches(query, batch_rows=DEFAULT_BATCH_ROWS):
+    """Lists of up to ``batch_rows`` rows read through a server-side cursor"""
+    statement = query.statement.execution_options(yield_per=batch_rows)
+    # Core rows through the session's connection skip ORM row processing
+    return db.session.connection().execute(statement).partitions()
+
+
+def record_batches(columns, row_batches, schema):
+    """Arrow record batches built column by column from batches of rows"""
+    encoders = {name: DictionaryEncoder() for name, _, dictionary in columns if dictionary}
+    for batch in row_batches:
+        arrays = []
+        for field, values in zip(schema, zip(*batch)):
+            if field.name in encoders:
+                arrays.append(encoders[field.name].encode(values))
+            else:
+                arrays.append(pa.array(values, field.type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_columnar(columns, query, output_format, batch_rows=DEFAULT_BATCH_ROWS):
+    """Yield the bytes of a Parquet file or Arrow IPC stream, batch by batch"""
+    schema = arrow_schema(columns)
+    sink = ChunkSink()
+    output = pa.PythonFile(sink, mode='w')
+    if output_format == 'parquet':
+        writer = pq.ParquetWriter(output, schema, compression=PARQUET_COMPRESSION)
+    else:
+        writer = pa.ipc.new_stream(output, schema, options=pa.ipc.IpcWriteOptions(
+            compression=IPC_COMPRESSION, emit_dictionary_deltas=True
+        ))
+
+    for batch in record_batches(columns, iter_row_batches(query, batch_rows), schema):
+        writer.write_batch(batch)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
+
+
+def columnar_response(export_type, output_format, drill_hole_id=None, project_name=None,
+                      batch_rows=DEFAULT_BATCH_ROWS):
+    """Stream one of ``EXPORTS`` as a Parquet or Arrow attachment"""
+    columns, build_query = EXPORTS[export_type]
+    query = build_query([column for _, column, _ in columns], drill_hole_id=drill_hole_id,
+                        project_name=project_name)
+    filename = export_filename(f'core_logging_{export_type}', EXTENSIONS[output_format])
+    return Response(
+        stream_with_context(iter_columnar(columns, query, output_format, batch_rows)),
+        mimetype=MIMETYPES[output_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
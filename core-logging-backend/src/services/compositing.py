@@ -0,0 +1,295 @@
+"""Length-weighted downhole compositing of core intervals.
+
+A composite spec is a method plus, for fixed-length composites, a length:
+
+* ``length`` - consecutive composites of ``length`` metres measured from the
+  collar, the last one ending at the deepest logged depth;
+* ``run`` - one composite per core run, over the run's depths;
+* ``lithology`` - one composite per unbroken stretch of intervals sharing a
+  ``lithology_code`` (a gap in the log also ends a stretch).
+
+Numeric fields are averaged weighted by the length of each interval falling
+inside the composite, ignoring intervals where the field is null.
+Categorical fields take the value covering the most length. ``logged_length``
+is the length inside the composite covered by any interval; composites with
+nothing logged are left out.
+
+All of this comes from cumulative sums. For weights ``w`` the logged integral
+up to depth ``x`` is ``sum(w * clip(x - from, 0, length))``, which splits into
+``x * W(x) - WF(x)`` over intervals starting above ``x`` minus the same over
+intervals ending above ``x``, with ``W``/``WF`` prefix sums in from/to order.
+Every field and category is one column of a weight matrix, so a hole is
+composited with two sorts, two cumulative sums and one ``searchsorted`` per
+boundary, however many composites it has. Overlapping intervals are counted
+once each, as logged.
+
+Composites are cached per (hole, spec) and reused while the ``core_run`` and
+``core_interval`` data versions are unchanged.
+"""
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from src.models.user import db, DrillHole, CoreRun, CoreInterval
+from src.services.cache import MemoryBackend
+from src.services.data_versions import current_versions
+
+METHODS = ('length', 'run', 'lithology')
+DEFAULT_LENGTH = 1.0
+MAX_LENGTH = 100.0
+DEFAULT_CACHE_ENTRIES = 8192
+# Holes composited per pair of interval/run queries in exports
+HOLE_BATCH_SIZE = 500
+# Depths closer than this are the same boundary
+TOLERANCE = 1e-6
+
+COMPOSITE_TABLES = ('core_run', 'core_interval')
+NUMERIC_FIELDS = ('recovery_percentage', 'rqd_contribution', 'fracture_frequency')
+CATEGORICAL_FIELDS = ('lithology_code', 'alteration_type', 'mineralization_type')
+FIELDS = ('from_depth', 'to_depth', 'length', 'logged_length') + NUMERIC_FIELDS + CATEGORICAL_FIELDS
+
+INTERVAL_COLUMNS = (CoreRun.drill_hole_id, CoreInterval.from_depth, CoreInterval.to_depth) + tuple(
+    getattr(CoreInterval, name) for name in NUMERIC_FIELDS + CATEGORICAL_FIELDS
+)
+
+CompositeSpec = namedtuple('CompositeSpec', ['method', 'length'])
+
+
+def parse_spec(method=None, length=None):
+    """Validate request arguments into a ``CompositeSpec``, raising ValueError"""
+    method = method or 'length'
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {", ".join(METHODS)}')
+    if method != 'length':
+        return CompositeSpec(method, None)
+    length = DEFAULT_LENGTH if length is None else length
+    if not 0 < length <= MAX_LENGTH:
+        raise ValueError(f'length must be greater than 0 and at most {MAX_LENGTH:g}')
+    return CompositeSpec(method, float(length))
+
+
+def _signature():
+    versions = current_versions(COMPOSITE_TABLES)
+    return tuple(versions.get(table, (0,))[0] for table in COMPOSITE_TABLES)
+
+
+class DepthIntegral:
+    """Logged integrals of weight columns between arbitrary depths"""
+
+    def __init__(self, from_depth, to_depth):
+        self.from_order = np.argsort(from_depth, kind='stable')
+        self.to_order = np.argsort(to_depth, kind='stable')
+        self.sorted_from = from_depth[self.from_order]
+        self.sorted_to = to_depth[self.to_order]
+
+    @staticmethod
+    def _below(depths, weights, x):
+        """sum(w * max(x - depth, 0)) for every x, with ``depths`` sorted"""
+        zeros = np.zeros((1, weights.shape[1]))
+        totals = np.vstack((zeros, np.cumsum(weights, axis=0)))
+        moments = np.vstack((zeros, np.cumsum(weights * depths[:, None], axis=0)))
+        index = np.searchsorted(depths, x, side='right')
+        return x[:, None] * totals[index] - moments[index]
+
+    def between(self, weights, starts, ends):
+        """Integral of each weight column over [starts, ends), as (m, columns)"""
+        x = np.concatenate((starts, ends))
+        integral = (self._below(self.sorted_from, weights[self.from_order], x)
+                    - self._below(self.sorted_to, weights[self.to_order], x))
+        count = len(starts)
+        return integral[count:] - integral[:count]
+
+
+def _boundaries(spec, from_depth, to_depth, codes, runs):
+    if spec.method == 'run':
+        if not runs:
+            return np.zeros(0), np.zeros(0)
+        starts, ends = (np.array(values, dtype=float) for values in zip(*runs))
+        return starts, ends
+
+    if spec.method == 'length':
+        first = np.floor(from_depth.min() / spec.length) * spec.length
+        last = to_depth.max()
+        count = max(int(np.ceil((last - first) / spec.length - TOLERANCE)), 1)
+        starts = first + spec.length * np.arange(count)
+        return starts, np.minimum(starts + spec.length, last)
+
+    # Lithology: break wherever the code changes or the log has a gap
+    order = np.lexsort((to_depth, from_depth))
+    sorted_from, sorted_to, sorted_codes = from_depth[order], to_depth[order], codes[order]
+    reach = np.maximum.accumulate(sorted_to)
+    breaks = np.ones(len(order), dtype=bool)
+    breaks[1:] = (sorted_codes[1:] != sorted_codes[:-1]) | (sorted_from[1:] > reach[:-1] + TOLERANCE)
+    first = np.flatnonzero(breaks)
+    return sorted_from[first], np.maximum.reduceat(sorted_to, first)
+
+
+def composite(intervals, spec, runs=None):
+    """Composite one hole's intervals.
+
+    ``intervals`` is a dict of arrays keyed by ``from_depth``, ``to_depth``
+    and the numeric (float, NaN for null) and categorical (object) fields;
+    ``runs`` lists (from_depth, to_depth) for the ``run`` method. Returns a
+    list of tuples in ``FIELDS`` order.
+    """
+    from_depth, to_depth = intervals['from_depth'], intervals['to_depth']
+    if not len(from_depth):
+        return []
+    to_depth = np.maximum(to_depth, from_depth)
+    starts, ends = _boundaries(spec, from_depth, to_depth, intervals['lithology_code'], runs)
+    if not len(starts):
+        return []
+
+    # Weight columns: coverage, then per numeric field its valid length and
+    # value, then one indicator per category of each categorical field
+    columns = [np.ones(len(from_depth))]
+    for name in NUMERIC_FIELDS:
+        values = intervals[name]
+        valid = ~np.isnan(values)
+        columns += [valid.astype(float), np.where(valid, values, 0.0)]
+    categories = {}
+    for name in CATEGORICAL_FIELDS:
+        values = intervals[name]
+        present = sorted({value for value in values.tolist() if value is not None})
+        categories[name] = present
+        columns += [(values == value).astype(float) for value in present]
+
+    totals = DepthIntegral(from_depth, to_depth).between(np.column_stack(columns), starts, ends)
+    logged = totals[:, 0]
+    keep = logged > TOLERANCE
+
+    result = {
+        'from_depth': starts,
+        'to_depth': ends,
+        'length': ends - starts,
+        'logged_length': logged,
+    }
+    column = 1
+    for name in NUMERIC_FIELDS:
+        weight, value = totals[:, column], totals[:, column + 1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[name] = np.where(weight > TOLERANCE, value / weight, np.nan)
+        column += 2
+    for name in CATEGORICAL_FIELDS:
+        present = categories[name]
+        if not present:
+            result[name] = [None] * len(starts)
+            continue
+        # Round away cumulative-sum noise so equal lengths tie, and ties go
+        # to the first category in sort order
+        lengths = np.round(totals[:, column:column + len(present)], 6)
+        majority = np.argmax(lengths, axis=1)
+        covered = lengths[np.arange(len(starts)), majority] > TOLERANCE
+        result[name] = [present[index] if has_value else None
+                        for index, has_value in zip(majority.tolist(), covered.tolist())]
+        column += len(present)
+
+    kept = np.flatnonzero(keep)
+    columns = []
+    for name in FIELDS:
+        if name in CATEGORICAL_FIELDS:
+            columns.append([result[name][i] for i in kept.tolist()])
+        else:
+            columns.append(_rounded(result[name][kept], nullable=name in NUMERIC_FIELDS))
+    return list(zip(*columns))
+
+
+def _rounded(values, digits=4, nullable=True):
+    rounded = np.round(values, digits).tolist()
+    if not nullable:
+        return rounded
+    return [None if value != value else value for value in rounded]  # NaN -> None
+
+
+def _load(hole_ids, spec):
+    """Interval columns (and runs, for the run method) of several holes"""
+    rows = db.session.query(*INTERVAL_COLUMNS).select_from(CoreInterval).join(
+        CoreRun, CoreInterval.core_run_id == CoreRun.id
+    ).filter(CoreRun.drill_hole_id.in_(hole_ids)).all()
+
+    by_hole = {}
+    for row in rows:
+        by_hole.setdefault(row[0], []).append(row[1:])
+
+    intervals = {}
+    for hole_id, hole_rows in by_hole.items():
+        values = list(zip(*hole_rows))
+        columns = {
+            'from_depth': np.array(values[0], dtype=float),
+            'to_depth': np.array(values[1], dtype=float),
+        }
+        for position, name in enumerate(NUMERIC_FIELDS + CATEGORICAL_FIELDS, start=2):
+            if name in NUMERIC_FIELDS:
+                columns[name] = np.array([np.nan if value is None else value for value in values[position]],
+                                         dtype=float)
+            else:
+                columns[name] = np.array(values[position], dtype=object)
+        intervals[hole_id] = columns
+
+    runs = {}
+    if spec.method == 'run':
+        for hole_id, from_depth, to_depth in db.session.query(
+            CoreRun.drill_hole_id, CoreRun.from_depth, CoreRun.to_depth
+        ).filter(CoreRun.drill_hole_id.in_(hole_ids)).order_by(CoreRun.drill_hole_id, CoreRun.from_depth):
+            runs.setdefault(hole_id, []).append((from_depth, to_depth))
+    return intervals, runs
+
+
+_composites = MemoryBackend(DEFAULT_CACHE_ENTRIES)
+_lock = threading.Lock()
+
+
+def composites_for_holes(hole_ids, spec, signature=None):
+    """{hole id: composite rows}, compositing only holes missing from the cache"""
+    signature = signature or _signature()
+    url = str(db.engine.url)
+    found = {}
+    missing = []
+    for hole_id in hole_ids:
+        cached = _composites.get((url, hole_id, spec))
+        if cached is not None and cached[0] == signature:
+            found[hole_id] = cached[1]
+        else:
+            missing.append(hole_id)
+
+    if missing:
+        intervals, runs = _load(missing, spec)
+        empty = {'from_depth': np.zeros(0), 'to_depth': np.zeros(0)}
+        with _lock:
+            for hole_id in missing:
+                rows = composite(intervals.get(hole_id, empty), spec, runs.get(hole_id))
+                _composites.set((url, hole_id, spec), (signature, rows))
+                found[hole_id] = rows
+    return found
+
+
+def hole_composites(drill_hole_id, spec):
+    """Composites of one hole as a dict, or None if the hole does not exist"""
+    if db.session.get(DrillHole, drill_hole_id) is None:
+        return None
+    rows = composites_for_holes([drill_hole_id], spec)[drill_hole_id]
+    return {
+        'drill_hole_id': drill_hole_id,
+        'method': spec.method,
+        'length': spec.length,
+        'composites': [dict(zip(FIELDS, row)) for row in rows],
+    }
+
+
+def iter_composite_rows(spec, drill_hole_id=None, project_name=None, batch_size=HOLE_BATCH_SIZE):
+    """Yield (hole_id, *composite) rows for an export, a batch of holes at a time"""
+    query = db.session.query(DrillHole.id, DrillHole.hole_id)
+    if drill_hole_id:
+        query = query.filter(DrillHole.id == drill_hole_id)
+    if project_name:
+        query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
+    holes = query.order_by(DrillHole.hole_id).all()
+
+    signature = _signature()
+    for start in range(0, len(holes), batch_size):
+        batch = holes[start:start + batch_size]
+        composites = composites_for_holes([hole.id for hole in batch], spec, signature)
+        for hole in batch:
+            for row in composites[hole.id]:
+                yield (hole.hole_id, *row)
@@ -0,0 +1,261 @@
+"""Control charts for certified reference material (CRM) standards.
+
+A standard is the series of ``QAQCRecord`` rows sharing a ``record_type``
+and ``sample_id``, in insertion (id) order. Each point is compared with a
+centre line and a rolling standard deviation:
+
+* the centre is the record's certified ``expected_value``, or the rolling
+  mean when the record has none;
+* the rolling mean and SD cover the ``window`` values *before* the point, so
+  a bad result cannot widen its own limits.
+
+Westgard-style rules flagged per point:
+
+* ``1_2s`` - more than 2 SD from the centre (warning)
+* ``1_3s`` - more than 3 SD from the centre (reject)
+* ``2_2s`` - this point and the previous one beyond 2 SD on the same side
+* ``bias`` - ``bias_run`` or more consecutive points on the same side of
+  the centre
+
+Everything is computed with NumPy over whole arrays: the rolling sums come
+from prefix sums and the run lengths from cumulative maxima. Results are
+cached per (standard, window, bias_run). A later call fetches only records
+appended since the cached state and extends the arrays, carrying the
+trailing window and the current bias run across the join. When the
+``qaqc_record`` data version is unchanged nothing is queried at all;
+otherwise an aggregate fingerprint of the rows already charted (counts,
+plain and id-weighted sums of the actual and expected values) is compared
+with the one the database returned when they were charted, so edits to
+either value, swaps and deletions trigger a full recompute.
+"""
+import threading
+
+import numpy as np
+from sqlalchemy import func
+
+from src.models.user import db, QAQCRecord
+from src.services.cache import MemoryBackend
+from src.services.data_versions import current_versions
+
+DEFAULT_WINDOW = 20
+DEFAULT_BIAS_RUN = 10
+DEFAULT_CACHE_ENTRIES = 256
+# Minimum prior values before an SD (and the SD rules) is defined
+MIN_PERIODS = 2
+
+RULES = ('1_2s', '1_3s', '2_2s', 'bias')
+RULE_BITS = {rule: 1 << bit for bit, rule in enumerate(RULES)}
+
+
+def rolling_stats(values, window, start):
+    """Mean and sample SD of the ``window`` values preceding each index >= start.
+
+    Uses prefix sums of values shifted by their mean to keep the
+    sum-of-squares formula numerically stable.
+    """
+    shift = values.mean() if len(values) else 0.0
+    shifted = values - shift
+    prefix = np.concatenate(([0.0], np.cumsum(shifted)))
+    prefix_sq = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+
+    index = np.arange(start, len(values))
+    lower = np.maximum(index - window, 0)
+    count = (index - lower).astype(float)
+    total = prefix[index] - prefix[lower]
+    total_sq = prefix_sq[index] - prefix_sq[lower]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = (total_sq - total * mean) / (count - 1)
+    mean = np.where(count >= 1, mean + shift, np.nan)
+    sd = np.where(count >= MIN_PERIODS, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+    return mean, sd
+
+
+def run_lengths(signs, carried_sign=0, carried_length=0):
+    """Length of the same-sign run ending at each point (0 where sign is 0)"""
+    if not len(signs):
+        return np.zeros(0, dtype=np.int64)
+    index = np.arange(len(signs))
+    starts = np.ones(len(signs), dtype=bool)
+    starts[1:] = signs[1:] != signs[:-1]
+    run_start = np.maximum.accumulate(np.where(starts, index, 0))
+    lengths = index - run_start + 1
+    if carried_sign != 0 and signs[0] == carried_sign:
+        lengths[run_start == 0] += carried_length
+    return np.where(signs == 0, 0, lengths)
+
+
+class ControlChart:
+    """Incrementally maintained chart of one standard"""
+
+    def __init__(self, record_type, sample_id, window=DEFAULT_WINDOW, bias_run=DEFAULT_BIAS_RUN):
+        self.record_type = record_type
+        self.sample_id = sample_id
+        self.window = window
+        self.bias_run = bias_run
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.data_version = None
+        self.last_id = 0
+        self.fingerprint = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.created_at = []
+        self.values = np.zeros(0)
+        self.expected = np.zeros(0)
+        self.center = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.sd = np.zeros(0)
+        self.z = np.zeros(0)
+        self.flags = np.zeros(0, dtype=np.uint8)
+        self.run_sign = 0
+        self.run_length = 0
+
+    def _filters(self):
+        return [
+            QAQCRecord.record_type == self.record_type,
+            QAQCRecord.sample_id == self.sample_id,
+            QAQCRecord.actual_value.isnot(None),
+        ]
+
+    def _fingerprint(self):
+        """Aggregates of the rows up to ``last_id``, as the database computes them"""
+        return tuple(db.session.query(
+            func.count(QAQCRecord.id),
+            func.count(QAQCRecord.expected_value),
+            func.sum(QAQCRecord.actual_value),
+            func.sum(QAQCRecord.expected_value),
+            func.sum(QAQCRecord.id * QAQCRecord.actual_value),
+            func.sum(QAQCRecord.id * QAQCRecord.expected_value)
+        ).filter(*self._filters(), QAQCRecord.id <= self.last_id).one())
+
+    def refresh(self):
+        """Bring the chart up to date, recomputing only appended records"""
+        version = current_versions([QAQCRecord.__tablename__]).get(QAQCRecord.__tablename__)
+        if version is not None and version == self.data_version:
+            return
+        # Compared exactly: both fingerprints come from the same aggregate
+        # query, and the session's transaction gives it the same snapshot as
+        # the fetch below
+        if len(self.ids) and self._fingerprint() != self.fingerprint:
+            self.reset()
+
+        rows = db.session.query(
+            QAQCRecord.id, QAQCRecord.created_at, QAQCRecord.actual_value, QAQCRecord.expected_value
+        ).filter(*self._filters(), QAQCRecord.id > self.last_id).order_by(QAQCRecord.id).all()
+        if rows:
+            ids, created_at, values, expected = zip(*rows)
+            self._append(
+                np.fromiter(ids, dtype=np.int64, count=len(rows)),
+                [value.isoformat() if value else None for value in created_at],
+                np.array(values, dtype=float),
+                np.array([np.nan if value is None else value for value in expected], dtype=float)
+            )
+            self.fingerprint = self._fingerprint()
+        self.data_version = version
+
+    def _append(self, ids, created_at, values, expected):
+        # Prepend the trailing window so rolling stats continue across the join
+        tail = self.values[-self.window:]
+        mean, sd = rolling_stats(np.concatenate((tail, values)), self.window, len(tail))
+
+        center = np.where(np.isnan(expected), mean, expected)
+        deviation = values - center
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = np.where(sd > 0, deviation / sd, np.nan)
+
+        abs_z = np.abs(np.nan_to_num(z))
+        flags = np.zeros(len(values), dtype=np.uint8)
+        flags |= np.where(abs_z > 2, RULE_BITS['1_2s'], 0).astype(np.uint8)
+        flags |= np.where(abs_z > 3, RULE_BITS['1_3s'], 0).astype(np.uint8)
+
+        side_2s = np.where(abs_z > 2, np.sign(np.nan_to_num(z)), 0)
+        previous_side = np.concatenate((
+            [np.sign(self.z[-1]) if len(self.z) and abs(np.nan_to_num(self.z[-1])) > 2 else 0],
+            side_2s[:-1]
+        ))
+        flags |= np.where((side_2s != 0) & (side_2s == previous_side), RULE_BITS['2_2s'], 0).astype(np.uint8)
+
+        signs = np.sign(np.nan_to_num(deviation)).astype(np.int8)
+        lengths = run_lengths(signs, self.run_sign, self.run_length)
+        flags |= np.where(lengths >= self.bias_run, RULE_BITS['bias'], 0).astype(np.uint8)
+
+        self.ids = np.concatenate((self.ids, ids))
+        self.created_at.extend(created_at)
+        self.values = np.concatenate((self.values, values))
+        self.expected = np.concatenate((self.expected, expected))
+        self.center = np.concatenate((self.center, center))
+        self.mean = np.concatenate((self.mean, mean))
+        self.sd = np.concatenate((self.sd, sd))
+        self.z = np.concatenate((self.z, z))
+        self.flags = np.concatenate((self.flags, flags))
+        self.last_id = int(ids[-1])
+        self.run_sign = int(signs[-1])
+        self.run_length = int(lengths[-1])
+
+    def summary(self):
+        count = len(self.values)
+        certified = self.expected[~np.isnan(self.expected)]
+        expected_value = float(certified[-1]) if len(certified) else None
+        mean = float(self.values.mean()) if count else None
+        return {
+            'count': count,
+            'expected_value': expected_value,
+            'mean': mean,
+            'sd': float(self.values.std(ddof=1)) if count >= MIN_PERIODS else None,
+            'bias_percentage': round((mean - expected_value) / expected_value * 100, 4)
+            if mean is not None and expected_value else None,
+            'violations': {rule: int(np.count_nonzero(self.flags & bit)) for rule, bit in RULE_BITS.items()},
+        }
+
+    def points(self, last=None, violations_only=False):
+        """Chart points as dicts, newest ``last`` (after filtering) only"""
+        index = np.arange(len(self.values))
+        if violations_only:
+            index = index[self.flags[index] != 0]
+        if last is not None:
+            index = index[-last:] if last > 0 else index[:0]
+
+        def number(value):
+            return None if np.isnan(value) else round(float(value), 6)
+
+        return [{
+            'id': int(self.ids[i]),
+            'created_at': self.created_at[i],
+            'value': float(self.values[i]),
+            'center': number(self.center[i]),
+            'rolling_mean': number(self.mean[i]),
+            'rolling_sd': number(self.sd[i]),
+            'z_score': number(self.z[i]),
+            'violations': [rule for rule, bit in RULE_BITS.items() if self.flags[i] & bit],
+        } for i in index]
+
+    def to_dict(self, last=None, violations_only=False):
+        return {
+            'record_type': self.record_type,
+            'sample_id': self.sample_id,
+            'window': self.window,
+            'bias_run': self.bias_run,
+            'summary': self.summary(),
+            'points': self.points(last, violations_only),
+        }
+
+
+_charts = MemoryBackend(DEFAULT_CACHE_ENTRIES)
+_charts_lock = threading.Lock()
+
+
+def control_chart(record_type, sample_id, window=DEFAULT_WINDOW, bias_run=DEFAULT_BIAS_RUN,
+                  last=None, violations_only=False):
+    """Up-to-date chart of a standard as a dict, reusing the cached state if any"""
+    key = (str(db.engine.url), record_type, sample_id, window, bias_run)
+    with _charts_lock:
+        chart = _charts.get(key)
+        if chart is None:
+            chart = ControlChart(record_type, sample_id, window, bias_run)
+            _charts.set(key, chart)
+    with chart.lock:
+        chart.refresh()
+        return chart.to_dict(last, violations_only)
@@ -0,0 +1,153 @@
+"""Per-table data versions and conditional GET support.
+
+Session events record which tables a transaction writes, both through ORM
+flushes and through DML statements executed on the session (bulk inserts,
+set-based deletes). Just before the transaction commits, the matching
+``data_version`` rows are incremented in that same transaction, so every
+worker sees the new version as soon as the data itself is visible. After the
+commit, in-process subscribers (the response cache) are notified.
+
+The increment is an upsert, so the first writers of a table race safely to
+create its row. The cost of bumping inside the transaction is that every
+write transaction holds the row lock of each table it wrote until it
+commits: writers to the same table are serialized on that row for the
+final part of their commit. That keeps versions and data atomic (a version
+is never visible before its data, nor lost if a worker dies after
+committing), and write transactions here are short.
+
+``conditional_get(tables)`` turns those versions into a strong ``ETag`` and
+``Last-Modified`` for a view and answers ``If-None-Match`` /
+``If-Modified-Since`` with 304 after a single primary-key lookup on
+``data_version``, without running the view or touching the main tables.
+``request_versions`` keeps that lookup for the rest of the request, so a
+response cache below it can key its entries on the same versions without a
+second query (``known_versions``).
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.models.user import db, DataVersion
+from src.services.upsert import increment
+
+VERSION_TABLE = DataVersion.__tablename__
+
+_subscribers = []
+
+
+def subscribe(callback):
+    """Call ``callback(table_names)`` after each commit that wrote tables"""
+    _subscribers.append(callback)
+
+def _changed_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+def _track(session, table):
+    if table is not None and table.name != VERSION_TABLE:
+        _changed_tables(session).add(table.name)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        _track(session, getattr(obj, '__table__', None))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _track(orm_execute_state.session, getattr(orm_execute_state.statement, 'table', None))
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_versions(session):
+    # Pending ORM changes are only flushed after before_commit, so flush
+    # now to learn every table this transaction touches
+    session.flush()
+    changed = session.info.get('changed_tables')
+    if not changed:
+        return
+
+    # One upsert per table, in name order so concurrent writers lock the
+    # rows in the same order
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    for name in sorted(changed):
+        increment(table, {'table_name': name}, {'version': 1}, session=session, updated_at=now)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_subscribers(session):
+    changed = session.info.pop('changed_tables', None)
+    if changed:
+        for callback in _subscribers:
+            callback(changed)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    session.info.pop('changed_tables', None)
+
+
+def current_versions(tables):
+    """{table: (version, updated_at)} for the given tables in one query"""
+    rows = db.session.query(DataVersion.table_name, DataVersion.version, DataVersion.updated_at).filter(
+        DataVersion.table_name.in_(tables)
+    ).all()
+    return {row.table_name: (row.version, row.updated_at) for row in rows}
+
+
+def request_versions(tables):
+    """``current_versions`` read once per request for each set of tables"""
+    tables = tuple(tables)
+    cached = g.setdefault('data_versions', {})
+    if tables not in cached:
+        cached[tables] = current_versions(tables)
+    return cached[tables]
+
+
+def known_versions(tables):
+    """Versions this request already read with ``request_versions``, or None"""
+    return g.get('data_versions', {}).get(tuple(tables))
+
+
+def conditional_get(tables):
+    """Decorator adding ETag/Last-Modified and 304 responses to a GET view"""
+    tables = tuple(tables)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = request_versions(tables)
+            fingerprint = '|'.join(
+                [request.full_path] + [f'{table}:{versions.get(table, (0, None))[0]}' for table in tables]
+            )
+            etag = hashlib.sha1(fingerprint.encode()).hexdigest()
+            modified = [updated_at for _, updated_at in versions.values() if updated_at]
+            last_modified = max(modified).replace(microsecond=0) if modified else None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(since and last_modified and last_modified <= since.replace(tzinfo=None))
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,301 @@
+"""Downhole desurvey: measured depths along a hole to 3D coordinates.
+
+A hole's trajectory starts at the collar (``location_x``, ``location_y``,
+``elevation``) with the collar ``azimuth``/``dip`` and continues through its
+``DownholeSurvey`` stations. Azimuth is degrees clockwise from grid north and
+dip is degrees from horizontal, negative downwards; a missing dip is treated
+as vertical and a missing azimuth as north.
+
+Two methods are supported, both vectorized over all requested depths:
+
+* ``tangent`` - each survey segment is straight along the orientation at its
+  top station (the only option for a hole with no survey stations);
+* ``minimum_curvature`` - each segment is a circular arc between the two
+  station directions, the default once survey stations exist. Points inside a
+  segment are placed on the arc itself (slerp of the end directions).
+
+Below the last station the hole continues straight along its last direction.
+Desurveyed holes are cached per hole and reused while the ``drill_hole``,
+``downhole_survey``, ``core_run`` and ``core_interval`` data versions are
+unchanged, so any committed change to a collar, a survey or a depth
+invalidates them.
+"""
+import threading
+
+import numpy as np
+from sqlalchemy import select
+
+from src.models.user import db, DrillHole, DownholeSurvey, CoreRun, CoreInterval
+from src.services.cache import MemoryBackend
+from src.services.data_versions import current_versions
+
+METHODS = ('tangent', 'minimum_curvature')
+DEFAULT_DIP = -90.0
+DEFAULT_AZIMUTH = 0.0
+DEFAULT_CACHE_ENTRIES = 4096
+
+TRAJECTORY_TABLES = ('drill_hole', 'downhole_survey')
+DESURVEY_TABLES = TRAJECTORY_TABLES + ('core_run', 'core_interval')
+
+
+def direction_vectors(azimuth, dip):
+    """Unit (east, north, up) vectors for azimuth/dip arrays in degrees"""
+    azimuth = np.radians(np.nan_to_num(np.asarray(azimuth, dtype=float), nan=DEFAULT_AZIMUTH))
+    dip = np.radians(np.nan_to_num(np.asarray(dip, dtype=float), nan=DEFAULT_DIP))
+    horizontal = np.cos(dip)
+    return np.column_stack((horizontal * np.sin(azimuth), horizontal * np.cos(azimuth), np.sin(dip)))
+
+
+def _ratio_factor(dogleg):
+    """Minimum curvature ratio factor 2/b * tan(b/2), 1 for straight segments"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        factor = 2.0 / dogleg * np.tan(dogleg / 2.0)
+    return np.where(dogleg > 1e-9, factor, 1.0)
+
+
+def _slerp(start, end, dogleg, fraction):
+    """Directions a ``fraction`` of the way along each arc from start to end"""
+    sin_dogleg = np.sin(dogleg)
+    curved = sin_dogleg > 1e-9
+    safe = np.where(curved, sin_dogleg, 1.0)
+    weight_start = np.where(curved, np.sin((1 - fraction) * dogleg) / safe, 1 - fraction)
+    weight_end = np.where(curved, np.sin(fraction * dogleg) / safe, fraction)
+    direction = weight_start[:, None] * start + weight_end[:, None] * end
+    return direction / np.linalg.norm(direction, axis=1)[:, None]
+
+
+class Trajectory:
+    """Station depths, directions and positions of one hole"""
+
+    def __init__(self, collar, depths, azimuths, dips, method=None):
+        depths = np.asarray(depths, dtype=float)
+        if method is None:
+            method = 'minimum_curvature' if len(depths) > 1 else 'tangent'
+        if method not in METHODS:
+            raise ValueError(f'method must be one of {", ".join(METHODS)}')
+
+        self.method = method
+        self.collar = np.array([np.nan if value is None else value for value in collar], dtype=float)
+        self.depths = depths
+        self.directions = direction_vectors(azimuths, dips)
+
+        lengths = np.diff(depths)
+        start, end = self.directions[:-1], self.directions[1:]
+        if method == 'tangent':
+            self.doglegs = np.zeros(len(lengths))
+            steps = lengths[:, None] * start
+        else:
+            self.doglegs = np.arccos(np.clip(np.einsum('ij,ij->i', start, end), -1.0, 1.0))
+            steps = (lengths * _ratio_factor(self.doglegs) / 2.0)[:, None] * (start + end)
+        self.positions = self.collar + np.vstack((np.zeros((1, 3)), np.cumsum(steps, axis=0)))
+
+    @classmethod
+    def for_hole(cls, hole, surveys, method=None):
+        """Build from a collar row and its (depth, azimuth, dip) survey rows"""
+        stations = [(depth, azimuth, dip) for depth, azimuth, dip in surveys if depth is not None and depth > 0]
+        first = surveys[0] if surveys and surveys[0][0] == 0 else (0.0, hole.azimuth, hole.dip)
+        depths, azimuths, dips = zip(first, *sorted(stations))
+        collar = (hole.location_x, hole.location_y, hole.elevation)
+        return cls(collar, depths, [np.nan if a is None else a for a in azimuths],
+                   [np.nan if d is None else d for d in dips], method=method if surveys else 'tangent')
+
+    def locate(self, depths):
+        """(n, 3) easting/northing/elevation of each measured depth"""
+        depths = np.asarray(depths, dtype=float)
+        segment = np.clip(np.searchsorted(self.depths, depths, side='right') - 1, 0, len(self.depths) - 1)
+        along = depths - self.depths[segment]
+        origin = self.positions[segment]
+        start = self.directions[segment]
+
+        # Straight along the top direction: the tangent method, and every
+        # depth past the last station
+        located = origin + along[:, None] * start
+        inside = segment < len(self.depths) - 1
+        if self.method == 'tangent' or not inside.any():
+            return located
+
+        index = np.nonzero(inside)[0]
+        seg = segment[index]
+        length = self.depths[seg + 1] - self.depths[seg]
+        fraction = np.clip(along[index] / length, 0.0, 1.0)
+        dogleg = self.doglegs[seg]
+        direction = _slerp(start[index], self.directions[seg + 1], dogleg, fraction)
+        step = (fraction * length * _ratio_factor(fraction * dogleg) / 2.0)[:, None] * (start[index] + direction)
+        located[index] = origin[index] + step
+        return located
+
+    def stations(self):
+        return [{
+            'depth': float(depth),
+            'x': _number(x), 'y': _number(y), 'z': _number(z)
+        } for depth, (x, y, z) in zip(self.depths, self.positions)]
+
+
+def _number(value):
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def _rounded(points):
+    """Nested lists of rounded coordinates with NaN as None"""
+    values = np.round(points, 4).tolist()
+    if np.isnan(points).any():
+        return [[None if value != value else value for value in row] for row in values]
+    return values
+
+
+def load_trajectories(hole_ids, method=None, connection=None):
+    """{hole id: Trajectory} for many holes with two queries.
+
+    Runs on ``connection`` when given, otherwise on the session.
+    """
+    executor = connection if connection is not None else db.session
+    holes = executor.execute(select(
+        DrillHole.id, DrillHole.location_x, DrillHole.location_y, DrillHole.elevation,
+        DrillHole.azimuth, DrillHole.dip
+    ).where(DrillHole.id.in_(hole_ids))).all()
+
+    surveys = {}
+    for drill_hole_id, depth, azimuth, dip in executor.execute(select(
+        DownholeSurvey.drill_hole_id, DownholeSurvey.depth, DownholeSurvey.azimuth, DownholeSurvey.dip
+    ).where(DownholeSurvey.drill_hole_id.in_(hole_ids)).order_by(
+        DownholeSurvey.drill_hole_id, DownholeSurvey.depth
+    )):
+        surveys.setdefault(drill_hole_id, []).append((depth, azimuth, dip))
+
+    return {hole.id: Trajectory.for_hole(hole, surveys.get(hole.id, []), method) for hole in holes}
+
+
+def coordinate_columns(prefix, points):
+    """{prefix_x, prefix_y, prefix_z: lists} for an (n, 3) array"""
+    return {f'{prefix}_{axis}': values for axis, values in zip('xyz', _rounded(points.T))}
+
+
+def _desurvey_rows(trajectory, rows, key_names):
+    """Add from/to/mid coordinates to rows of (*keys, from_depth, to_depth)"""
+    if not rows:
+        return []
+    from_depths = np.array([row[-2] for row in rows], dtype=float)
+    to_depths = np.array([row[-1] for row in rows], dtype=float)
+    located = trajectory.locate(np.concatenate((from_depths, to_depths, (from_depths + to_depths) / 2)))
+    count = len(rows)
+    columns = {}
+    for prefix, block in (('from', located[:count]), ('to', located[count:2 * count]), ('mid', located[2 * count:])):
+        columns.update(coordinate_columns(prefix, block))
+
+    results = []
+    for i, row in enumerate(rows):
+        item = dict(zip(key_names, row[:-2]))
+        item['from_depth'] = row[-2]
+        item['to_depth'] = row[-1]
+        for name, values in columns.items():
+            item[name] = values[i]
+        results.append(item)
+    return results
+
+
+_desurveyed = MemoryBackend(DEFAULT_CACHE_ENTRIES)
+_lock = threading.Lock()
+
+
+def desurvey_hole(drill_hole_id, method=None):
+    """Coordinates of every run and interval of a hole, cached per hole"""
+    versions = current_versions(DESURVEY_TABLES)
+    signature = tuple(versions.get(table, (0,))[0] for table in DESURVEY_TABLES)
+    key = (str(db.engine.url), drill_hole_id, method)
+
+    cached = _desurveyed.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    trajectories = load_trajectories([drill_hole_id], method)
+    if drill_hole_id not in trajectories:
+        return None
+    trajectory = trajectories[drill_hole_id]
+
+    runs = db.session.query(
+        CoreRun.id, CoreRun.run_number, CoreRun.from_depth, CoreRun.to_depth
+    ).filter(CoreRun.drill_hole_id == drill_hole_id).order_by(CoreRun.from_depth, CoreRun.id).all()
+    intervals = db.session.query(
+        CoreInterval.id, CoreInterval.core_run_id, CoreInterval.from_depth, CoreInterval.to_depth
+    ).join(CoreRun, CoreInterval.core_run_id == CoreRun.id).filter(
+        CoreRun.drill_hole_id == drill_hole_id
+    ).order_by(CoreInterval.from_depth, CoreInterval.id).all()
+
+    result = {
+        'drill_hole_id': drill_hole_id,
+        'method': trajectory.method,
+        'stations': trajectory.stations(),
+        'runs': _desurvey_rows(trajectory, runs, ('id', 'run_number')),
+        'intervals': _desurvey_rows(trajectory, intervals, ('id', 'core_run_id')),
+    }
+    with _lock:
+        _desurveyed.set(key, (signature, result))
+    return result
+
+
+class TrajectoryCache:
+    """Trajectories for an export, loaded in batches of holes.
+
+    Batches are read on a separate pooled connection: the session's
+    connection is busy with the export's server-side cursor, and a query
+    issued on it would first drain (pymysql) or reject (mysqlclient,
+    "Commands out of sync") the rest of the open result.
+    """
+
+    def __init__(self, method=None):
+        self.method = method
+        versions = current_versions(TRAJECTORY_TABLES)
+        self.signature = tuple(versions.get(table, (0,))[0] for table in TRAJECTORY_TABLES)
+        self.url = str(db.engine.url)
+
+    def get_many(self, hole_ids):
+        found = {}
+        missing = []
+        for hole_id in hole_ids:
+            cached = _desurveyed.get((self.url, 'trajectory', hole_id, self.method))
+            if cached is not None and cached[0] == self.signature:
+                found[hole_id] = cached[1]
+            else:
+                missing.append(hole_id)
+        if missing:
+            with db.engine.connect() as connection:
+                loaded = load_trajectories(missing, self.method, connection)
+            with _lock:
+                for hole_id, trajectory in loaded.items():
+                    _desurveyed.set((self.url, 'trajectory', hole_id, self.method), (self.signature, trajectory))
+            found.update(loaded)
+        return found
+
+
+def with_midpoint_coordinates(rows, hole_index, from_index, to_index, chunk_size=2000, method=None):
+    """Append MID_X/MID_Y/MID_Z to streamed rows, desurveying a chunk at a time.
+
+    ``rows`` carry the hole's primary key at ``hole_index``; that column is
+    dropped from the output. Trajectories for each chunk's holes are loaded
+    with two queries and reused from the cache across exports.
+    """
+    trajectories = TrajectoryCache(method)
+    chunk = []
+
+    def flush(chunk):
+        hole_ids = np.array([row[hole_index] for row in chunk])
+        depths = np.array([
+            (row[from_index] + row[to_index]) / 2
+            if row[from_index] is not None and row[to_index] is not None else np.nan
+            for row in chunk
+        ], dtype=float)
+        located = np.full((len(chunk), 3), np.nan)
+        found = trajectories.get_many(np.unique(hole_ids).tolist())
+        for hole_id, trajectory in found.items():
+            mask = hole_ids == hole_id
+            located[mask] = trajectory.locate(depths[mask])
+        for row, point in zip(chunk, _rounded(located)):
+            yield [*row[:hole_index], *row[hole_index + 1:], *point]
+
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from flush(chunk)
+            chunk = []
+    if chunk:
+        yield from flush(chunk)
@@ -0,0 +1,228 @@
+"""On-disk cache of generated export files, keyed by data version.
+
+An export file is stored under ``EXPORT_DIR`` (by default ``exports`` in the
+application's instance folder) as ``<key>.csv``, where the key hashes the
+database URL, the export type, its filters and the data version and last
+write time of every table it reads. A commit that writes one of those
+tables bumps its version, so later requests compute a different key and
+never see the old file; files are therefore immutable and safe to share
+between workers. The URL keeps databases sharing a directory apart, and the
+write times keep a database recreated at the same URL, whose counters start
+again from zero, from matching files of the old one.
+
+The synchronous export endpoints go through ``cached_export_response``:
+
+* hit - the file is served by ``send_file`` (``wsgi.file_wrapper``, i.e.
+  ``sendfile`` under gunicorn) with the key as a strong ``ETag``, so
+  ``Range`` / ``If-Range`` requests resume interrupted downloads;
+* miss - the CSV is streamed as before while being written to a temporary
+  file beside the cache, which is renamed into place only once the export
+  completes (an interrupted download leaves nothing behind).
+
+Background export jobs write their files into the same cache. With
+``EXPORT_CACHE_DISABLED`` the synchronous endpoints stream straight from the
+database again, as the query-count check and export benchmarks need.
+
+The cache is bounded by ``EXPORT_CACHE_MAX_BYTES``: after each store the
+least recently used files are deleted until it fits. Recency is each file's
+access time, set explicitly on every hit, so it is shared by all workers
+and does not depend on ``noatime`` mounts. Hit, miss, store, eviction and
+byte counters are kept per process and reported by ``to_dict``.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from flask import Response, current_app, send_file, stream_with_context
+
+from src.models.user import db
+from src.services.data_versions import current_versions
+from src.services.streaming import (
+    drill_hole_csv_export, export_filename, export_response, export_rows, interval_csv_export, iter_csv,
+    leapfrog_csv_export, qaqc_csv_export
+)
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+EXTENSION = '.csv'
+
+ExportType = namedtuple('ExportType', ['build', 'tables', 'params'])
+
+INTERVAL_TABLES = ('drill_hole', 'core_run', 'core_interval', 'downhole_survey')
+EXPORT_TYPES = {
+    'intervals': ExportType(interval_csv_export, INTERVAL_TABLES, ('drill_hole_id', 'project_name', 'coordinates')),
+    'leapfrog': ExportType(leapfrog_csv_export, INTERVAL_TABLES, ('drill_hole_id', 'project_name', 'coordinates')),
+    'drill_holes': ExportType(drill_hole_csv_export, ('drill_hole',), ('project_name',)),
+    'qaqc': ExportType(qaqc_csv_export, ('qaqc_items',), ()),
+}
+
+
+def export_params(export_type, drill_hole_id=None, project_name=None, coordinates=False):
+    """The filters an export type accepts, with unset ones left out"""
+    values = {'drill_hole_id': drill_hole_id, 'project_name': project_name or None, 'coordinates': bool(coordinates)}
+    return {name: values[name] for name in EXPORT_TYPES[export_type].params if values[name]}
+
+
+def data_versions(export_type):
+    """The data versions and write times of the tables an export reads, as a JSON list"""
+    tables = EXPORT_TYPES[export_type].tables
+    versions = current_versions(tables)
+    return json.dumps([
+        [version, updated_at.isoformat() if updated_at else None]
+        for version, updated_at in (versions.get(table, (0, None)) for table in tables)
+    ])
+
+
+def artifact_key(export_type, params, versions):
+    identity = [str(db.engine.url), export_type, params, versions]
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+
+class ExportCache:
+    """Size-bounded LRU directory of finished export files"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'bytes_served': 0}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure from the EXPORT_DIR and EXPORT_CACHE_MAX_BYTES settings"""
+        self.directory = app.config.get('EXPORT_DIR') or os.path.join(app.instance_path, 'exports')
+        self.max_bytes = app.config.get('EXPORT_CACHE_MAX_BYTES', self.max_bytes)
+        app.extensions['export_cache'] = self
+
+    def record(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def path(self, key):
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def get(self, key):
+        """Path of the cached file for ``key``, marked as just used, or None"""
+        path = self.path(key)
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def serve(self, key, download_name):
+        """``send_file`` response for a cached file (Range aware), or None"""
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            response = send_file(path, mimetype='text/csv', as_attachment=True, download_name=download_name,
+                                 conditional=True, etag=key, max_age=0)
+        except FileNotFoundError:
+            return None  # evicted since the lookup
+        if response.status_code in (200, 206):
+            self.record('bytes_served', response.content_length or 0)
+        return response
+
+    def write(self, key, chunks):
+        """Consume CSV text chunks into the cache file for ``key``, returning its path"""
+        for _ in self.store(key, chunks):
+            pass
+        return self.path(key)
+
+    def store(self, key, chunks):
+        """Pass CSV text chunks through while writing them to the cache.
+
+        The file only appears under its key once every chunk was written;
+        if the consumer stops early the partial file is discarded.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        handle, partial_path = tempfile.mkstemp(prefix=key[:16], suffix='.part', dir=self.directory)
+        try:
+            with open(handle, 'w', newline='', encoding='utf-8') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+                    yield chunk
+            os.replace(partial_path, self.path(key))
+            self.record('stores')
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        self.evict(keep=key)
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as found:
+            for entry in found:
+                if entry.name.endswith(EXTENSION):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # evicted by another worker
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self, keep=None):
+        """Delete least recently used files until the cache fits ``max_bytes``"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        kept = self.path(keep) if keep else None
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == kept:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            self.record('evictions')
+
+    def to_dict(self):
+        entries = self._entries() if os.path.isdir(self.directory) else []
+        total = self.stats['hits'] + self.stats['misses']
+        return dict(
+            self.stats,
+            entries=len(entries),
+            size_bytes=sum(size for _, size, _ in entries),
+            max_bytes=self.max_bytes,
+            hit_rate=round(self.stats['hits'] / total * 100, 2) if total else 0
+        )
+
+
+export_cache = ExportCache()
+
+
+def _count_bytes(cache, chunks):
+    for chunk in chunks:
+        cache.record('bytes_served', len(chunk.encode('utf-8')))
+        yield chunk
+
+
+def cached_export_response(export_type, **filters):
+    """Serve an export from the cache, or stream it while caching it"""
+    params = export_params(export_type, **filters)
+    export = EXPORT_TYPES[export_type].build(**params)
+    if current_app.config.get('EXPORT_CACHE_DISABLED'):
+        return export_response(export)
+
+    cache = current_app.extensions.get('export_cache', export_cache)
+    key = artifact_key(export_type, params, data_versions(export_type))
+    filename = export_filename(export.filename_prefix)
+
+    response = cache.serve(key, filename)
+    if response is not None:
+        cache.record('hits')
+        response.headers['X-Export-Cache'] = 'HIT'
+        return response
+
+    cache.record('misses')
+    chunks = cache.store(key, iter_csv(export.header, export_rows(export), export.row_formatter))
+    return Response(
+        stream_with_context(_count_bytes(cache, chunks)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}', 'X-Export-Cache': 'MISS'}
+    )
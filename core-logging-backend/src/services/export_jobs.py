@@ -0,0 +1,232 @@
+"""Background export jobs with progress, persisted files and re-download.
+
+Large exports hold a request worker for minutes and run into proxy
+timeouts when streamed synchronously. ``submit_export`` records an
+``ExportJob`` and hands it to a small per-process thread pool
+(``EXPORT_WORKERS``). The worker writes exactly the CSV the synchronous
+endpoint would stream into the export file cache
+(``src.services.export_cache``), or finds it already there. While it runs,
+the job row carries the rows written so far, the expected total (one
+``COUNT`` over the export query) and an ETA from the rate so far. Progress
+goes through its own short transactions, at most once per
+``PROGRESS_INTERVAL``, so the export's server-side cursor is never
+disturbed. SQLite cannot commit while that cursor is open, so there the
+progress is only seen by status requests served by the same process.
+
+Jobs are identified by a hash of their type and filters. Submitting a
+request identical to a queued or running job returns that job. One
+identical to a completed job returns the finished job without rebuilding,
+as long as its file still exists and its source tables are still at the
+data versions it was built from. Active jobs that have reported nothing for
+``EXPORT_JOB_STALE_SECONDS`` (their worker died) are marked failed and
+replaced.
+
+The lookup alone cannot keep two gunicorn workers from queueing the same
+request at once, so an active job also holds its key in the unique
+``active_key`` column until it finishes. The second insert fails on that
+index, and its submitter returns the job that won instead.
+
+Finished files are served from the cache by ``send_file``, which hands the
+open file to the WSGI server's ``wsgi.file_wrapper`` (``sendfile`` under
+gunicorn) and answers ``Range`` requests.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db, ExportJob
+from src.services.export_cache import EXPORT_TYPES, artifact_key, data_versions, export_cache
+from src.services.streaming import export_filename, export_rows, iter_csv
+
+DEFAULT_WORKERS = 2
+DEFAULT_STALE_SECONDS = 1800
+# Seconds between progress updates of a running job
+PROGRESS_INTERVAL = 1.0
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def request_key(export_type, params):
+    return hashlib.sha256(json.dumps([export_type, params], sort_keys=True).encode()).hexdigest()
+
+
+def _stale_before():
+    stale_seconds = current_app.config.get('EXPORT_JOB_STALE_SECONDS', DEFAULT_STALE_SECONDS)
+    return datetime.utcnow() - timedelta(seconds=stale_seconds)
+
+
+def find_reusable_job(export_type, key):
+    """An active job for the same request, or a completed one still current"""
+    stale_before = _stale_before()
+    versions = None
+    jobs = ExportJob.query.filter(
+        ExportJob.request_key == key, ExportJob.status.in_(ACTIVE_STATUSES + ('completed',))
+    ).order_by(ExportJob.id.desc()).limit(10)
+    for job in jobs:
+        if job.status in ACTIVE_STATUSES:
+            if (job.updated_at or job.created_at) >= stale_before:
+                return job
+            continue
+        if versions is None:
+            versions = data_versions(export_type)
+        if job.data_versions == versions and job.file_path and os.path.exists(job.file_path):
+            return job
+    return None
+
+
+def _release_stale_jobs(key):
+    """Fail active jobs for ``key`` whose worker stopped reporting, freeing the key"""
+    stale_before = _stale_before()
+    table = ExportJob.__table__
+    db.session.execute(table.update().where(
+        table.c.active_key == key,
+        db.func.coalesce(table.c.updated_at, table.c.created_at) < stale_before,
+    ).values(active_key=None, status='failed', last_error='No progress reported', finished_at=datetime.utcnow()))
+
+
+_executors = {}
+_submit_lock = threading.Lock()
+
+
+def _executor(app):
+    with _submit_lock:
+        executor = _executors.get(id(app))
+        if executor is None:
+            executor = _executors[id(app)] = ThreadPoolExecutor(
+                max_workers=app.config.get('EXPORT_WORKERS', DEFAULT_WORKERS), thread_name_prefix='export'
+            )
+    return executor
+
+
+def submit_export(export_type, params):
+    """Queue an export, or return the job already answering the same request.
+
+    Returns (job, reused).
+    """
+    key = request_key(export_type, params)
+    app = current_app._get_current_object()
+    with _submit_lock:
+        job = find_reusable_job(export_type, key)
+        if job is not None:
+            return job, True
+        _release_stale_jobs(key)
+        job = ExportJob(export_type=export_type, params=json.dumps(params, sort_keys=True), request_key=key,
+                        active_key=key, status='queued')
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another process queued the same request since the lookup
+            db.session.rollback()
+            job = find_reusable_job(export_type, key)
+            if job is None:
+                raise
+            return job, True
+        job_id = job.id
+    _executor(app).submit(_work, app, job_id)
+    return job, False
+
+
+def _work(app, job_id):
+    with app.app_context():
+        try:
+            run_export_job(db.session.get(ExportJob, job_id))
+        except Exception:
+            app.logger.exception('Export job %s failed', job_id)
+
+
+_running = {}  # job id -> _Progress of jobs building in this process
+
+
+class _Progress:
+    """Counts rows as they are written and records them on the job row"""
+
+    def __init__(self, job_id, interval=PROGRESS_INTERVAL):
+        self.job_id = job_id
+        self.interval = interval
+        self.rows = 0
+        self.reported_at = time.monotonic()
+        self.shared = db.engine.dialect.name != 'sqlite'
+
+    def count(self, rows):
+        for row in rows:
+            self.rows += 1
+            if not self.rows % 1000 and time.monotonic() - self.reported_at >= self.interval:
+                self.report()
+            yield row
+
+    def report(self):
+        self.reported_at = time.monotonic()
+        if not self.shared:
+            return
+        # Separate connection and transaction: the session is busy with the
+        # export cursor
+        table = ExportJob.__table__
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(table.update().where(table.c.id == self.job_id).values(
+                    rows_processed=self.rows, updated_at=datetime.utcnow()
+                ))
+        except Exception:
+            current_app.logger.warning('Could not record progress of export job %s', self.job_id, exc_info=True)
+
+
+def job_to_dict(job):
+    """``job.to_dict()`` with the live row count of a job building in this process"""
+    progress = _running.get(job.id)
+    return job.to_dict(rows_processed=progress.rows if progress is not None else None)
+
+
+def download_response(job):
+    """The finished file of a completed job, or None once it was evicted"""
+    cache = current_app.extensions.get('export_cache', export_cache)
+    key = artifact_key(job.export_type, json.loads(job.params or '{}'), job.data_versions)
+    return cache.serve(key, job.filename)
+
+
+def run_export_job(job):
+    """Build the job's file, recording progress, and mark it completed"""
+    export_type = EXPORT_TYPES[job.export_type]
+    try:
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        job.data_versions = data_versions(job.export_type)
+        params = json.loads(job.params or '{}')
+        export = export_type.build(**params)
+        job.total_rows = export.query.order_by(None).count()
+        job.filename = export_filename(export.filename_prefix)
+        db.session.commit()
+
+        cache = current_app.extensions.get('export_cache', export_cache)
+        key = artifact_key(job.export_type, params, job.data_versions)
+        path = cache.get(key)
+        if path is None:
+            progress = _running[job.id] = _Progress(job.id)
+            rows = progress.count(export_rows(export))
+            path = cache.write(key, iter_csv(export.header, rows, export.row_formatter))
+            job.rows_processed = progress.rows
+        else:
+            job.rows_processed = job.total_rows
+        job.file_path = path
+        job.file_size = os.path.getsize(path)
+        job.status = 'completed'
+        job.active_key = None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.active_key = None
+        job.last_error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        raise
+    finally:
+        _running.pop(job.id, None)
+    return job
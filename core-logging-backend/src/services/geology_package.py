@@ -0,0 +1,226 @@
+"""Multi-table geology package export, streamed as a ZIP.
+
+Leapfrog, Micromine and Datamine import drill holes as separate tables
+joined on the hole id instead of one flat interval file. The package holds:
+
+* ``collar.csv`` - one row per ``DrillHole``;
+* ``survey.csv`` - the collar orientation as a station at depth 0 followed by
+  the ``DownholeSurvey`` stations, with missing azimuth/dip filled the way
+  the desurvey engine reads them;
+* ``lithology.csv``, ``alteration.csv``, ``mineralization.csv``,
+  ``structure.csv`` and ``geotech.csv`` - the matching ``CoreInterval``
+  columns. Lithology lists every interval; the other tables only intervals
+  with at least one of their attributes logged.
+
+Each table is read by its own server-side cursor on a thread pool worker
+(``PACKAGE_EXPORT_WORKERS``) with its own app context, session and
+connection, and written to a spooled temporary file (SQLite serializes
+concurrent scans, so there the tables are built one after another). The
+response starts as soon as the request arrives: tables are copied into the
+ZIP in package order as each finishes, while the rest are still being built,
+and the ZIP itself is written to an unseekable sink whose bytes are sent as
+they are produced, so nothing is held in memory beyond a spool buffer per
+table.
+"""
+import csv
+import tempfile
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response, current_app
+from sqlalchemy import literal, or_, select, union_all
+
+from src.models.user import db, DrillHole, DownholeSurvey, CoreInterval
+from src.services.desurvey import DEFAULT_AZIMUTH, DEFAULT_DIP
+from src.services.streaming import DEFAULT_BATCH_SIZE, ChunkSink, export_filename, interval_export_query
+
+DEFAULT_WORKERS = 4
+# Table CSV kept in memory before the spool file moves to disk
+SPOOL_BYTES = 8 * 1024 * 1024
+COPY_CHARS = 1024 * 1024
+COMPRESSION_LEVEL = 6
+
+PackageTable = namedtuple('PackageTable', ['name', 'columns', 'query'])
+
+COLLAR_COLUMNS = [
+    ('HOLEID', DrillHole.hole_id),
+    ('EAST', DrillHole.location_x),
+    ('NORTH', DrillHole.location_y),
+    ('RL', DrillHole.elevation),
+    ('MAX_DEPTH', DrillHole.total_depth),
+    ('AZIMUTH', DrillHole.azimuth),
+    ('DIP', DrillHole.dip),
+    ('PROJECT', DrillHole.project_name),
+    ('START_DATE', DrillHole.start_date),
+    ('END_DATE', DrillHole.end_date),
+    ('COMPANY', DrillHole.drilling_company),
+]
+
+SURVEY_HEADER = ['HOLEID', 'DEPTH', 'AZIMUTH', 'DIP']
+
+LITHOLOGY_COLUMNS = [
+    ('LITHOLOGY', CoreInterval.lithology),
+    ('LITH_CODE', CoreInterval.lithology_code),
+    ('ROCK_TYPE', CoreInterval.rock_type),
+    ('COLOUR', CoreInterval.color),
+    ('GRAIN_SIZE', CoreInterval.grain_size),
+    ('TEXTURE', CoreInterval.texture),
+]
+
+ALTERATION_COLUMNS = [
+    ('ALTERATION', CoreInterval.alteration_type),
+    ('INTENSITY', CoreInterval.alteration_intensity),
+    ('STYLE', CoreInterval.alteration_style),
+]
+
+MINERALIZATION_COLUMNS = [
+    ('MINERALIZATION', CoreInterval.mineralization_type),
+    ('STYLE', CoreInterval.mineralization_style),
+    ('ABUNDANCE', CoreInterval.mineral_abundance),
+    ('ORE_MINERALS', CoreInterval.ore_minerals),
+]
+
+STRUCTURE_COLUMNS = [
+    ('FRACTURE_FREQ', CoreInterval.fracture_frequency),
+    ('FRACTURE_ORIENT', CoreInterval.fracture_orientation),
+    ('BEDDING_ORIENT', CoreInterval.bedding_orientation),
+    ('FOLIATION_ORIENT', CoreInterval.foliation_orientation),
+    ('STRUCTURE', CoreInterval.structural_features),
+]
+
+GEOTECH_COLUMNS = [
+    ('RECOVERY', CoreInterval.recovery_percentage),
+    ('RQD', CoreInterval.rqd_contribution),
+    ('FRACTURE_FREQ', CoreInterval.fracture_frequency),
+    ('ROCK_STRENGTH', CoreInterval.rock_strength),
+    ('WEATHERING', CoreInterval.weathering_grade),
+]
+
+
+def _hole_filter(query, drill_hole_id=None, project_name=None):
+    if drill_hole_id:
+        query = query.filter(DrillHole.id == drill_hole_id)
+    if project_name:
+        query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
+    return query
+
+
+def collar_query(drill_hole_id=None, project_name=None):
+    query = db.session.query(*[column for _, column in COLLAR_COLUMNS])
+    return _hole_filter(query, drill_hole_id, project_name).order_by(DrillHole.hole_id)
+
+
+def survey_query(drill_hole_id=None, project_name=None):
+    """Collar station at depth 0 (unless surveyed there) plus every survey station"""
+    surveyed_at_collar = select(DownholeSurvey.id).where(
+        DownholeSurvey.drill_hole_id == DrillHole.id, DownholeSurvey.depth == 0
+    ).exists()
+    collar = _hole_filter(db.session.query(
+        DrillHole.hole_id.label('hole_id'),
+        literal(0.0).label('depth'),
+        db.func.coalesce(DrillHole.azimuth, DEFAULT_AZIMUTH).label('azimuth'),
+        db.func.coalesce(DrillHole.dip, DEFAULT_DIP).label('dip')
+    ).filter(~surveyed_at_collar), drill_hole_id, project_name)
+    stations = _hole_filter(db.session.query(
+        DrillHole.hole_id,
+        DownholeSurvey.depth,
+        db.func.coalesce(DownholeSurvey.azimuth, DEFAULT_AZIMUTH),
+        db.func.coalesce(DownholeSurvey.dip, DEFAULT_DIP)
+    ).select_from(DownholeSurvey).join(DrillHole, DownholeSurvey.drill_hole_id == DrillHole.id),
+        drill_hole_id, project_name)
+    combined = union_all(collar.statement, stations.statement).subquery()
+    return db.session.query(combined).order_by(combined.c.hole_id, combined.c.depth)
+
+
+def _interval_table(columns, logged_only=True):
+    def build(drill_hole_id=None, project_name=None):
+        selected = [DrillHole.hole_id, CoreInterval.from_depth, CoreInterval.to_depth]
+        selected += [column for _, column in columns]
+        query = interval_export_query(selected, drill_hole_id=drill_hole_id, project_name=project_name)
+        if logged_only:
+            query = query.filter(or_(*[column.isnot(None) for _, column in columns]))
+        return query
+    return build
+
+
+TABLES = [
+    PackageTable('collar', [header for header, _ in COLLAR_COLUMNS], collar_query),
+    PackageTable('survey', SURVEY_HEADER, survey_query),
+    PackageTable('lithology', ['HOLEID', 'FROM', 'TO'] + [header for header, _ in LITHOLOGY_COLUMNS],
+                 _interval_table(LITHOLOGY_COLUMNS, logged_only=False)),
+    PackageTable('alteration', ['HOLEID', 'FROM', 'TO'] + [header for header, _ in ALTERATION_COLUMNS],
+                 _interval_table(ALTERATION_COLUMNS)),
+    PackageTable('mineralization', ['HOLEID', 'FROM', 'TO'] + [header for header, _ in MINERALIZATION_COLUMNS],
+                 _interval_table(MINERALIZATION_COLUMNS)),
+    PackageTable('structure', ['HOLEID', 'FROM', 'TO'] + [header for header, _ in STRUCTURE_COLUMNS],
+                 _interval_table(STRUCTURE_COLUMNS)),
+    PackageTable('geotech', ['HOLEID', 'FROM', 'TO'] + [header for header, _ in GEOTECH_COLUMNS],
+                 _interval_table(GEOTECH_COLUMNS)),
+]
+
+
+def build_table(app, table, filters, batch_size=DEFAULT_BATCH_SIZE):
+    """Write one package table to a spooled temporary file, rewound for reading"""
+    with app.app_context():
+        statement = table.query(**filters).statement.execution_options(yield_per=batch_size)
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode='w+', newline='', encoding='utf-8')
+        try:
+            writer = csv.writer(output)
+            writer.writerow(table.columns)
+            # Core rows, a batch per writerows call: no ORM row processing
+            for rows in db.session.connection().execute(statement).partitions():
+                writer.writerows(rows)
+        except BaseException:
+            output.close()
+            raise
+        output.seek(0)
+        return output
+
+
+def _close_result(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def iter_package(futures, names):
+    """Yield ZIP bytes, adding each table as its future completes, in order"""
+    sink = ChunkSink()
+    try:
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESSION_LEVEL) as package:
+            for name, future in zip(names, futures):
+                with future.result() as table_file, package.open(f'{name}.csv', 'w', force_zip64=True) as member:
+                    while True:
+                        data = table_file.read(COPY_CHARS)
+                        if not data:
+                            break
+                        member.write(data.encode('utf-8'))
+                        chunk = sink.drain()
+                        if chunk:
+                            yield chunk
+        yield sink.drain()
+    finally:
+        # Client gone or a table failed: drop tables not started and close
+        # the files of the others once they are built
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(_close_result)
+
+
+def package_response(drill_hole_id=None, project_name=None):
+    """Stream the geology package of the selected holes as a ZIP attachment"""
+    app = current_app._get_current_object()
+    filters = {'drill_hole_id': drill_hole_id, 'project_name': project_name}
+    workers = min(app.config.get('PACKAGE_EXPORT_WORKERS', DEFAULT_WORKERS), len(TABLES))
+    if db.engine.dialect.name == 'sqlite':
+        workers = 1  # concurrent scans of one SQLite file only contend
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='package')
+    futures = [executor.submit(build_table, app, table, filters) for table in TABLES]
+    executor.shutdown(wait=False)
+
+    filename = export_filename('geology_package', 'zip')
+    return Response(
+        iter_package(futures, [table.name for table in TABLES]),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
@@ -0,0 +1,218 @@
+"""Streaming, batched and resumable CSV importer.
+
+The upload is decoded incrementally and inserted in batches, with a commit
+and an ``ImportJob`` checkpoint every ``batch_size`` rows. Drill hole and
+core run keys are resolved through in-memory maps (hole_id -> id and
+(hole id, run_number) -> run id) filled once per hole. A failed import can
+be resumed by re-uploading the same file with its ``import_id``: rows up to
+the last checkpoint are skipped without touching the database.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from src.models.user import db, DrillHole, CoreRun, CoreInterval, ImportJob
+from src.services import rollups
+
+DEFAULT_IMPORT_BATCH_SIZE = 1000
+# Errors kept on the checkpoint row; the count keeps going past this
+MAX_STORED_ERRORS = 1000
+
+
+def _float(value):
+    return float(value) if value not in (None, '') else None
+
+
+def _date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class KeyCache:
+    """hole_id -> (id, project) and (hole, run_number) -> run id lookups"""
+
+    def __init__(self):
+        self.holes = {}
+        self.runs = {}
+
+    def hole(self, hole_id):
+        if hole_id not in self.holes:
+            row = db.session.query(DrillHole.id, DrillHole.project_name).filter(
+                DrillHole.hole_id == hole_id
+            ).first()
+            self.holes[hole_id] = tuple(row) if row else None
+            if row:
+                # Load every run of the hole at once instead of one per row
+                for run_number, run_id in db.session.query(CoreRun.run_number, CoreRun.id).filter(
+                    CoreRun.drill_hole_id == row.id
+                ):
+                    self.runs[(row.id, run_number)] = run_id
+        return self.holes[hole_id]
+
+    def run(self, drill_hole_id, run_number):
+        return self.runs.get((drill_hole_id, run_number))
+
+
+def open_upload(file_storage):
+    """Decode an uploaded file incrementally rather than reading it whole"""
+    return io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
+
+
+class CSVImporter:
+    """Imports drill holes or core intervals from a CSV stream"""
+
+    def __init__(self, job, batch_size=DEFAULT_IMPORT_BATCH_SIZE):
+        self.job = job
+        self.batch_size = batch_size
+        self.cache = KeyCache()
+        self.errors = json.loads(job.errors) if job.errors else []
+
+    @classmethod
+    def start(cls, import_type, filename, import_id=None, batch_size=DEFAULT_IMPORT_BATCH_SIZE):
+        """Create a new checkpoint, or reopen an unfinished one to resume"""
+        if import_id is not None:
+            job = db.session.get(ImportJob, import_id)
+            if job is None:
+                raise LookupError(f'Import {import_id} not found')
+            if job.import_type != import_type:
+                raise ValueError(f'Import {import_id} is a {job.import_type} import')
+            job.status = 'running'
+            job.last_error = None
+        else:
+            job = ImportJob(import_type=import_type, filename=filename, status='running')
+            db.session.add(job)
+        db.session.commit()
+        return cls(job, batch_size)
+
+    def _error(self, row_num, message):
+        self.job.error_count += 1
+        if len(self.errors) < MAX_STORED_ERRORS:
+            self.errors.append(f'Row {row_num}: {message}')
+
+    def _checkpoint(self, rows_processed, imported):
+        self.job.rows_processed = rows_processed
+        self.job.imported_count += imported
+        self.job.errors = json.dumps(self.errors)
+        db.session.commit()
+
+    def run(self, text_stream):
+        """Import the stream, committing a checkpoint after every batch"""
+        reader = csv.DictReader(text_stream)
+        handle_batch = self._insert_intervals if self.job.import_type == 'intervals' else self._insert_drill_holes
+        resume_after = self.job.rows_processed
+
+        batch = []
+        rows_seen = 0
+        try:
+            for row_num, row in enumerate(reader, start=2):
+                rows_seen += 1
+                if rows_seen <= resume_after:
+                    continue
+                batch.append((row_num, row))
+                if len(batch) >= self.batch_size:
+                    self._checkpoint(rows_seen, handle_batch(batch))
+                    batch = []
+            if batch:
+                self._checkpoint(rows_seen, handle_batch(batch))
+        except Exception as e:
+            db.session.rollback()
+            self.job.status = 'failed'
+            self.job.last_error = str(e)
+            db.session.commit()
+            raise
+
+        self.job.status = 'completed'
+        db.session.commit()
+        return self.job
+
+    def _insert_intervals(self, batch):
+        rows = []
+        intervals_per_hole = {}
+        for row_num, row in batch:
+            try:
+                hole = self.cache.hole(row['Drill_Hole'])
+                if not hole:
+                    self._error(row_num, f"Drill hole {row['Drill_Hole']} not found")
+                    continue
+                drill_hole_id, project_name = hole
+
+                # Extract run number from Core_Run field
+                run_number = int(row['Core_Run'].replace('Run ', ''))
+                core_run_id = self.cache.run(drill_hole_id, run_number)
+                if not core_run_id:
+                    self._error(row_num, f"Core run {row['Core_Run']} not found for drill hole {row['Drill_Hole']}")
+                    continue
+
+                from_depth = float(row['From_Depth'])
+                to_depth = float(row['To_Depth'])
+                rows.append({
+                    'core_run_id': core_run_id,
+                    'from_depth': from_depth,
+                    'to_depth': to_depth,
+                    'interval_length': to_depth - from_depth,
+                    'lithology': row.get('Lithology') or None,
+                    'lithology_code': row.get('Lithology_Code') or None,
+                    'alteration_type': row.get('Alteration') or None,
+                    'mineralization_type': row.get('Mineralization') or None,
+                    'structural_features': row.get('Structure') or None,
+                    'recovery_percentage': _float(row.get('Recovery_Percentage')),
+                    'rqd_contribution': _float(row.get('RQD')) or 0.0,
+                    'comments': row.get('Comments') or None,
+                    'logged_by': _int_or_none(row.get('Logged_By')),
+                    'logged_date': _date(row.get('Logged_Date')) or datetime.now().date()
+                })
+                key = (drill_hole_id, project_name)
+                intervals_per_hole[key] = intervals_per_hole.get(key, 0) + 1
+
+            except Exception as e:
+                self._error(row_num, str(e))
+
+        if rows:
+            db.session.execute(CoreInterval.__table__.insert(), rows)
+        for (drill_hole_id, project_name), count in intervals_per_hole.items():
+            rollups.record_intervals(drill_hole_id, count, project_name=project_name)
+        return len(rows)
+
+    def _insert_drill_holes(self, batch):
+        hole_ids = [row.get('Hole_ID') for _, row in batch]
+        existing = {
+            hole_id for (hole_id,) in
+            db.session.query(DrillHole.hole_id).filter(DrillHole.hole_id.in_(hole_ids))
+        }
+
+        imported = 0
+        for row_num, row in batch:
+            try:
+                if row['Hole_ID'] in existing:
+                    self._error(row_num, f"Drill hole {row['Hole_ID']} already exists")
+                    continue
+
+                drill_hole = DrillHole(
+                    hole_id=row['Hole_ID'],
+                    project_name=row.get('Project') or '',
+                    location_x=_float(row.get('Collar_X')),
+                    location_y=_float(row.get('Collar_Y')),
+                    elevation=_float(row.get('Collar_Z')),
+                    total_depth=_float(row.get('Total_Depth')),
+                    azimuth=_float(row.get('Azimuth')),
+                    dip=_float(row.get('Dip')),
+                    start_date=_date(row.get('Start_Date')),
+                    end_date=_date(row.get('End_Date')),
+                    drilling_company=row.get('Drilling_Company') or None
+                )
+                db.session.add(drill_hole)
+                rollups.record_hole_added(drill_hole)
+                existing.add(drill_hole.hole_id)
+                imported += 1
+
+            except Exception as e:
+                self._error(row_num, str(e))
+
+        return imported
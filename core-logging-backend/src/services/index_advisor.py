@@ -0,0 +1,119 @@
+"""EXPLAIN-based index report for the endpoints' hot queries.
+
+Each endpoint below is requested through the application's test client
+with representative parameters taken from the database, with the response
+and export caches turned off, while a ``QueryCounter`` records the SQL it
+sends. Every distinct SELECT is then run through the backend's EXPLAIN with
+the parameters it was executed with, so the report covers exactly the
+queries the views build. Plans that scan a whole table instead of using an
+index are flagged: ``SCAN <table>`` without an index in SQLite's
+``EXPLAIN QUERY PLAN``, or ``type = ALL`` in MySQL's ``EXPLAIN``. Run it
+with ``flask index-report``.
+"""
+from flask import current_app
+
+from src.models.user import db, DrillHole, CoreRun, CoreTray
+from src.services.data_versions import VERSION_TABLE
+from src.services.query_counter import QueryCounter
+
+# URL templates filled from ``_sample_values``
+ENDPOINTS = [
+    '/api/drill-holes',
+    '/api/drill-holes/{drill_hole_id}',
+    '/api/drill-holes/{drill_hole_id}/summary',
+    '/api/core-runs?drill_hole_id={drill_hole_id}',
+    '/api/core-intervals',
+    '/api/core-intervals?core_run_id={core_run_id}',
+    '/api/core-trays?drill_hole_id={drill_hole_id}',
+    '/api/core-trays/by-barcode/{barcode}',
+    '/api/core-trays/by-rfid/{rfid_tag}',
+    '/api/qaqc-records',
+    '/api/qaqc-records?drill_hole_id={drill_hole_id}&status=fail&record_type=standard',
+    '/api/qaqc-records/statistics',
+    '/api/analytics/summary',
+    '/api/analytics/recovery-trends',
+    '/api/analytics/recovery-by-depth?percentiles=10,50,90',
+    '/api/analytics/lithology-distribution',
+    '/api/analytics/project-summary',
+    '/api/analytics/export-csv?drill_hole_id={drill_hole_id}',
+    '/api/export/csv?drill_hole_id={drill_hole_id}',
+    '/api/export/leapfrog?drill_hole_id={drill_hole_id}',
+    '/api/export/qaqc',
+]
+
+
+def _sample_values():
+    """Ids and keys of existing rows to fill the endpoint templates"""
+    return {
+        'drill_hole_id': db.session.query(db.func.min(DrillHole.id)).scalar() or 1,
+        'core_run_id': db.session.query(db.func.min(CoreRun.id)).scalar() or 1,
+        'barcode': db.session.query(db.func.min(CoreTray.barcode)).scalar() or 'BC-0001',
+        'rfid_tag': db.session.query(db.func.min(CoreTray.rfid_tag)).scalar() or 'RF-0001',
+    }
+
+
+def capture_selects(app, url):
+    """(sql, parameters) of each distinct SELECT a GET of ``url`` executes.
+
+    The ``data_version`` key lookups of conditional GET are left out.
+    """
+    client = app.test_client()
+    with QueryCounter(db.engine) as counter:
+        response = client.get(url)
+        response.get_data()  # streamed bodies run their queries while read
+    selects = {}
+    for statement, parameters in zip(counter.statements, counter.parameters):
+        if statement.lstrip().upper().startswith('SELECT') and f'FROM {VERSION_TABLE}' not in statement:
+            selects.setdefault(statement, parameters)
+    return list(selects.items())
+
+
+def _explain(sql, parameters):
+    """Run EXPLAIN and return (plan lines, full scan tables)"""
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', parameters).all()
+        lines = [row[-1] for row in rows]
+        full_scans = [
+            line.split()[1] for line in lines
+            if line.startswith('SCAN ') and 'INDEX' not in line
+        ]
+        return lines, full_scans
+
+    rows = connection.exec_driver_sql(f'EXPLAIN {sql}', parameters).mappings().all()
+    lines = [
+        f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row.get('Extra') or ''}".strip()
+        for row in rows
+    ]
+    full_scans = [row['table'] for row in rows if row['type'] == 'ALL']
+    return lines, full_scans
+
+
+def index_report():
+    """List of {endpoint, sql, plan, full_scans} for every hot query"""
+    app = current_app._get_current_object()
+    values = _sample_values()
+    saved = {name: app.config.get(name) for name in ('RESPONSE_CACHE_DISABLED', 'EXPORT_CACHE_DISABLED')}
+    app.config.update(dict.fromkeys(saved, True))
+    try:
+        report = []
+        for template in ENDPOINTS:
+            endpoint = f'GET {template.format(**values)}'
+            for sql, parameters in capture_selects(app, template.format(**values)):
+                plan, full_scans = _explain(sql, parameters)
+                report.append({'endpoint': endpoint, 'sql': sql, 'plan': plan, 'full_scans': full_scans})
+        return report
+    finally:
+        app.config.update(saved)
+
+
+def format_report(report):
+    lines = []
+    for entry in report:
+        status = f"FULL SCAN: {', '.join(entry['full_scans'])}" if entry['full_scans'] else 'ok'
+        lines.append(f"{entry['endpoint']} -> {status}")
+        lines.append(f"    {' '.join(entry['sql'].split())[:160]}")
+        lines.extend(f'    {line}' for line in entry['plan'])
+    flagged = sum(1 for entry in report if entry['full_scans'])
+    lines.append(f'{flagged} of {len(report)} queries scan a full table')
+    return '\n'.join(lines)
@@ -0,0 +1,317 @@
+"""Interval consistency checks: overlaps, gaps and depths outside the run.
+
+All intervals of the holes being checked are read with one joined
+interval/run query (no ORDER BY; the database only streams columns) into
+NumPy arrays. The rows are fetched straight from the DBAPI cursor: building
+a SQLAlchemy ``Row`` per interval, and converting those to arrays, costs
+several times more than the query itself. They are then sorted once by (hole, from_depth, id) and swept
+in a single vectorized pass:
+
+* ``reach`` is the deepest ``to_depth`` of the intervals before each one in
+  the same hole, a running maximum computed for every hole at once by
+  lifting each hole's depths into its own disjoint band;
+* an interval starting above ``reach`` overlaps the interval that reaches
+  it, one starting below it leaves a gap;
+* ``out_of_run`` and ``invalid_depths`` compare each interval with its own
+  run and with itself.
+
+Everything is O(n log n) in the sort and linear otherwise, so a project of a
+couple of million intervals is checked in seconds. Depth differences within
+``tolerance`` metres are treated as equal.
+
+The check runs inline on bulk inserts (``check_new_intervals``, new rows
+swept together with the existing intervals of their holes) and project-wide
+as a background ``ValidationJob`` that stores the counts and a capped list
+of issues.
+"""
+import json
+import threading
+
+import numpy as np
+from flask import current_app
+
+from src.models.user import db, DrillHole, CoreRun, CoreInterval, ValidationJob
+
+DEFAULT_TOLERANCE = 0.001
+# Rows fetched from the database cursor per round trip
+FETCH_BATCH_SIZE = 50000
+# Issues kept on the job row and in bulk responses; the counts keep going
+MAX_REPORTED_ISSUES = 1000
+
+ISSUE_TYPES = ('overlap', 'gap', 'out_of_run', 'invalid_depths')
+# Issue types that make a bulk insert with validation=reject skip a row
+REJECTED_TYPES = ('overlap', 'out_of_run', 'invalid_depths')
+
+FIELDS = ('id', 'core_run_id', 'drill_hole_id', 'from_depth', 'to_depth', 'run_from_depth', 'run_to_depth')
+COLUMNS = (CoreInterval.id, CoreInterval.core_run_id, CoreRun.drill_hole_id,
+           CoreInterval.from_depth, CoreInterval.to_depth, CoreRun.from_depth, CoreRun.to_depth)
+INTEGER_FIELDS = ('id', 'core_run_id', 'drill_hole_id')
+
+
+def _columns(matrix):
+    columns = {}
+    for position, name in enumerate(FIELDS):
+        column = matrix[:, position]
+        columns[name] = column.astype(np.int64) if name in INTEGER_FIELDS else column
+    return columns
+
+
+def load_intervals(project_name=None, drill_hole_ids=None, batch_size=FETCH_BATCH_SIZE):
+    """Interval and run depths as a dict of NumPy arrays keyed by ``FIELDS``"""
+    query = db.session.query(*COLUMNS).select_from(CoreInterval).join(
+        CoreRun, CoreInterval.core_run_id == CoreRun.id
+    )
+    if project_name is not None:
+        query = query.join(DrillHole, CoreRun.drill_hole_id == DrillHole.id).filter(
+            DrillHole.project_name == project_name
+        )
+    if drill_hole_ids is not None:
+        query = query.filter(CoreRun.drill_hole_id.in_(drill_hole_ids))
+
+    return _columns(_fetch_matrix(query.statement, batch_size))
+
+
+def _fetch_matrix(statement, batch_size):
+    """Run a select on the session's connection and return its rows as floats"""
+    connection = db.session.connection()
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = [params[name] for name in compiled.positiontup]
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(str(compiled), params)
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=float))
+    finally:
+        cursor.close()
+    return np.concatenate(chunks) if chunks else np.zeros((0, len(FIELDS)))
+
+
+class IntervalSweep:
+    """Sorted sweep over interval columns, finding every issue at once.
+
+    ``positions[type]`` holds row positions (into the input columns) of the
+    intervals with that issue. For overlaps and gaps ``others[type]`` is the
+    position of the earlier interval that reaches deepest and ``reach[type]``
+    the depth it reaches.
+    """
+
+    def __init__(self, columns, tolerance=DEFAULT_TOLERANCE):
+        self.columns = columns
+        self.tolerance = tolerance
+        self.positions = {}
+        self.others = {}
+        self.reach = {}
+        self._sweep()
+
+    def _sweep(self):
+        columns, tolerance = self.columns, self.tolerance
+        holes, from_depth, to_depth = columns['drill_hole_id'], columns['from_depth'], columns['to_depth']
+        count = len(holes)
+
+        self.positions['invalid_depths'] = np.flatnonzero(to_depth - from_depth <= tolerance)
+        self.positions['out_of_run'] = np.flatnonzero(
+            (from_depth < columns['run_from_depth'] - tolerance) | (to_depth > columns['run_to_depth'] + tolerance)
+        )
+        if not count:
+            for kind in ('overlap', 'gap'):
+                self.positions[kind] = self.others[kind] = np.zeros(0, dtype=np.int64)
+                self.reach[kind] = np.zeros(0)
+            return
+
+        order = np.lexsort((columns['id'], from_depth, holes))
+        sorted_holes, sorted_from, sorted_to = holes[order], from_depth[order], to_depth[order]
+        same_hole = np.zeros(count, dtype=bool)
+        same_hole[1:] = sorted_holes[1:] == sorted_holes[:-1]
+
+        # Lift each hole into its own band above the previous hole's, so one
+        # running maximum never carries a depth across holes
+        band = np.cumsum(~same_hole) - 1
+        low = min(sorted_from.min(), sorted_to.min())
+        height = max(sorted_from.max(), sorted_to.max()) - low + 1.0
+        lifted = (sorted_to - low) + band * height
+        running = np.maximum.accumulate(lifted)
+        index = np.arange(count)
+        running_at = np.maximum.accumulate(np.where(lifted == running, index, 0))
+
+        reach = np.full(count, np.nan)
+        reach[1:] = running[:-1] - band[1:] * height + low
+        reach_at = np.zeros(count, dtype=np.int64)
+        reach_at[1:] = running_at[:-1]
+
+        for kind, mask in (('overlap', same_hole & (sorted_from < reach - tolerance)),
+                           ('gap', same_hole & (sorted_from > reach + tolerance))):
+            found = np.flatnonzero(mask)
+            self.positions[kind] = order[found]
+            self.others[kind] = order[reach_at[found]]
+            self.reach[kind] = reach[found]
+
+    def counts(self):
+        return {kind: int(len(self.positions[kind])) for kind in ISSUE_TYPES}
+
+    def involved(self, kinds=ISSUE_TYPES):
+        """Positions of every interval taking part in an issue of ``kinds``"""
+        parts = [self.positions[kind] for kind in kinds]
+        parts += [self.others[kind] for kind in kinds if kind in self.others]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def issues(self, label=None, limit=MAX_REPORTED_ISSUES, of_interest=None):
+        """Issues as dicts ordered by hole and depth.
+
+        ``label(position)`` returns the keys identifying an interval (by
+        default its ``interval_id``). With ``of_interest``, a boolean mask over
+        the positions, only issues involving a marked interval are returned.
+        """
+        columns = self.columns
+        if label is None:
+            ids = columns['id']
+
+            def label(position):
+                return {'interval_id': int(ids[position])}
+
+        kinds, items, positions = [], [], []
+        for code, kind in enumerate(ISSUE_TYPES):
+            keep = np.ones(len(self.positions[kind]), dtype=bool)
+            if of_interest is not None:
+                keep = of_interest[self.positions[kind]]
+                if kind in self.others:
+                    keep |= of_interest[self.others[kind]]
+            found = np.flatnonzero(keep)
+            kinds.append(np.full(len(found), code))
+            items.append(found)
+            positions.append(self.positions[kind][found])
+        kinds, items, positions = np.concatenate(kinds), np.concatenate(items), np.concatenate(positions)
+
+        order = np.lexsort((kinds, columns['from_depth'][positions], columns['drill_hole_id'][positions]))
+        if limit is not None:
+            order = order[:limit]
+        return [self._issue(ISSUE_TYPES[kinds[i]], int(items[i]), label) for i in order.tolist()]
+
+    def _issue(self, kind, item, label):
+        columns = self.columns
+        position = int(self.positions[kind][item])
+        issue = {
+            'type': kind,
+            'drill_hole_id': int(columns['drill_hole_id'][position]),
+            'core_run_id': int(columns['core_run_id'][position]),
+            **label(position),
+            'from_depth': float(columns['from_depth'][position]),
+            'to_depth': float(columns['to_depth'][position]),
+        }
+        if kind in self.others:
+            reach = float(self.reach[kind][item])
+            issue['other'] = label(int(self.others[kind][item]))
+            issue['length'] = round(abs(reach - issue['from_depth']), 4)
+        elif kind == 'out_of_run':
+            issue['run_from_depth'] = float(columns['run_from_depth'][position])
+            issue['run_to_depth'] = float(columns['run_to_depth'][position])
+        return issue
+
+
+def describe_issue(issue):
+    """One-line description of an issue, for per-row bulk errors"""
+    kind = issue['type']
+    if kind == 'overlap':
+        return f"Overlaps another interval by {issue['length']} m at {issue['from_depth']} m"
+    if kind == 'gap':
+        return f"Leaves a gap of {issue['length']} m above {issue['from_depth']} m"
+    if kind == 'out_of_run':
+        return (f"Interval {issue['from_depth']}-{issue['to_depth']} m is outside its core run "
+                f"({issue['run_from_depth']}-{issue['run_to_depth']} m)")
+    return f"to_depth must be greater than from_depth ({issue['from_depth']}-{issue['to_depth']} m)"
+
+
+def check_new_intervals(rows, indexes, runs, tolerance=DEFAULT_TOLERANCE):
+    """Sweep rows about to be bulk inserted together with their holes' intervals.
+
+    ``rows`` are ``interval_values`` dicts, ``indexes`` their positions in the
+    request and ``runs`` maps run id -> (drill_hole_id, from_depth, to_depth).
+    Returns the sweep, the issues involving a new row (new rows labelled by
+    ``index``) and the request indexes of rows involved in a rejectable issue.
+    """
+    hole_ids = sorted({runs[row['core_run_id']][0] for row in rows})
+    existing = load_intervals(drill_hole_ids=hole_ids)
+    first_new = len(existing['id'])
+
+    new = {
+        # New rows sort after existing ones at the same depth
+        'id': np.arange(len(rows), dtype=np.int64) + (int(existing['id'].max()) + 1 if first_new else 0),
+        'core_run_id': np.array([row['core_run_id'] for row in rows], dtype=np.int64),
+        'drill_hole_id': np.array([runs[row['core_run_id']][0] for row in rows], dtype=np.int64),
+        'from_depth': np.array([row['from_depth'] for row in rows], dtype=float),
+        'to_depth': np.array([row['to_depth'] for row in rows], dtype=float),
+        'run_from_depth': np.array([runs[row['core_run_id']][1] for row in rows], dtype=float),
+        'run_to_depth': np.array([runs[row['core_run_id']][2] for row in rows], dtype=float),
+    }
+    columns = {name: np.concatenate((existing[name], new[name])) for name in FIELDS}
+
+    sweep = IntervalSweep(columns, tolerance)
+    of_interest = np.zeros(len(columns['id']), dtype=bool)
+    of_interest[first_new:] = True
+    ids = columns['id']
+
+    def label(position):
+        if position >= first_new:
+            return {'index': indexes[position - first_new]}
+        return {'interval_id': int(ids[position])}
+
+    issues = sweep.issues(label, limit=None, of_interest=of_interest)
+    rejected = {indexes[position - first_new]
+                for position in sweep.involved(REJECTED_TYPES).tolist() if position >= first_new}
+    return sweep, issues, rejected
+
+
+def run_validation(job, tolerance=DEFAULT_TOLERANCE):
+    """Check every interval of the job's project and store the report"""
+    try:
+        columns = load_intervals(project_name=job.project_name)
+        sweep = IntervalSweep(columns, tolerance)
+        counts = sweep.counts()
+        job.interval_count = len(columns['id'])
+        job.hole_count = int(len(np.unique(columns['drill_hole_id'])))
+        job.overlap_count = counts['overlap']
+        job.gap_count = counts['gap']
+        job.out_of_run_count = counts['out_of_run']
+        job.invalid_depth_count = counts['invalid_depths']
+        job.issues = json.dumps(sweep.issues())
+        job.status = 'completed'
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.last_error = str(e)
+        db.session.commit()
+        raise
+    return job
+
+
+def create_validation_job(project_name=None):
+    """Persist a new running validation job"""
+    job = ValidationJob(project_name=project_name, status='running')
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def start_validation(project_name=None, tolerance=DEFAULT_TOLERANCE):
+    """Create a validation job and run it on a background thread"""
+    job = create_validation_job(project_name)
+
+    app = current_app._get_current_object()
+    job_id = job.id
+
+    def work():
+        with app.app_context():
+            try:
+                run_validation(db.session.get(ValidationJob, job_id), tolerance)
+            except Exception:
+                app.logger.exception('Interval validation %s failed', job_id)
+
+    threading.Thread(target=work, name=f'validation-{job_id}', daemon=True).start()
+    return job
@@ -0,0 +1,143 @@
+"""Keyset pagination and column projection for the list endpoints.
+
+List responses stay plain JSON arrays so existing clients keep working. Each
+page is capped by ``limit`` (``DEFAULT_PAGE_LIMIT`` / ``MAX_PAGE_LIMIT``),
+and the opaque cursor for the next page is returned in the ``X-Next-Cursor``
+header and a ``Link: rel="next"`` header. Pages are addressed by the sort key
+of the last row (e.g. ``(from_depth, id)``), never by OFFSET, so deep pages
+cost the same as the first one. ``fields=a,b,c`` selects only those columns
+in SQL. Either way rows are fetched as plain column tuples and turned into
+dicts by the precompiled serializers in ``src.services.serializers``; no ORM
+objects are built for list responses.
+"""
+import base64
+import json
+from datetime import date, datetime
+from urllib.parse import urlencode
+
+from flask import current_app, jsonify, request
+from sqlalchemy import and_, or_
+
+from src.services.serializers import json_response, model_serializer
+
+DEFAULT_PAGE_LIMIT = 1000
+MAX_PAGE_LIMIT = 5000
+
+
+class PaginationError(ValueError):
+    """Raised for a malformed cursor, limit or fields parameter"""
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    payload = json.dumps([_json_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor back into typed sort key values"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise PaginationError('Invalid cursor')
+
+    decoded = []
+    for column, value in zip(columns, values):
+        python_type = column.type.python_type
+        try:
+            if value is not None and python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif value is not None and python_type is date:
+                value = date.fromisoformat(value)
+        except (ValueError, TypeError):
+            raise PaginationError('Invalid cursor')
+        decoded.append(value)
+    return decoded
+
+
+def keyset_condition(order, values):
+    """WHERE clause selecting rows strictly after the cursor position.
+
+    ``order`` is a list of (column, descending) pairs sharing one direction;
+    for two keys this renders ``a >= x AND (a > x OR b > y)`` so the leading
+    column can still drive an index range scan.
+    """
+    (first, descending), rest = order[0], order[1:]
+    after = (lambda column, value: column < value) if descending else (lambda column, value: column > value)
+    if not rest:
+        return after(first, values[0])
+
+    at_or_after = first <= values[0] if descending else first >= values[0]
+    tie_break = keyset_condition(rest, values[1:])
+    return and_(at_or_after, or_(after(first, values[0]), tie_break))
+
+
+def parse_fields(model):
+    """Columns requested with ``fields=``, or None for the full row"""
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+
+    table_columns = model.__table__.columns
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in table_columns]
+    if unknown:
+        raise PaginationError(f'Unknown fields: {", ".join(unknown)}')
+    return names
+
+
+def parse_limit():
+    default = current_app.config.get('DEFAULT_PAGE_LIMIT', DEFAULT_PAGE_LIMIT)
+    maximum = current_app.config.get('MAX_PAGE_LIMIT', MAX_PAGE_LIMIT)
+    limit = request.args.get('limit', default=default, type=int)
+    if limit is None or limit < 1:
+        raise PaginationError('limit must be a positive integer')
+    return min(limit, maximum)
+
+
+def paginated_response(query, model, order):
+    """Run ``query`` one keyset page at a time and build the list response.
+
+    ``order`` is a list of (column, descending) pairs ending in a unique
+    column, e.g. ``[(CoreInterval.from_depth, False), (CoreInterval.id, False)]``.
+    """
+    try:
+        limit = parse_limit()
+        fields = parse_fields(model)
+        order_columns = [column for column, _ in order]
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            query = query.filter(keyset_condition(order, decode_cursor(cursor, order_columns)))
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = query.order_by(*[column.desc() if descending else column for column, descending in order])
+
+    # Select the row's columns (all of them unless ``fields`` was given) plus
+    # the sort key for the cursor, and serialize the tuples directly
+    columns, serialize = model_serializer(model, fields)
+    rows = query.with_entities(*columns, *order_columns).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [serialize(row) for row in rows]
+    last_key = list(rows[-1][len(columns):]) if rows else None
+
+    response = json_response(items)
+    if has_more and last_key is not None:
+        next_cursor = encode_cursor(last_key)
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        next_url = f'{request.base_url}?{urlencode(args)}'
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
@@ -0,0 +1,52 @@
+"""Count the SQL statements an engine executes, for catching N+1 regressions.
+
+    with QueryCounter(db.engine) as counter:
+        client.get('/api/core-intervals')
+    counter.count, counter.statements, counter.parameters
+
+``assert_constant_queries`` runs an endpoint against two data sizes and
+raises ``QueryCountError`` when the statement count grows with the result
+size. ``benchmarks/check_query_counts.py`` applies it to every endpoint.
+"""
+from sqlalchemy import event
+
+
+class QueryCountError(AssertionError):
+    """Raised when an endpoint's statement count depends on result size"""
+
+
+class QueryCounter:
+    """Context manager recording statements sent to the database"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.parameters = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+    def __enter__(self):
+        self.statements = []
+        self.parameters = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def assert_constant_queries(name, small, large):
+    """Compare two QueryCounters taken at different result sizes"""
+    if large.count > small.count:
+        extra = [statement.splitlines()[0][:100] for statement in large.statements[small.count:small.count + 3]]
+        raise QueryCountError(
+            f'{name}: {small.count} statements for the small dataset but {large.count} for the large one; '
+            f'first extra statements: {extra}'
+        )
@@ -0,0 +1,219 @@
+"""Incrementally maintained per-hole and per-project statistics.
+
+The blueprints call these helpers after changing drill holes, core runs or
+core intervals and before committing, so the rollup rows move in the same
+transaction as the data they summarise. Counters are bumped with
+``col = col + :delta`` upserts (``src.services.upsert``) rather than
+read-modify-write, so concurrent workers neither lose increments nor race
+to create a missing row. ``rebuild_statistics`` recomputes both tables from
+scratch for backfills (``flask rebuild-stats``).
+"""
+from datetime import datetime
+
+from sqlalchemy import func
+
+from src.models.user import db, DrillHole, CoreRun, CoreInterval, DrillHoleStats, ProjectStats
+from src.services.upsert import increment
+
+RUN_FIELDS = ('run_count', 'run_length_sum', 'core_length_sum', 'recovery_sum', 'rqd_sum')
+
+
+def run_totals(core_run, sign=1):
+    """Rollup contribution of a single core run"""
+    return {
+        'run_count': sign,
+        'run_length_sum': sign * (core_run.run_length or 0),
+        'core_length_sum': sign * (core_run.core_recovered_length or 0),
+        'recovery_sum': sign * (core_run.total_core_recovery or 0),
+        'rqd_sum': sign * (core_run.rqd_percentage or 0),
+    }
+
+
+def _bump(model, key, deltas):
+    """Add deltas to the row identified by key, creating it if missing (one upsert)"""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    increment(model.__table__, key, deltas, updated_at=datetime.utcnow())
+
+
+def _project_name(drill_hole_id):
+    return db.session.query(DrillHole.project_name).filter(DrillHole.id == drill_hole_id).scalar()
+
+
+def _refresh_recovery_range(drill_hole_id):
+    """Recompute min/max recovery for one hole from its (indexed) runs"""
+    low, high = db.session.query(
+        func.min(CoreRun.total_core_recovery),
+        func.max(CoreRun.total_core_recovery)
+    ).filter(CoreRun.drill_hole_id == drill_hole_id).one()
+
+    db.session.execute(
+        DrillHoleStats.__table__.update()
+        .where(DrillHoleStats.drill_hole_id == drill_hole_id)
+        .values(min_recovery=low, max_recovery=high)
+    )
+
+
+def apply_delta(drill_hole_id, project_name=None, **deltas):
+    """Apply run/interval deltas to a hole and its project"""
+    if project_name is None:
+        project_name = _project_name(drill_hole_id)
+
+    _bump(DrillHoleStats, {'drill_hole_id': drill_hole_id}, deltas)
+    if project_name is not None:
+        _bump(ProjectStats, {'project_name': project_name}, deltas)
+
+    if deltas.get('run_count') or deltas.get('recovery_sum'):
+        _refresh_recovery_range(drill_hole_id)
+
+
+def record_run_added(core_run):
+    """Account for a new core run (already added to the session)"""
+    apply_delta(core_run.drill_hole_id, **run_totals(core_run))
+
+
+def record_run_updated(core_run, previous_totals):
+    """Account for a modified core run given its totals before the change"""
+    current = run_totals(core_run)
+    deltas = {name: current[name] - previous_totals[name] for name in RUN_FIELDS}
+    apply_delta(core_run.drill_hole_id, **deltas)
+
+
+def record_run_removed(core_run, interval_count):
+    """Account for a deleted core run and the intervals cascading with it"""
+    apply_delta(core_run.drill_hole_id, interval_count=-interval_count, **run_totals(core_run, sign=-1))
+
+
+def record_intervals(drill_hole_id, count, project_name=None):
+    """Account for intervals added (positive) or removed (negative) in a hole"""
+    apply_delta(drill_hole_id, project_name=project_name, interval_count=count)
+
+
+def record_hole_added(drill_hole):
+    """Account for a new drill hole in its project"""
+    _bump(ProjectStats, {'project_name': drill_hole.project_name},
+          {'hole_count': 1, 'total_depth_sum': drill_hole.total_depth or 0})
+
+
+def _hole_totals(drill_hole_id):
+    stats = db.session.get(DrillHoleStats, drill_hole_id)
+    if stats is None:
+        return {}
+    return {
+        'run_count': stats.run_count,
+        'interval_count': stats.interval_count,
+        'run_length_sum': stats.run_length_sum,
+        'core_length_sum': stats.core_length_sum,
+        'recovery_sum': stats.recovery_sum,
+        'rqd_sum': stats.rqd_sum,
+    }
+
+
+def record_hole_updated(drill_hole, previous_project_name, previous_total_depth):
+    """Move a hole's totals between projects and track total_depth changes"""
+    total_depth = drill_hole.total_depth or 0
+    previous_total_depth = previous_total_depth or 0
+
+    if drill_hole.project_name == previous_project_name:
+        _bump(ProjectStats, {'project_name': drill_hole.project_name},
+              {'total_depth_sum': total_depth - previous_total_depth})
+        return
+
+    totals = _hole_totals(drill_hole.id)
+    _bump(ProjectStats, {'project_name': previous_project_name}, dict(
+        {name: -value for name, value in totals.items()},
+        hole_count=-1, total_depth_sum=-previous_total_depth
+    ))
+    _bump(ProjectStats, {'project_name': drill_hole.project_name}, dict(
+        totals, hole_count=1, total_depth_sum=total_depth
+    ))
+
+
+def record_hole_removed(drill_hole):
+    """Subtract a deleted hole (and everything cascading with it) from its project"""
+    totals = _hole_totals(drill_hole.id)
+    _bump(ProjectStats, {'project_name': drill_hole.project_name}, dict(
+        {name: -value for name, value in totals.items()},
+        hole_count=-1, total_depth_sum=-(drill_hole.total_depth or 0)
+    ))
+    db.session.execute(
+        DrillHoleStats.__table__.delete().where(DrillHoleStats.drill_hole_id == drill_hole.id)
+    )
+
+
+def rebuild_statistics():
+    """Recompute both rollup tables from the raw tables with INSERT ... SELECT"""
+    hole_stats = DrillHoleStats.__table__
+    project_stats = ProjectStats.__table__
+    now = datetime.utcnow()
+
+    db.session.execute(hole_stats.delete())
+    db.session.execute(project_stats.delete())
+
+    interval_counts = db.session.query(
+        CoreRun.drill_hole_id.label('drill_hole_id'),
+        func.count(CoreInterval.id).label('interval_count')
+    ).join(CoreInterval, CoreInterval.core_run_id == CoreRun.id).group_by(CoreRun.drill_hole_id).subquery()
+
+    run_stats = db.session.query(
+        CoreRun.drill_hole_id.label('drill_hole_id'),
+        func.count(CoreRun.id).label('run_count'),
+        func.sum(CoreRun.run_length).label('run_length_sum'),
+        func.sum(CoreRun.core_recovered_length).label('core_length_sum'),
+        func.sum(CoreRun.total_core_recovery).label('recovery_sum'),
+        func.sum(CoreRun.rqd_percentage).label('rqd_sum'),
+        func.min(CoreRun.total_core_recovery).label('min_recovery'),
+        func.max(CoreRun.total_core_recovery).label('max_recovery')
+    ).group_by(CoreRun.drill_hole_id).subquery()
+
+    hole_select = db.session.query(
+        DrillHole.id,
+        func.coalesce(run_stats.c.run_count, 0),
+        func.coalesce(interval_counts.c.interval_count, 0),
+        func.coalesce(run_stats.c.run_length_sum, 0),
+        func.coalesce(run_stats.c.core_length_sum, 0),
+        func.coalesce(run_stats.c.recovery_sum, 0),
+        func.coalesce(run_stats.c.rqd_sum, 0),
+        run_stats.c.min_recovery,
+        run_stats.c.max_recovery,
+        db.literal(now)
+    ).outerjoin(
+        run_stats, run_stats.c.drill_hole_id == DrillHole.id
+    ).outerjoin(
+        interval_counts, interval_counts.c.drill_hole_id == DrillHole.id
+    )
+
+    db.session.execute(hole_stats.insert().from_select(
+        ['drill_hole_id', 'run_count', 'interval_count', 'run_length_sum', 'core_length_sum',
+         'recovery_sum', 'rqd_sum', 'min_recovery', 'max_recovery', 'updated_at'],
+        hole_select.statement
+    ))
+
+    project_select = db.session.query(
+        DrillHole.project_name,
+        func.count(DrillHole.id),
+        func.coalesce(func.sum(DrillHole.total_depth), 0),
+        func.sum(DrillHoleStats.run_count),
+        func.sum(DrillHoleStats.interval_count),
+        func.sum(DrillHoleStats.run_length_sum),
+        func.sum(DrillHoleStats.core_length_sum),
+        func.sum(DrillHoleStats.recovery_sum),
+        func.sum(DrillHoleStats.rqd_sum),
+        db.literal(now)
+    ).join(
+        DrillHoleStats, DrillHoleStats.drill_hole_id == DrillHole.id
+    ).group_by(DrillHole.project_name)
+
+    db.session.execute(project_stats.insert().from_select(
+        ['project_name', 'hole_count', 'total_depth_sum', 'run_count', 'interval_count',
+         'run_length_sum', 'core_length_sum', 'recovery_sum', 'rqd_sum', 'updated_at'],
+        project_select.statement
+    ))
+
+    db.session.commit()
+    return {
+        'drill_holes': db.session.query(func.count(DrillHoleStats.drill_hole_id)).scalar(),
+        'projects': db.session.query(func.count(ProjectStats.project_name)).scalar(),
+    }
@@ -0,0 +1,71 @@
+"""Schema management, run explicitly rather than at application startup.
+
+``flask migrate`` creates missing tables, then missing indexes and the
+full-text search index over interval descriptions (``src.services.search``);
+``flask check-schema`` reports what is missing and exits non-zero, for
+deploy pipelines and readiness gates. Workers never touch the schema, so
+they start without a database round trip.
+
+``db.create_all()`` only creates missing tables; it never adds indexes to
+tables that already exist. ``apply_indexes`` compares the indexes declared on
+the models with the ones present in the database and creates the missing
+ones (``flask create-indexes``). All of these are idempotent and safe to
+re-run.
+"""
+from sqlalchemy import inspect
+
+from src.models.user import db
+from src.services.search import create_search_index, has_search_index, search_index_name
+
+
+def missing_tables():
+    """Names of model tables absent from the database"""
+    existing_tables = set(inspect(db.engine).get_table_names())
+    return [table.name for table in db.metadata.sorted_tables if table.name not in existing_tables]
+
+
+def missing_indexes():
+    """Indexes declared on the models but absent from existing tables"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue  # create_all() builds new tables with their indexes
+        present = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in present)
+    return missing
+
+
+def apply_indexes():
+    """Create any missing model indexes, returning their names"""
+    created = []
+    for index in missing_indexes():
+        index.create(bind=db.engine, checkfirst=True)
+        created.append(index.name)
+    if created:
+        # Pooled connections may hold statements planned against the old schema
+        db.engine.dispose()
+    return created
+
+
+def check_schema():
+    """Missing tables and indexes, as {'tables': [...], 'indexes': [...]}"""
+    tables = missing_tables()
+    indexes = [index.name for index in missing_indexes()]
+    if search_index_name() and 'core_interval' not in tables and not has_search_index():
+        indexes.append(search_index_name())
+    return {'tables': tables, 'indexes': indexes}
+
+
+def migrate():
+    """Create missing tables, then missing indexes and the full-text index"""
+    tables = missing_tables()
+    if tables:
+        db.create_all()
+    indexes = apply_indexes()
+    search_index = create_search_index()
+    if search_index:
+        indexes.append(search_index)
+    return {'tables': tables, 'indexes': indexes}
@@ -0,0 +1,183 @@
+"""Indexed full-text search over core interval descriptions.
+
+``SEARCH_COLUMNS`` of ``core_interval`` are indexed with the database's own
+full-text engine, created by ``flask migrate`` and reported missing by
+``flask check-schema``:
+
+* SQLite - an external-content FTS5 table (``core_interval_fts``, porter
+  stemming, prefix indexes) over ``core_interval``, kept in sync by
+  insert/update/delete triggers, so ORM writes, bulk inserts, imports and
+  set-based deletes are all covered. Results are ranked by ``bm25`` with
+  the lithology columns weighted above free-text comments.
+* MySQL - a ``FULLTEXT`` index over the same columns, maintained by InnoDB
+  and queried in boolean mode, ranked by ``MATCH ... AGAINST`` relevance.
+
+Free text is reduced to word tokens before it reaches either engine: every
+token must match, and a token ending in ``*`` matches as a prefix. Without
+an index (another database, or before ``flask migrate``) the same terms fall
+back to unranked ``LIKE`` scans, so the endpoint still answers, slowly.
+"""
+import re
+
+from sqlalchemy import and_, column, func, literal_column, or_, table, text
+from sqlalchemy.dialects.mysql import match
+
+from src.models.user import db, CoreRun, CoreInterval
+
+SEARCH_COLUMNS = ('lithology', 'rock_type', 'texture', 'ore_minerals', 'structural_features', 'comments')
+# bm25 weights per column, in SEARCH_COLUMNS order
+COLUMN_WEIGHTS = (4.0, 3.0, 1.5, 2.0, 1.5, 1.0)
+MAX_TERMS = 16
+
+FTS_TABLE = 'core_interval_fts'
+FULLTEXT_INDEX = 'ft_core_interval_text'
+_fts = table(FTS_TABLE, column('rowid'))
+
+_TOKEN = re.compile(r'\w+\*?', re.UNICODE)
+
+_indexed = set()  # database URLs known to have the search index
+
+
+class SearchError(ValueError):
+    """Raised for a query with no searchable terms"""
+
+
+def parse_terms(q):
+    """Word tokens of a free-text query, each optionally ending in ``*``"""
+    terms = _TOKEN.findall(q or '')[:MAX_TERMS]
+    if not terms:
+        raise SearchError('q must contain at least one word')
+    return terms
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _sqlite_ddl():
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join(f'new.{name}' for name in SEARCH_COLUMNS)
+    old_values = ', '.join(f'old.{name}' for name in SEARCH_COLUMNS)
+    delete_old = (f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+                  f"VALUES ('delete', old.id, {old_values});")
+    insert_new = f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({columns}, content='core_interval', "
+        f"content_rowid='id', tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON core_interval BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON core_interval BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columns} ON core_interval "
+        f"BEGIN {delete_old} {insert_new} END",
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ]
+
+
+def search_index_name():
+    """Name of the full-text index for this database, or None if unsupported"""
+    return {'sqlite': FTS_TABLE, 'mysql': FULLTEXT_INDEX}.get(_dialect())
+
+
+def has_search_index():
+    """True if the full-text index exists (positive results are remembered)"""
+    url = str(db.engine.url)
+    if url in _indexed:
+        return True
+    dialect = _dialect()
+    with db.engine.connect() as connection:
+        if dialect == 'sqlite':
+            found = connection.execute(text(
+                "SELECT count(*) FROM sqlite_master WHERE name IN (:table, :insert, :delete, :update)"
+            ), {'table': FTS_TABLE, 'insert': f'{FTS_TABLE}_ai', 'delete': f'{FTS_TABLE}_ad',
+                'update': f'{FTS_TABLE}_au'}).scalar() == 4
+        elif dialect == 'mysql':
+            found = connection.execute(text(
+                "SELECT count(*) FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                "AND table_name = 'core_interval' AND index_name = :name"
+            ), {'name': FULLTEXT_INDEX}).scalar() > 0
+        else:
+            found = False
+    if found:
+        _indexed.add(url)
+    return found
+
+
+def create_search_index():
+    """Create and populate the full-text index if missing, returning its name"""
+    name = search_index_name()
+    if name is None or has_search_index():
+        return None
+    if _dialect() == 'sqlite':
+        statements = _sqlite_ddl()
+    else:
+        statements = [f"ALTER TABLE core_interval ADD FULLTEXT INDEX {FULLTEXT_INDEX} ({', '.join(SEARCH_COLUMNS)})"]
+    with db.engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+    _indexed.add(str(db.engine.url))
+    return name
+
+
+def _fts5_query(terms):
+    # Quote every token so FTS5 operators in user input stay literal
+    return ' '.join(f'"{term.rstrip("*")}"' + ('*' if term.endswith('*') else '') for term in terms)
+
+
+def _boolean_query(terms):
+    return ' '.join(f'+{term}' for term in terms)
+
+
+def _scope(query, drill_hole_id=None, core_run_id=None):
+    """Restrict a search to one hole and/or run"""
+    if drill_hole_id:
+        query = query.join(CoreRun, CoreInterval.core_run_id == CoreRun.id).filter(
+            CoreRun.drill_hole_id == drill_hole_id
+        )
+    if core_run_id:
+        query = query.filter(CoreInterval.core_run_id == core_run_id)
+    return query
+
+
+def _id_bounds(drill_hole_id=None, core_run_id=None):
+    """(min, max) interval id scalar subqueries for a hole/run scope"""
+    query = _scope(db.session.query(CoreInterval.id), drill_hole_id, core_run_id)
+    ids = query.subquery()
+    return (db.session.query(func.min(ids.c.id)).scalar_subquery(),
+            db.session.query(func.max(ids.c.id)).scalar_subquery())
+
+
+def search_query(q, columns, drill_hole_id=None, core_run_id=None):
+    """Select ``columns`` plus a ``score`` for intervals matching ``q``.
+
+    Returns (query, score, ranked): ``score`` orders best matches first when
+    sorted by ``score.desc()``; ``ranked`` is False for the unindexed
+    fallback, whose score is a constant.
+    """
+    terms = parse_terms(q)
+    dialect = _dialect()
+    if has_search_index() and dialect == 'sqlite':
+        fts = literal_column(FTS_TABLE)
+        # bm25 is lower for better matches; negate so every backend sorts descending
+        score = (-func.bm25(fts, *COLUMN_WEIGHTS)).label('score')
+        query = db.session.query(*columns, score).select_from(CoreInterval).join(
+            _fts, _fts.c.rowid == CoreInterval.id
+        ).filter(fts.op('MATCH')(_fts5_query(terms)))
+        if drill_hole_id or core_run_id:
+            # A rowid range lets FTS5 skip the doclists outside the hole or
+            # run instead of matching the whole table and filtering after
+            low, high = _id_bounds(drill_hole_id, core_run_id)
+            query = query.filter(_fts.c.rowid.between(low, high))
+        return _scope(query, drill_hole_id, core_run_id), score, True
+
+    search_columns = [getattr(CoreInterval, name) for name in SEARCH_COLUMNS]
+    if has_search_index() and dialect == 'mysql':
+        relevance = match(*search_columns, against=_boolean_query(terms)).in_boolean_mode()
+        score = relevance.label('score')
+        query = db.session.query(*columns, score).filter(relevance > 0)
+        return _scope(query, drill_hole_id, core_run_id), score, True
+
+    score = literal_column('NULL').label('score')
+    conditions = [
+        or_(*[search_column.ilike(f'%{term.rstrip("*")}%') for search_column in search_columns]) for term in terms
+    ]
+    query = db.session.query(*columns, score).filter(and_(*conditions))
+    return _scope(query, drill_hole_id, core_run_id), score, False
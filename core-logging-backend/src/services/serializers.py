@@ -0,0 +1,81 @@
+"""Precompiled row serializers built from model column metadata.
+
+``model_serializer(CoreInterval)`` returns the table columns to select and a
+function turning a ``Row`` tuple from a column-only query into the same dict
+``CoreInterval.to_dict()`` produces. The function is generated once per
+(model, fields) as straight-line code: positional tuple access, with
+``isoformat()`` only on date/datetime columns, so no ORM object is built and
+no attribute lookups happen per row.
+
+``json_response`` encodes with orjson when it is installed and falls back to
+the standard library encoder otherwise.
+"""
+import decimal
+import json
+from datetime import date, datetime
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+_serializers = {}
+
+
+def _is_temporal(column):
+    try:
+        return issubclass(column.type.python_type, (date, datetime))
+    except NotImplementedError:
+        return False
+
+
+def compile_row_serializer(names, temporal):
+    """Generate ``serialize(row) -> dict`` for rows with the given column order"""
+    items = []
+    for index, (name, is_temporal) in enumerate(zip(names, temporal)):
+        if is_temporal:
+            items.append(f'{name!r}: (row[{index}].isoformat() if row[{index}] is not None else None)')
+        else:
+            items.append(f'{name!r}: row[{index}]')
+    source = 'def serialize(row):\n    return {' + ', '.join(items) + '}\n'
+    namespace = {}
+    exec(compile(source, f'<serializer {",".join(names)}>', 'exec'), namespace)
+    return namespace['serialize']
+
+
+def model_serializer(model, fields=None):
+    """(columns, serialize) for a model, optionally restricted to ``fields``"""
+    key = (model, tuple(fields) if fields else None)
+    if key not in _serializers:
+        table_columns = model.__table__.columns
+        columns = [table_columns[name] for name in fields] if fields else list(table_columns)
+        serialize = compile_row_serializer(
+            [column.name for column in columns],
+            [_is_temporal(column) for column in columns]
+        )
+        _serializers[key] = (columns, serialize)
+    return _serializers[key]
+
+
+def _default(value):
+    # Same fallbacks as Flask's JSON provider
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(payload, sort_keys=False):
+    """Encode JSON with the fastest available backend, returning bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(payload, default=_default, separators=(',', ':'), sort_keys=sort_keys).encode()
+
+
+def json_response(payload, status=200):
+    """Drop-in for ``jsonify`` (same key ordering) using ``dumps``"""
+    body = dumps(payload, sort_keys=current_app.json.sort_keys)
+    return current_app.response_class(body, status=status, mimetype='application/json')
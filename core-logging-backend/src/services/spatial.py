@@ -0,0 +1,260 @@
+"""In-memory spatial index over drill-hole collars.
+
+Collars (``location_x``/``location_y``) are bucketed into a uniform grid of
+square cells. Bounding-box and radius queries only visit the cells they
+overlap; k-nearest queries search outwards ring by ring and stop once the
+next ring is farther away than the k-th hit. The cell size is chosen at a
+full build so that a cell holds a handful of collars on average.
+
+The index lives in each worker process and follows the ``drill_hole`` data
+version. A commit from this worker that changed known holes is applied in
+place (``note_changed``): only those holes are re-read and moved between
+cells. When the version moved for any other reason (another worker, an
+import), the next query re-reads the collar columns and diffs them against
+the index, touching only the cells of holes that changed. Holes without
+coordinates are not indexed.
+"""
+import math
+import threading
+
+import numpy as np
+
+from src.models.user import db, DrillHole
+from src.services.data_versions import current_versions
+
+TABLE = DrillHole.__tablename__
+# Average collars per cell targeted by a full build
+TARGET_PER_CELL = 4
+MAX_NEAREST = 1000
+
+COLUMNS = (DrillHole.id, DrillHole.hole_id, DrillHole.project_name,
+           DrillHole.location_x, DrillHole.location_y, DrillHole.elevation)
+
+
+def _version():
+    return current_versions([TABLE]).get(TABLE, (0,))[0]
+
+
+class CollarIndex:
+    """Uniform grid of collar positions with bbox, radius and kNN queries"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.cell_size = 1.0
+        self.holes = {}  # id -> (hole_id, project_name, x, y, elevation)
+        self.cells = {}  # (i, j) -> set of ids
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def _insert(self, row):
+        hole_id = row[0]
+        self.holes[hole_id] = tuple(row[1:])
+        self.cells.setdefault(self._cell(row[3], row[4]), set()).add(hole_id)
+
+    def _remove(self, hole_id):
+        entry = self.holes.pop(hole_id, None)
+        if entry is None:
+            return
+        cell = self._cell(entry[2], entry[3])
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(hole_id)
+            if not members:
+                del self.cells[cell]
+
+    def _upsert(self, row):
+        if self.holes.get(row[0]) == tuple(row[1:]):
+            return False
+        self._remove(row[0])
+        if row[3] is not None and row[4] is not None:
+            self._insert(row)
+        return True
+
+    def _rows(self, hole_ids=None):
+        query = db.session.query(*COLUMNS)
+        if hole_ids is not None:
+            query = query.filter(DrillHole.id.in_(hole_ids))
+        return query.all()
+
+    def _build(self, rows):
+        located = [row for row in rows if row[3] is not None and row[4] is not None]
+        if len(located) > 1:
+            xs = [row[3] for row in located]
+            ys = [row[4] for row in located]
+            area = max(max(xs) - min(xs), 1.0) * max(max(ys) - min(ys), 1.0)
+            self.cell_size = math.sqrt(area * TARGET_PER_CELL / len(located))
+        self.holes = {}
+        self.cells = {}
+        for row in located:
+            self._insert(row)
+
+    def _sync(self, version):
+        """Diff every collar against the index, rebuilding only on first use"""
+        rows = self._rows()
+        if self.version is None:
+            self._build(rows)
+        else:
+            seen = set()
+            for row in rows:
+                seen.add(row[0])
+                self._upsert(row)
+            for hole_id in set(self.holes) - seen:
+                self._remove(hole_id)
+        self.version = version
+
+    def refresh(self):
+        """Catch up with the ``drill_hole`` data version"""
+        version = _version()
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self._sync(version)
+
+    def note_changed(self, hole_ids):
+        """Apply holes created, updated or deleted by this worker's last commit"""
+        with self.lock:
+            if self.version is None:
+                return
+            version = _version()
+            if version != self.version + 1:
+                return  # other writers committed too; the next query diffs
+            rows = {row[0]: row for row in self._rows(hole_ids)}
+            for hole_id in hole_ids:
+                if hole_id in rows:
+                    self._upsert(rows[hole_id])
+                else:
+                    self._remove(hole_id)
+            self.version = version
+
+    def _candidates(self, min_x, min_y, max_x, max_y):
+        low_i, low_j = self._cell(min_x, min_y)
+        high_i, high_j = self._cell(max_x, max_y)
+        if (high_i - low_i + 1) * (high_j - low_j + 1) > len(self.cells):
+            # Box wider than the populated grid: walk the cells instead
+            cells = (members for (i, j), members in self.cells.items()
+                     if low_i <= i <= high_i and low_j <= j <= high_j)
+        else:
+            cells = (self.cells.get((i, j)) for i in range(low_i, high_i + 1) for j in range(low_j, high_j + 1))
+        ids = [hole_id for members in cells if members for hole_id in members]
+        return self._arrays(ids)
+
+    def _arrays(self, ids):
+        ids = np.array(ids, dtype=np.int64)
+        xs = np.array([self.holes[hole_id][2] for hole_id in ids.tolist()], dtype=float)
+        ys = np.array([self.holes[hole_id][3] for hole_id in ids.tolist()], dtype=float)
+        return ids, xs, ys
+
+    def _project_mask(self, ids, project_name):
+        if not project_name:
+            return np.ones(len(ids), dtype=bool)
+        needle = project_name.lower()
+        return np.array([needle in (self.holes[hole_id][1] or '').lower() for hole_id in ids.tolist()], dtype=bool)
+
+    def _result(self, ids, distances=None):
+        results = []
+        for position, hole_id in enumerate(ids.tolist()):
+            name, project_name, x, y, elevation = self.holes[hole_id]
+            item = {
+                'id': hole_id,
+                'hole_id': name,
+                'project_name': project_name,
+                'location_x': x,
+                'location_y': y,
+                'elevation': elevation,
+            }
+            if distances is not None:
+                item['distance'] = round(float(distances[position]), 4)
+            results.append(item)
+        return results
+
+    def bbox(self, min_x, min_y, max_x, max_y, project_name=None):
+        with self.lock:
+            ids, xs, ys = self._candidates(min_x, min_y, max_x, max_y)
+            mask = (xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y)
+            mask &= self._project_mask(ids, project_name)
+            ids = ids[mask]
+            return self._result(ids[np.argsort(ids, kind='stable')])
+
+    def radius(self, x, y, radius, project_name=None):
+        with self.lock:
+            ids, xs, ys = self._candidates(x - radius, y - radius, x + radius, y + radius)
+            distances = np.hypot(xs - x, ys - y)
+            mask = (distances <= radius) & self._project_mask(ids, project_name)
+            ids, distances = ids[mask], distances[mask]
+            order = np.lexsort((ids, distances))
+            return self._result(ids[order], distances[order])
+
+    def _ring(self, center_i, center_j, ring, bounds):
+        """Ids in the square ring of cells ``ring`` steps from the centre cell"""
+        low_i, high_i, low_j, high_j = bounds
+        ids = []
+        for i in range(max(center_i - ring, low_i), min(center_i + ring, high_i) + 1):
+            if i in (center_i - ring, center_i + ring):
+                columns = range(max(center_j - ring, low_j), min(center_j + ring, high_j) + 1)
+            else:
+                columns = [j for j in (center_j - ring, center_j + ring) if low_j <= j <= high_j]
+            for j in columns:
+                members = self.cells.get((i, j))
+                if members:
+                    ids.extend(members)
+        return ids
+
+    def nearest(self, x, y, k, project_name=None):
+        with self.lock:
+            if not self.cells:
+                return []
+            center_i, center_j = self._cell(x, y)
+            keys = np.array(list(self.cells), dtype=np.int64)
+            low_i, low_j = keys.min(axis=0)
+            high_i, high_j = keys.max(axis=0)
+            bounds = (int(low_i), int(high_i), int(low_j), int(high_j))
+            # Rings that miss the populated cells entirely are skipped
+            first_ring = max(low_i - center_i, center_i - high_i, low_j - center_j, center_j - high_j, 0)
+            last_ring = max(center_i - low_i, high_i - center_i, center_j - low_j, high_j - center_j)
+
+            ids, distances = np.zeros(0, dtype=np.int64), np.zeros(0)
+            for ring in range(int(first_ring), int(last_ring) + 1):
+                ring_ids = self._ring(center_i, center_j, ring, bounds)
+                if ring_ids:
+                    found, xs, ys = self._arrays(ring_ids)
+                    mask = self._project_mask(found, project_name)
+                    ids = np.concatenate((ids, found[mask]))
+                    distances = np.concatenate((distances, np.hypot(xs - x, ys - y)[mask]))
+                # Anything outside rings 0..ring is at least ring cells away
+                if len(ids) >= k and np.partition(distances, k - 1)[k - 1] <= ring * self.cell_size:
+                    break
+
+            order = np.lexsort((ids, distances))[:k]
+            return self._result(ids[order], distances[order])
+
+    def to_dict(self):
+        return {
+            'holes': len(self.holes),
+            'cells': len(self.cells),
+            'cell_size': round(self.cell_size, 4),
+            'version': self.version,
+        }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def collar_index():
+    """The up-to-date collar index for the current database"""
+    key = str(db.engine.url)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = CollarIndex()
+    index.refresh()
+    return index
+
+
+def note_changed(hole_ids):
+    """Tell this worker's index about holes changed by the last commit"""
+    index = _indexes.get(str(db.engine.url))
+    if index is not None:
+        index.note_changed(hole_ids)
@@ -0,0 +1,287 @@
+"""Streaming CSV export pipeline shared by the export endpoints.
+
+Rows are read from a column-only query in server-side batches (``yield_per``)
+and written straight into a generator-backed ``Response``, so memory stays
+flat no matter how many rows an export contains.
+"""
+import csv
+import io
+from collections import namedtuple
+from datetime import datetime
+from functools import partial
+
+from flask import Response, stream_with_context
+
+from src.models.user import db, DrillHole, CoreRun, CoreInterval, QAQCItem
+from src.services.compositing import iter_composite_rows
+from src.services.desurvey import with_midpoint_coordinates
+
+# Rows fetched from the database cursor per round trip
+DEFAULT_BATCH_SIZE = 2000
+# Rows written to the CSV buffer before a chunk is sent to the client
+FLUSH_ROWS = 500
+
+
+def iter_query(query, batch_size=DEFAULT_BATCH_SIZE):
+    """Iterate a query's rows using a server-side cursor read in batches"""
+    return query.yield_per(batch_size)
+
+
+def iter_csv(header, rows, row_formatter=None, flush_rows=FLUSH_ROWS):
+    """Yield CSV text chunks for a header and an iterable of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row_formatter(row) if row_formatter else row)
+        pending += 1
+        if pending >= flush_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    chunk = buffer.getvalue()
+    if chunk:
+        yield chunk
+
+
+class ChunkSink:
+    """Write-only file object collecting bytes until a streaming response drains them"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_filename(prefix, extension='csv'):
+    """Build a timestamped attachment filename"""
+    return f'{prefix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+
+
+# A CSV export ready to run: ``transform`` wraps the row iterator, for steps
+# that work on batches of rows rather than one row at a time
+CsvExport = namedtuple('CsvExport', ['header', 'query', 'filename_prefix', 'row_formatter', 'transform'])
+
+
+def export_rows(export, batch_size=DEFAULT_BATCH_SIZE):
+    """Rows of a ``CsvExport``, read in server-side batches"""
+    rows = iter_query(export.query, batch_size)
+    if export.transform is not None:
+        rows = export.transform(rows)
+    return rows
+
+
+def csv_response(header, query, filename_prefix, row_formatter=None, batch_size=DEFAULT_BATCH_SIZE,
+                 transform=None):
+    """Stream a query as a CSV attachment"""
+    export = CsvExport(header, query, filename_prefix, row_formatter, transform)
+    return rows_csv_response(header, export_rows(export, batch_size), filename_prefix, row_formatter)
+
+
+def export_response(export):
+    """Stream a ``CsvExport`` as a CSV attachment"""
+    return rows_csv_response(export.header, export_rows(export), export.filename_prefix, export.row_formatter)
+
+
+def rows_csv_response(header, rows, filename_prefix, row_formatter=None):
+    """Stream any row iterable as a CSV attachment"""
+    return Response(
+        stream_with_context(iter_csv(header, rows, row_formatter)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={export_filename(filename_prefix)}'}
+    )
+
+
+def interval_export_query(columns, drill_hole_id=None, project_name=None):
+    """Single joined interval/run/hole query ordered by hole and depth"""
+    query = db.session.query(*columns).select_from(CoreInterval).join(
+        CoreRun, CoreInterval.core_run_id == CoreRun.id
+    ).join(
+        DrillHole, CoreRun.drill_hole_id == DrillHole.id
+    )
+
+    if drill_hole_id:
+        query = query.filter(CoreRun.drill_hole_id == drill_hole_id)
+    if project_name:
+        query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
+
+    return query.order_by(CoreRun.drill_hole_id, CoreInterval.from_depth, CoreInterval.id)
+
+
+# Desurveyed interval midpoints appended by ``coordinates=True`` exports
+COORDINATE_HEADERS = ['MID_X', 'MID_Y', 'MID_Z']
+
+
+# Column layouts for the shared export formats. Each list pairs the CSV header
+# with the SQL expression selected for it, so rows can be written as-is.
+INTERVAL_CSV_COLUMNS = [
+    ('Drill_Hole', DrillHole.hole_id),
+    ('Core_Run', CoreRun.run_number),
+    ('From_Depth', CoreInterval.from_depth),
+    ('To_Depth', CoreInterval.to_depth),
+    ('Length', CoreInterval.interval_length),
+    ('Lithology', CoreInterval.lithology),
+    ('Lithology_Code', CoreInterval.lithology_code),
+    ('Alteration', CoreInterval.alteration_type),
+    ('Alteration_Code', CoreInterval.alteration_type),  # Using alteration_type as code
+    ('Mineralization', CoreInterval.mineralization_type),
+    ('Mineralization_Code', CoreInterval.mineralization_type),  # Using mineralization_type as code
+    ('Structure', CoreInterval.structural_features),
+    ('Structure_Code', CoreInterval.structural_features),  # Using structural_features as code
+    ('Recovery_Percentage', CoreInterval.recovery_percentage),
+    ('RQD', CoreInterval.rqd_contribution),
+    ('Comments', CoreInterval.comments),
+    ('Logged_Date', CoreInterval.logged_date),
+    ('Logged_By', CoreInterval.logged_by),
+]
+
+LEAPFROG_COLUMNS = [
+    ('BHID', DrillHole.hole_id),
+    ('FROM', CoreInterval.from_depth),
+    ('TO', CoreInterval.to_depth),
+    ('LITHOLOGY', db.func.coalesce(CoreInterval.lithology_code, CoreInterval.lithology)),
+    ('ALTERATION', CoreInterval.alteration_type),
+    ('MINERALIZATION', CoreInterval.mineralization_type),
+    ('RECOVERY', CoreInterval.recovery_percentage),
+    ('RQD', CoreInterval.rqd_contribution),
+    ('STRUCTURE', CoreInterval.structural_features),
+    ('COMMENTS', CoreInterval.comments),
+]
+
+DRILL_HOLE_CSV_COLUMNS = [
+    ('Hole_ID', DrillHole.hole_id),
+    ('Project', DrillHole.project_name),
+    ('Collar_X', DrillHole.location_x),
+    ('Collar_Y', DrillHole.location_y),
+    ('Collar_Z', DrillHole.elevation),
+    ('Total_Depth', DrillHole.total_depth),
+    ('Azimuth', DrillHole.azimuth),
+    ('Dip', DrillHole.dip),
+    ('Start_Date', DrillHole.start_date),
+    ('End_Date', DrillHole.end_date),
+    ('Drilling_Company', DrillHole.drilling_company),
+]
+
+QAQC_REPORT_COLUMNS = [
+    ('ID', QAQCItem.id),
+    ('Title', QAQCItem.title),
+    ('Description', QAQCItem.description),
+    ('Type', QAQCItem.type),
+    ('Priority', QAQCItem.priority),
+    ('Status', QAQCItem.status),
+    ('Assigned_To', QAQCItem.assigned_to),
+    ('Drill_Hole', QAQCItem.drill_hole),
+    ('Core_Run', QAQCItem.core_run),
+    ('Created_Date', QAQCItem.created_date),
+    ('Due_Date', QAQCItem.due_date),
+    ('Resolved_Date', QAQCItem.resolved_date),
+    ('Comments_Count', db.func.coalesce(QAQCItem.comments_count, 0)),
+]
+
+
+def format_interval_row(row):
+    """Render the run number the way the interval import expects it"""
+    row = list(row)
+    row[1] = f'Run {row[1]}'
+    return row
+
+
+def _interval_export(columns, filename_prefix, drill_hole_id=None, project_name=None, row_formatter=None,
+                     coordinates=False):
+    header = [header for header, _ in columns]
+    selected = [column for _, column in columns]
+    transform = None
+    if coordinates:
+        # Select the hole key last so midpoints can be desurveyed per hole;
+        # the transform drops it again before the row is written
+        from_index = selected.index(CoreInterval.from_depth)
+        to_index = selected.index(CoreInterval.to_depth)
+        hole_index = len(selected)
+        selected.append(CoreRun.drill_hole_id)
+        header += COORDINATE_HEADERS
+        transform = partial(with_midpoint_coordinates, hole_index=hole_index, from_index=from_index,
+                            to_index=to_index)
+
+    query = interval_export_query(selected, drill_hole_id=drill_hole_id, project_name=project_name)
+    return CsvExport(header, query, filename_prefix, row_formatter, transform)
+
+
+def interval_csv_export(drill_hole_id=None, project_name=None, coordinates=False):
+    """The standard interval CSV"""
+    return _interval_export(INTERVAL_CSV_COLUMNS, 'core_intervals', drill_hole_id, project_name,
+                            row_formatter=format_interval_row, coordinates=coordinates)
+
+
+def leapfrog_csv_export(drill_hole_id=None, project_name=None, coordinates=False):
+    """The flat Leapfrog interval CSV"""
+    return _interval_export(LEAPFROG_COLUMNS, 'leapfrog_data', drill_hole_id, project_name,
+                            coordinates=coordinates)
+
+
+def drill_hole_csv_export(project_name=None):
+    """The drill hole collar CSV"""
+    query = db.session.query(*[column for _, column in DRILL_HOLE_CSV_COLUMNS])
+    if project_name:
+        query = query.filter(DrillHole.project_name.ilike(f'%{project_name}%'))
+    query = query.order_by(DrillHole.hole_id)
+    return CsvExport([header for header, _ in DRILL_HOLE_CSV_COLUMNS], query, 'drill_holes', None, None)
+
+
+def qaqc_csv_export():
+    """The QA/QC item report"""
+    query = db.session.query(*[column for _, column in QAQC_REPORT_COLUMNS]).order_by(QAQCItem.id)
+    return CsvExport([header for header, _ in QAQC_REPORT_COLUMNS], query, 'qaqc_report', None, None)
+
+
+def interval_csv_response(drill_hole_id=None, project_name=None, coordinates=False):
+    """Stream the standard interval CSV"""
+    return export_response(interval_csv_export(drill_hole_id, project_name, coordinates))
+
+
+def leapfrog_csv_response(drill_hole_id=None, project_name=None, coordinates=False):
+    """Stream the flat Leapfrog interval CSV"""
+    return export_response(leapfrog_csv_export(drill_hole_id, project_name, coordinates))
+
+
+def drill_hole_csv_response(project_name=None):
+    """Stream the drill hole collar CSV"""
+    return export_response(drill_hole_csv_export(project_name))
+
+
+def qaqc_csv_response():
+    """Stream the QA/QC item report"""
+    return export_response(qaqc_csv_export())
+
+
+COMPOSITE_CSV_HEADER = ['Drill_Hole', 'From_Depth', 'To_Depth', 'Length', 'Logged_Length',
+                        'Recovery_Percentage', 'RQD', 'Fracture_Frequency',
+                        'Lithology_Code', 'Alteration', 'Mineralization']
+
+
+def composite_csv_response(spec, drill_hole_id=None, project_name=None):
+    """Stream length-weighted composites of every selected hole"""
+    rows = iter_composite_rows(spec, drill_hole_id=drill_hole_id, project_name=project_name)
+    return rows_csv_response(COMPOSITE_CSV_HEADER, rows, f'composites_{spec.method}')
@@ -0,0 +1,43 @@
+"""Atomic "add to this counter row, creating it if missing" statements.
+
+An UPDATE followed by an INSERT when no row matched races: two transactions
+touching a key that has no row yet both see ``rowcount == 0`` and both
+insert, so one fails on the primary key (and MySQL may deadlock on the gap
+lock first). ``increment`` issues a single upsert instead,
+``INSERT ... ON CONFLICT DO UPDATE`` on SQLite and PostgreSQL and
+``INSERT ... ON DUPLICATE KEY UPDATE`` on MySQL/MariaDB, which the database
+resolves atomically against concurrent writers.
+"""
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from src.models.user import db
+
+_CONFLICT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+_DUPLICATE_KEY_INSERTS = {'mysql': mysql.insert, 'mariadb': mysql.insert}
+
+
+def increment(table, key, deltas, session=None, **values):
+    """Add ``deltas`` to the row of ``table`` matching ``key`` and set ``values``.
+
+    A missing row is inserted with the key, the deltas as initial counts and
+    the values; other columns take their defaults. Runs on ``session``
+    (default ``db.session``).
+    """
+    session = session or db.session
+    updates = {name: table.c[name] + delta for name, delta in deltas.items()}
+    updates.update(values)
+    dialect = session.get_bind().dialect.name
+
+    if dialect in _CONFLICT_INSERTS:
+        statement = _CONFLICT_INSERTS[dialect](table).values(**key, **deltas, **values)
+        statement = statement.on_conflict_do_update(index_elements=list(key), set_=updates)
+    elif dialect in _DUPLICATE_KEY_INSERTS:
+        statement = _DUPLICATE_KEY_INSERTS[dialect](table).values(**key, **deltas, **values)
+        statement = statement.on_duplicate_key_update(**updates)
+    else:
+        condition = [table.c[name] == value for name, value in key.items()]
+        result = session.execute(table.update().where(*condition).values(**updates))
+        if result.rowcount:
+            return
+        statement = table.insert().values(**key, **deltas, **values)
+    session.execute(statement)
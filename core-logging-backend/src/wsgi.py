@@ -0,0 +1,20 @@
+"""Production entry point for a multi-worker WSGI server.
+
+    gunicorn -c gunicorn.conf.py src.wsgi:app
+
+Settings come from the environment (see ``src.config``); debug mode is off
+unless FLASK_DEBUG is set. DATABASE_URL and SECRET_KEY must be set: the
+development fallbacks are never used here.
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.config import missing_production_settings
+from src.main import create_app
+
+missing = missing_production_settings()
+if missing:
+    raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+
+app = create_app()